@@ -1,17 +1,20 @@
 import os
+import sys
 
 from langchain_core.chat_history import InMemoryChatMessageHistory  # 正确导入对话历史存储类
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import Tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_classic.memory import ConversationBufferMemory
 from langchain_classic.agents import create_openai_tools_agent, AgentExecutor, create_react_agent
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+
 # -------------------------- 1. 基础配置（模型+API）--------------------------
 # 初始化 LLM（兼容 ReAct 框架，需支持函数调用）
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = os.getenv("GPTSAPI_BASE_URL")
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 推荐 gpt-3.5-turbo/gpt-4（支持工具调用）
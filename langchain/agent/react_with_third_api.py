@@ -1,18 +1,23 @@
 import os
+import sys
 
-from langchain_core.chat_history import InMemoryChatMessageHistory  # 正确导入对话历史存储类
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import Tool
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts import MessagesPlaceholder
 from langchain_classic.memory import ConversationBufferMemory
 from langchain_classic.agents import create_openai_tools_agent, AgentExecutor
 from serpapi import GoogleSearch
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.session_store import get_session_store
+from common.llm_factory import get_chat_model
+from common.prompt_cache import get_prompt_cache_usage
+from common.compiled_prompt import CompiledChatPromptTemplate
+
 # -------------------------- 1. 基础配置（模型+API）--------------------------
 # 初始化 LLM（兼容 ReAct 框架，需支持函数调用）
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = os.getenv("GPTSAPI_BASE_URL")
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 推荐 gpt-3.5-turbo/gpt-4（支持工具调用）
@@ -128,7 +133,7 @@ tools = [
 ]
 
 # -------------------------- 3. 构建 ReAct 专属 Prompt（核心引导逻辑）--------------------------
-react_prompt = ChatPromptTemplate.from_messages([
+react_prompt = CompiledChatPromptTemplate.from_messages([
     ("system", """
     你是专业的鲜花店智能助手，严格遵循 ReAct 框架解决用户问题，核心规则如下：
     1. 思考（Reason）：
@@ -161,20 +166,14 @@ react_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # -------------------------- 4. 修复：会话历史存储（支持多会话隔离）--------------------------
-# 存储结构：{session_id: InMemoryChatMessageHistory实例}
-session_store = {}
-
-def get_chat_history(session_id: str = "default") -> InMemoryChatMessageHistory:
-    """返回指定会话的对话历史（正确类型：InMemoryChatMessageHistory）"""
-    if session_id not in session_store:
-        session_store[session_id] = InMemoryChatMessageHistory()
-    return session_store[session_id]
+# LRU 热层 + SQLite 冷层：只在内存中保留最近活跃的会话，历史持久化，重启后可继续对话
+session_store = get_session_store()
 
 # -------------------------- 5. 修复：为当前会话创建独立的记忆实例--------------------------
 # 这里以 "react_agent_demo" 为默认会话ID，如需多会话可动态创建 memory
 current_session_id = "react_agent_demo"
 memory = ConversationBufferMemory(
-    chat_memory=get_chat_history(current_session_id),  # 绑定当前会话的历史
+    chat_memory=session_store.get(current_session_id),  # 绑定当前会话的历史
     memory_key="chat_history",  # 与 Prompt 中 variable_name 对应
     return_messages=True  # 返回 ChatMessage 格式，适配模型
 )
@@ -209,6 +208,7 @@ while True:
     user_input = input("\n用户：")
     if user_input.strip() == "退出":
         print("助手：再见！有任何鲜花相关需求随时回来~")
+        print(f"💾 prompt 缓存：{get_prompt_cache_usage().summary()}")
         break
 
     # 执行 Agent（自动选择内部工具或搜索工具）
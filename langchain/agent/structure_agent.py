@@ -1,9 +1,9 @@
 import os
+import sys
 from typing import List
 
 from langchain_community.tools import NavigateTool, ClickTool, ExtractTextTool, GetElementsTool
 from langchain_community.tools.playwright.base import BaseBrowserTool
-from langchain_openai import ChatOpenAI
 from langchain_core.tools import Tool
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_classic.memory import ConversationBufferMemory
@@ -13,11 +13,14 @@ from langchain_community.tools.playwright.utils import create_async_playwright_b
 from langchain_community.agent_toolkits.playwright import PlayWrightBrowserToolkit
 from playwright.sync_api import sync_playwright
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+
 # -------------------------- 1. 基础配置（模型+API）--------------------------
 # 初始化 LLM（兼容 ReAct 框架，需支持函数调用）
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = os.getenv("GPTSAPI_BASE_URL")
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 推荐 gpt-3.5-turbo/gpt-4（支持工具调用）
@@ -1,19 +1,18 @@
 import os
+import sys
 import time
 from typing import Dict, Any
 
 from langchain_core.callbacks import BaseCallbackHandler, StdOutCallbackHandler
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.chat_history import InMemoryChatMessageHistory
 from langchain_openai import ChatOpenAI
 
-# 1. 会话记忆存储（多用户隔离）
-session_store = {}
-def get_session_history(session_id: str):
-    if session_id not in session_store:
-        session_store[session_id] = InMemoryChatMessageHistory()
-    return session_store[session_id]
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.session_store import get_session_store
+
+# 1. 会话记忆存储（多用户隔离，LRU 热层 + SQLite 冷层）
+session_store = get_session_store()
 
 # 2. 带记忆的 Prompt 模板
 memory_prompt = ChatPromptTemplate.from_messages([
@@ -58,7 +57,7 @@ llm_with_monitor = ChatOpenAI(
 memory_chain = memory_prompt | llm_with_monitor  # 绑定性能监控回调
 chain_with_history = RunnableWithMessageHistory(
     runnable=memory_chain,
-    get_session_history=get_session_history,
+    get_session_history=session_store,
     input_messages_key="input",
     history_messages_key="chat_history"
 )
@@ -0,0 +1,235 @@
+"""
+批量生成鲜花营销素材（目录刷新用）
+
+parallel_chain.py 每种鲜花要调用 4 次 LLM（花语/卖点/场景/标签），5000 种鲜花就是 20000 次调用。
+批量模式的做法：
+1. 一个结构化输出 prompt 同时生成一种鲜花的全部 4 项内容，并且一次打包 ITEMS_PER_PROMPT 种鲜花；
+2. 各批次通过 abatch_as_completed 并发执行（max_concurrency 限制同时在途的批次数），
+   完成一批就追加写入 JSONL 检查点，任务中断后重新运行会跳过已完成的鲜花；
+3. 每批结果逐项校验：输出被截断（达到 max_tokens）或个别项不合规时，保留已完整生成的合规项，
+   只有漏掉/写错的鲜花在下一轮拆成更小的批次重试，最多 MAX_ROUNDS 轮，剩余的记为失败，任务时间有上限；
+4. max_tokens 按每轮的批次大小设置：单项素材的实测 token 数（各字段取长度上限）× 余量系数 × 每批项数，不贴着上限跑。
+
+5000 种鲜花、每批 10 种：20000 次调用 → 约 500 次调用。
+
+用法：
+    python chain/batch_marketing.py [鲜花清单.csv|.txt] [检查点.jsonl]
+    （CSV 取 flower 列，TXT 每行一种；默认使用 parser/flowers_with_descriptions.csv）
+"""
+import asyncio
+import csv
+import json
+import os
+import sys
+import time
+from typing import Dict, List
+
+from dotenv import load_dotenv
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, Field, ValidationError
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.token_counter import count_tokens
+
+# 加载环境变量
+load_dotenv()
+api_key = os.getenv("GPTSAPI_API_KEY")
+base_url = os.getenv("GPTSAPI_BASE_URL")
+
+# 批量参数（可通过环境变量覆盖）
+ITEMS_PER_PROMPT = int(os.getenv("BATCH_ITEMS_PER_PROMPT", "10"))  # 受模型最大输出长度限制
+MAX_CONCURRENCY = int(os.getenv("BATCH_MAX_CONCURRENCY", "8"))
+MAX_ROUNDS = int(os.getenv("BATCH_MAX_ROUNDS", "3"))
+OUTPUT_HEADROOM = float(os.getenv("BATCH_OUTPUT_HEADROOM", "1.5"))  # max_tokens 相对实测单项 token 数的余量系数
+MODEL_MAX_OUTPUT_TOKENS = 4096  # gpt-3.5-turbo 单次输出上限
+DEFAULT_CATALOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "parser",
+                               "flowers_with_descriptions.csv")
+DEFAULT_CHECKPOINT = "marketing_checkpoint.jsonl"
+
+
+# ---------------------- 1. 结构化输出：一次返回多种鲜花的全部素材 ----------------------
+class FlowerMarketing(BaseModel):
+    """单种鲜花的营销素材（对应 parallel_chain.py 中的 4 个并行任务）"""
+    flower_type: str = Field(description="鲜花类型，与输入清单中的名称完全一致")
+    flower_language: str = Field(description="核心花语，1句话概括（≤30字），符合大众认知")
+    selling_points: List[str] = Field(description="3个营销卖点（每点≤15字），突出差异化优势")
+    applicable_scenes: List[str] = Field(description="3个适用场景（每点≤10字），覆盖送礼/自用/装饰")
+    hashtags: List[str] = Field(description="3-5个话题标签，格式为#XXX，贴合鲜花营销和年轻用户喜好")
+
+
+class FlowerMarketingBatch(BaseModel):
+    items: List[FlowerMarketing] = Field(description="输入清单中每种鲜花各一项，顺序与输入一致")
+
+
+parser = PydanticOutputParser(pydantic_object=FlowerMarketingBatch)
+
+# 单项素材的 token 数：各字段按描述中的长度上限填满后实测（JSON 键名、引号、标点都计算在内）
+_LONGEST_ITEM = FlowerMarketing(
+    flower_type="花" * 5,
+    flower_language="花" * 30,
+    selling_points=["花" * 15] * 3,
+    applicable_scenes=["花" * 10] * 3,
+    hashtags=["#" + "花" * 6] * 5,
+)
+TOKENS_PER_ITEM = count_tokens(json.dumps(_LONGEST_ITEM.model_dump(), ensure_ascii=False, indent=2))
+
+
+def max_output_tokens(items_per_prompt: int) -> int:
+    """一次调用的 max_tokens：实测单项 token 数 × 余量系数 × 每批项数（不超过模型输出上限）"""
+    return min(int(TOKENS_PER_ITEM * OUTPUT_HEADROOM * items_per_prompt) + 50, MODEL_MAX_OUTPUT_TOKENS)
+
+
+prompt = ChatPromptTemplate.from_messages([
+    ("system", """
+    你是专业的鲜花营销文案撰写员，为清单中的每一种鲜花分别生成营销素材，严格按照以下格式要求输出：
+    {format_instructions}
+    仅输出 JSON，不要添加任何额外内容。
+    """),
+    ("user", "鲜花清单（共 {count} 种）：\n{flower_list}")
+]).partial(format_instructions=parser.get_format_instructions())
+
+try:
+    llm = get_chat_model(
+        api_key=api_key,
+        base_url=base_url,
+        model="gpt-3.5-turbo",
+        temperature=0.6,
+        timeout=60
+    )
+except Exception as e:
+    raise RuntimeError(f"模型初始化失败：{str(e)}") from e
+
+
+def parse_batch(message: BaseMessage) -> List[FlowerMarketing]:
+    """
+    逐项解析一批结果，返回完整且合规的项
+    输出被截断时按部分 JSON 解析，丢弃最后一项（可能只生成了一半）；不合规的单项跳过，由下一轮重试
+    """
+    text = message.content
+    start = text.find("{")
+    if start < 0:
+        return []
+    try:
+        data, _ = json.JSONDecoder().raw_decode(text[start:])
+        complete = True
+    except ValueError:
+        data, complete = parse_partial_json(text[start:]), False
+    items = data.get("items") if isinstance(data, dict) else None
+    if not isinstance(items, list):
+        return []
+    if not complete:
+        items = items[:-1]
+    parsed = []
+    for item in items:
+        try:
+            parsed.append(FlowerMarketing.model_validate(item))
+        except ValidationError:
+            continue
+    return parsed
+
+
+def build_batch_chain(items_per_prompt: int):
+    """每批 items_per_prompt 种鲜花的生成链：max_tokens 按批次大小设置"""
+    return prompt | llm.bind(max_tokens=max_output_tokens(items_per_prompt)) | parse_batch
+
+
+def to_prompt_input(flowers: List[str]) -> dict:
+    return {"count": len(flowers), "flower_list": "\n".join(f"{i}. {name}" for i, name in enumerate(flowers, 1))}
+
+
+# ---------------------- 2. 检查点（JSONL，每行一种已完成的鲜花） ----------------------
+def load_checkpoint(path: str) -> Dict[str, dict]:
+    done = {}
+    if os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue  # 上次中断时写了一半的行
+                done[record["flower_type"]] = record
+    return done
+
+
+def load_catalog(path: str) -> List[str]:
+    with open(path, encoding="utf-8-sig") as f:
+        if path.endswith(".csv"):
+            flowers = [row["flower"].strip() for row in csv.DictReader(f)]
+        else:
+            flowers = [line.strip() for line in f]
+    return list(dict.fromkeys(name for name in flowers if name))  # 去重并保持顺序
+
+
+# ---------------------- 3. 批量执行 ----------------------
+async def generate_catalog(flowers: List[str], checkpoint_path: str = DEFAULT_CHECKPOINT,
+                           items_per_prompt: int = ITEMS_PER_PROMPT, max_concurrency: int = MAX_CONCURRENCY,
+                           max_rounds: int = MAX_ROUNDS) -> dict:
+    """
+    批量生成营销素材，结果逐批写入检查点
+    :param flowers: 鲜花类型清单
+    :param checkpoint_path: JSONL 检查点文件，已存在时跳过其中已完成的鲜花
+    :param items_per_prompt: 每次调用打包的鲜花数
+    :param max_concurrency: 同时在途的调用数
+    :param max_rounds: 最多执行的轮数（每轮重试上一轮遗漏的鲜花，批次减半）
+    :return: 统计 {"total", "skipped", "generated", "failed", "calls", "seconds"}
+    """
+    started = time.perf_counter()
+    done = load_checkpoint(checkpoint_path)
+    pending = [name for name in flowers if name not in done]
+    stats = {"total": len(flowers), "skipped": len(flowers) - len(pending), "generated": 0, "failed": [],
+             "calls": 0, "seconds": 0.0}
+
+    with open(checkpoint_path, "a", encoding="utf-8") as checkpoint:
+        for round_index in range(max_rounds):
+            if not pending:
+                break
+            size = max(items_per_prompt >> round_index, 1)
+            batches = [pending[i:i + size] for i in range(0, len(pending), size)]
+            print(f"🔁 第 {round_index + 1} 轮：{len(pending)} 种鲜花，{len(batches)} 次调用（每批 {size} 种）")
+            stats["calls"] += len(batches)
+            missing = []
+            async for index, result in build_batch_chain(size).abatch_as_completed(
+                    [to_prompt_input(batch) for batch in batches],
+                    config={"max_concurrency": max_concurrency},
+                    return_exceptions=True):
+                batch = batches[index]
+                if isinstance(result, Exception):
+                    print(f"⚠️  批次 {index + 1} 失败：{str(result)[:80]}")
+                    missing.extend(batch)
+                    continue
+                wanted = set(batch)
+                for item in result:
+                    if item.flower_type in wanted:
+                        wanted.discard(item.flower_type)
+                        checkpoint.write(json.dumps(item.model_dump(), ensure_ascii=False) + "\n")
+                        stats["generated"] += 1
+                checkpoint.flush()
+                missing.extend(name for name in batch if name in wanted)  # 模型漏掉或改写了名称的鲜花
+            pending = missing
+
+    stats["failed"] = pending
+    stats["seconds"] = time.perf_counter() - started
+    return stats
+
+
+if __name__ == "__main__":
+    catalog_path = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_CATALOG
+    checkpoint_path = sys.argv[2] if len(sys.argv) > 2 else DEFAULT_CHECKPOINT
+    try:
+        flowers = load_catalog(catalog_path)
+        print(f"🌸 共 {len(flowers)} 种鲜花，逐个生成需 {len(flowers) * 4} 次调用")
+        stats = asyncio.run(generate_catalog(flowers, checkpoint_path))
+        print("=" * 60)
+        print(f"✅ 新生成 {stats['generated']} 种，跳过已完成 {stats['skipped']} 种，"
+              f"调用 {stats['calls']} 次，耗时 {stats['seconds']:.1f}s")
+        if stats["failed"]:
+            print(f"❌ 未完成 {len(stats['failed'])} 种（重新运行即可续跑）：{'、'.join(stats['failed'][:20])}")
+        print(f"📄 结果已写入：{checkpoint_path}")
+    except KeyboardInterrupt:
+        print(f"\n⏸️ 已中断，已完成的结果保存在 {checkpoint_path}，重新运行即可续跑")
+    except Exception as e:
+        print(f"❌ 批量生成失败：{str(e)}")
@@ -1,12 +1,15 @@
 import os
+import sys
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.runnables import RunnableSequence  # Chain 核心类
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -32,7 +35,7 @@ prompt = ChatPromptTemplate.from_messages([
 
 # 初始化模型
 try:
-    model = ChatOpenAI(
+    model = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
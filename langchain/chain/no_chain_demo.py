@@ -1,10 +1,13 @@
 import os
+import sys
 import json
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field, ValidationError
-from langchain_openai import ChatOpenAI
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -31,7 +34,7 @@ def get_flower_language_no_chain(flower_type: str) -> FlowerLanguage:
 
     # 步骤2：手动初始化模型
     try:
-        model = ChatOpenAI(
+        model = get_chat_model(
             api_key=api_key,
             base_url=base_url,
             model="gpt-3.5-turbo",
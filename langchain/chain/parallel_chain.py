@@ -1,11 +1,16 @@
+import asyncio
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableParallel
 from langchain_core.output_parsers import StrOutputParser
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.parallel_stream import astream_parallel
+
 # 加载环境变量（GPTSAPI 代理配置）
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -13,7 +18,7 @@ base_url = os.getenv("GPTSAPI_BASE_URL")
 
 # 初始化大模型（所有并行任务共用一个模型，也可单独配置）
 try:
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -61,13 +66,35 @@ task_hashtags = (
 )
 
 # ---------------------- 2. 包装并行流程（核心：RunnableParallel） ----------------------
-# 用字典形式定义并行任务，key 为任务名，value 为任务流程
-parallel_chain = RunnableParallel(
-    核心花语=task_flower_language,
-    营销卖点=task_selling_points,
-    适用场景=task_applicable_scenes,
-    话题标签=task_hashtags
-)
+# 用字典形式定义并行任务，key 为任务名，value 为任务流程（流式版本直接复用这个字典）
+marketing_tasks = {
+    "核心花语": task_flower_language,
+    "营销卖点": task_selling_points,
+    "适用场景": task_applicable_scenes,
+    "话题标签": task_hashtags
+}
+parallel_chain = RunnableParallel(marketing_tasks)
+
+# 流式版本中单个任务的超时（秒）：超时的任务不再等待，文案中对应段落显示占位提示
+SECTION_TIMEOUT = float(os.getenv("MARKETING_SECTION_TIMEOUT", "10"))
+# 测试调用的输出方式：section=任务完成即输出该段；token=各任务的 token 交错输出；off=等全部完成后一次输出
+STREAM_MODE = os.getenv("MARKETING_STREAM_MODE", "section")
+SECTION_PLACEHOLDER = "（生成超时，请稍后重试）"
+
+
+def format_full_copy(flower_type: str, results: dict) -> str:
+    """将各任务结果拼接成完整营销文案，缺失（超时/失败）的段落用占位提示代替"""
+    sections = {key: results.get(key) or SECTION_PLACEHOLDER for key in marketing_tasks}
+    full_copy = f"""
+🌸 {flower_type} 营销文案
+【核心花语】：{sections['核心花语']}
+【营销卖点】：
+{sections['营销卖点']}
+【适用场景】：
+{sections['适用场景']}
+【话题标签】：{sections['话题标签']}
+        """
+    return full_copy.strip()
 
 
 # ---------------------- 3. 执行并行流程 + 结果合并 ----------------------
@@ -82,21 +109,10 @@ def generate_flower_marketing_materials(flower_type: str) -> dict:
         print(f"🔍 正在并行生成{flower_type}的营销素材...")
         results = parallel_chain.invoke({"flower_type": flower_type})
 
-        # （可选）将并行结果拼接成完整营销文案
-        full_copy = f"""
-🌸 {flower_type} 营销文案
-【核心花语】：{results['核心花语']}
-【营销卖点】：
-{results['营销卖点']}
-【适用场景】：
-{results['适用场景']}
-【话题标签】：{results['话题标签']}
-        """
-
         # 返回原始并行结果 + 拼接后的完整文案
         return {
             "原始并行结果": results,
-            "完整营销文案": full_copy.strip()
+            "完整营销文案": format_full_copy(flower_type, results)
         }
     except OpenAIError as e:
         raise RuntimeError(f"API 调用失败：{str(e)}") from e
@@ -104,28 +120,72 @@ def generate_flower_marketing_materials(flower_type: str) -> dict:
         raise RuntimeError(f"并行流程执行失败：{str(e)}") from e
 
 
+# ---------------------- 4. 流式版本：哪个任务先完成就先输出哪段 ----------------------
+async def astream_flower_marketing_materials(flower_type: str, stream_tokens: bool = False,
+                                             timeout: float = SECTION_TIMEOUT):
+    """
+    流式生成鲜花营销素材，界面等待时间不再等于最慢的任务
+    :param flower_type: 鲜花类型（如"绣球花"）
+    :param stream_tokens: True 时交错输出各任务的 token（事件带任务名），False 时按任务完成顺序输出整段
+    :param timeout: 单个任务的超时（秒），超时的任务被取消，不拖住其他任务
+    :return: 异步迭代器，产出 {"key", "type", "content"}（type 为 token/done/timeout/error），
+             最后产出 {"key": "完整营销文案", "type": "summary", "content": 文案, "results": 各任务结果}
+    """
+    results = {}
+    async for event in astream_parallel(marketing_tasks, {"flower_type": flower_type},
+                                        stream_tokens=stream_tokens, timeout=timeout):
+        if event["type"] == "done":
+            results[event["key"]] = event["content"]
+        yield event
+    yield {"key": "完整营销文案", "type": "summary", "content": format_full_copy(flower_type, results),
+           "results": results}
+
+
+async def print_streaming_materials(flower_type: str, stream_tokens: bool):
+    """测试用：边生成边打印"""
+    print(f"🔍 正在并行生成{flower_type}的营销素材（流式输出）...")
+    async for event in astream_flower_marketing_materials(flower_type, stream_tokens=stream_tokens):
+        if event["type"] == "token":
+            print(f"[{event['key']}] {event['content']}", flush=True)
+        elif event["type"] == "done" and not stream_tokens:
+            print(f"\n✅ {event['key']}：\n{event['content']}")
+        elif event["type"] == "done":
+            print(f"\n✅ {event['key']} 已完成")
+        elif event["type"] == "timeout":
+            print(f"\n⏱️ {event['key']} 超时（{SECTION_TIMEOUT:.0f}s），已跳过")
+        elif event["type"] == "error":
+            print(f"\n❌ {event['key']} 生成失败：{str(event['error'])}")
+        else:
+            print("\n\n【完整营销文案】")
+            print("-" * 50)
+            print(event["content"])
+
+
 # ---------------------- 测试调用 ----------------------
 if __name__ == "__main__":
     flower_type = "绣球花"
     try:
-        marketing_materials = generate_flower_marketing_materials(flower_type)
-
-        # 打印结果
-        print("=" * 80)
-        print(f"🌹 {flower_type} 营销素材（并行流程生成）")
-        print("=" * 80)
-
-        # 1. 打印原始并行结果（分任务展示）
-        print("\n【原始并行结果】")
-        print("-" * 50)
-        for task_name, result in marketing_materials["原始并行结果"].items():
-            print(f"\n{task_name}：")
-            print(result)
-
-        # 2. 打印拼接后的完整营销文案
-        print("\n\n【完整营销文案】")
-        print("-" * 50)
-        print(marketing_materials["完整营销文案"])
+        if STREAM_MODE != "off":
+            asyncio.run(print_streaming_materials(flower_type, stream_tokens=STREAM_MODE == "token"))
+        else:
+            marketing_materials = generate_flower_marketing_materials(flower_type)
+
+            # 打印结果
+            print("=" * 80)
+            print(f"🌹 {flower_type} 营销素材（并行流程生成）")
+            print("=" * 80)
+
+            # 1. 打印原始并行结果（分任务展示）
+            print("\n【原始并行结果】")
+            print("-" * 50)
+            for task_name, result in marketing_materials["原始并行结果"].items():
+                print(f"\n{task_name}：")
+                print(result)
+
+            # 2. 打印拼接后的完整营销文案
+            print("\n\n【完整营销文案】")
+            print("-" * 50)
+            print(marketing_materials["完整营销文案"])
 
     except Exception as e:
         print(f"❌ 错误：{str(e)}")
\ No newline at end of file
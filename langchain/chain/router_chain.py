@@ -1,11 +1,15 @@
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableBranch, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.flower_routes import normalize_query_type, build_route_chain, describe_route
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -13,7 +17,7 @@ base_url = os.getenv("GPTSAPI_BASE_URL")
 
 # 初始化统一模型（也可给分类器/不同ChatBot配置不同temperature）
 try:
-    model = ChatOpenAI(
+    model = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -36,7 +40,11 @@ classifier_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # 分类 Chain：输出"养护"或"装饰"字符串
-classifier_chain = classifier_prompt | model | StrOutputParser()
+classifier_chain = classifier_prompt | model | StrOutputParser() | normalize_query_type
+
+# ---------------------- 1.1 本地向量路由（默认）：置信度不足时才调用上面的 LLM 分类器 ----------------------
+# ROUTER_MODE=llm 时每个问题都用 LLM 分类（原行为），示例问题与阈值见 common/flower_routes.py
+route_chain = build_route_chain(classifier_chain)
 
 # ---------------------- 2. ChatBot A：鲜花养护专家（对应养护类问题） ----------------------
 chatbot_a_prompt = ChatPromptTemplate.from_messages([
@@ -70,18 +78,23 @@ chatbot_b_chain = chatbot_b_prompt | model | StrOutputParser()
 
 # ---------------------- 4. 条件分支 Chain：根据分类路由到对应ChatBot ----------------------
 # 核心：RunnableBranch 实现条件判断，按分类结果执行不同Chain
+# 输出 {"user_query", "route", "query_type", "answer"}：分类结果随回复一起返回，调用方无需再单独调用分类器
 full_chatbot_chain = (
         RunnablePassthrough.assign(
-            # 第一步：先执行分类，将结果存入"query_type"字段
-            query_type=classifier_chain
+            # 第一步：先执行分类，路由结果（类别、置信度、来源）存入"route"字段，类别存入"query_type"字段
+            route=route_chain
         )
-        | RunnableBranch(
-    # 分支1：如果是"养护"，执行ChatBot A
-    (lambda x: x["query_type"] == "养护", chatbot_a_chain),
-    # 分支2：如果是"装饰"，执行ChatBot B
-    (lambda x: x["query_type"] == "装饰", chatbot_b_chain),
-    # 默认分支：兜底执行ChatBot A（防止分类失败）
-    chatbot_a_chain
+        | RunnablePassthrough.assign(query_type=lambda x: x["route"]["label"])
+        | RunnablePassthrough.assign(
+    # 第二步：按分类结果执行对应ChatBot，回复存入"answer"字段
+    answer=RunnableBranch(
+        # 分支1：如果是"养护"，执行ChatBot A
+        (lambda x: x["query_type"] == "养护", chatbot_a_chain),
+        # 分支2：如果是"装饰"，执行ChatBot B
+        (lambda x: x["query_type"] == "装饰", chatbot_b_chain),
+        # 默认分支：兜底执行ChatBot A（防止分类失败）
+        chatbot_a_chain
+    )
 )
 )
 
@@ -94,18 +107,16 @@ def flower_chatbot(user_query: str) -> dict:
     :return: 包含问题分类、对应ChatBot、回复内容的字典
     """
     try:
-        # 执行完整Chain
+        # 执行完整Chain（一次调用同时得到分类结果和回复）
         response = full_chatbot_chain.invoke({"user_query": user_query})
-
-        # 单独获取分类结果（用于展示）
-        query_type = classifier_chain.invoke({"user_query": user_query}).strip()
+        query_type = response["query_type"]
         chatbot_name = "ChatBot A（养护专家）" if query_type == "养护" else "ChatBot B（装饰专家）"
 
         return {
             "用户问题": user_query,
-            "问题分类": query_type,
+            "问题分类": describe_route(response["route"]),
             "执行ChatBot": chatbot_name,
-            "回复内容": response.strip()
+            "回复内容": response["answer"].strip()
         }
     except OpenAIError as e:
         raise RuntimeError(f"API 调用失败：{str(e)}") from e
@@ -1,11 +1,17 @@
+import asyncio
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnableBranch, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model, awarm_up
+from common.flower_routes import normalize_query_type, build_route_chain, describe_route
+from common.speculative_router import SpeculativeRouter
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -13,7 +19,7 @@ base_url = os.getenv("GPTSAPI_BASE_URL")
 
 # 初始化模型
 try:
-    model = ChatOpenAI(
+    model = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -33,7 +39,12 @@ classifier_prompt = ChatPromptTemplate.from_messages([
     """),
     ("user", "用户问题：{user_query}")
 ])
-classifier_chain = classifier_prompt | model | StrOutputParser()
+
+classifier_chain = classifier_prompt | model | StrOutputParser() | normalize_query_type
+
+# ---------------------- 1.1 本地向量路由（默认）：置信度不足时才调用上面的 LLM 分类器 ----------------------
+# ROUTER_MODE=llm 时每个问题都用 LLM 分类（原行为），示例问题与阈值见 common/flower_routes.py
+route_chain = build_route_chain(classifier_chain)
 
 # ---------------------- 2. ChatBot A（养护专家） ----------------------
 chatbot_a_prompt = ChatPromptTemplate.from_messages([
@@ -62,18 +73,49 @@ chatbot_b_prompt = ChatPromptTemplate.from_messages([
 chatbot_b_chain = chatbot_b_prompt | model | StrOutputParser()
 
 # ---------------------- 4. 条件分支 Chain ----------------------
+# 输出 {"user_query", "route", "query_type", "answer"}：路由结果与专家回复一起返回
 full_chatbot_chain = (
-        RunnablePassthrough.assign(query_type=classifier_chain)
-        | RunnableBranch(
+        RunnablePassthrough.assign(route=route_chain)
+        | RunnablePassthrough.assign(query_type=lambda x: x["route"]["label"])
+        | RunnablePassthrough.assign(answer=RunnableBranch(
     (lambda x: x["query_type"] == "养护", chatbot_a_chain),
     (lambda x: x["query_type"] == "装饰", chatbot_b_chain),
     chatbot_a_chain  # 兜底
+))
 )
+
+# ---------------------- 4.1 投机并行路由（可选）：分类的同时启动两个专家链，只输出胜出分支 ----------------------
+# SPECULATIVE_ROUTING=1 时启用：省去串行等待分类的时间，代价是落选分支消耗的 token（见运行后打印的统计）
+SPECULATIVE_ROUTING = os.getenv("SPECULATIVE_ROUTING", "0") == "1"
+speculative_router = SpeculativeRouter(
+    route_chain,
+    {"养护": chatbot_a_chain, "装饰": chatbot_b_chain},
+    default_label="养护"
 )
 
 
+async def speculative_answer(user_query: str):
+    """投机模式：路由结果出来后立即打印，专家回复边生成边输出"""
+    async for event in speculative_router.astream({"user_query": user_query}):
+        if "route" in event:
+            route = event["route"]
+            chatbot_name = "ChatBot A（养护专家）" if route["label"] == "养护" else "ChatBot B（装饰专家）"
+            print("\n" + "-" * 60)
+            print(f"📋 问题分类：{describe_route(route)}")
+            print(f"🤖 回复专家：{chatbot_name}")
+            print("💬 回复内容：")
+        else:
+            print(event["answer"], end="", flush=True)
+    print("\n" + "-" * 60)
+    stats = speculative_router.stats
+    print(f"⚡ 投机统计：领先 {stats['head_start_seconds']:.2f}s，浪费 {stats['wasted_calls']} 次调用 / "
+          f"{stats['wasted_input_tokens'] + stats['wasted_output_tokens']} tokens"
+          f"（占比 {speculative_router.wasted_token_ratio():.0%}）")
+
+
 # ---------------------- 5. 手动输入交互逻辑 ----------------------
-def flower_chatbot_interactive():
+# 整个会话运行在同一个事件循环里：共享 HTTP 连接池、合并表等按事件循环创建的资源在问题之间复用
+async def flower_chatbot_interactive():
     """交互式鲜花客服：支持用户手动输入，连续提问"""
     print("=" * 80)
     print("🌸 易速鲜花智能客服")
@@ -81,9 +123,10 @@ def flower_chatbot_interactive():
     print("🎨 可咨询：鲜花装饰（搭配、插花、场地布置等）")
     print("📌 输入 'q' 或 'Q' 退出程序")
     print("=" * 80)
+    await awarm_up(base_url)  # 预热本事件循环的异步连接池，第一个问题不再承担握手耗时
 
     while True:
-        # 接收用户手动输入
+        # 接收用户手动输入（两个问题之间循环里没有其他任务，直接阻塞读取，Ctrl+C 可正常退出）
         user_query = input("\n请输入你的问题：").strip()
 
         # 退出逻辑
@@ -99,16 +142,19 @@ def flower_chatbot_interactive():
         try:
             # 执行客服逻辑
             print("\n🔍 正在分析问题...")
-            response = full_chatbot_chain.invoke({"user_query": user_query})
-            query_type = classifier_chain.invoke({"user_query": user_query}).strip()
+            if SPECULATIVE_ROUTING:
+                await speculative_answer(user_query)
+                continue
+            result = await full_chatbot_chain.ainvoke({"user_query": user_query})
+            query_type = result["query_type"]
             chatbot_name = "ChatBot A（养护专家）" if query_type == "养护" else "ChatBot B（装饰专家）"
 
             # 格式化输出结果（带颜色和分隔符）
             print("\n" + "-" * 60)
-            print(f"📋 问题分类：{query_type}")
+            print(f"📋 问题分类：{describe_route(result['route'])}")
             print(f"🤖 回复专家：{chatbot_name}")
             print("💬 回复内容：")
-            print(response)
+            print(result["answer"])
             print("-" * 60)
 
         except OpenAIError as e:
@@ -120,7 +166,7 @@ def flower_chatbot_interactive():
 # 启动交互式客服
 if __name__ == "__main__":
     try:
-        flower_chatbot_interactive()
+        asyncio.run(flower_chatbot_interactive())
     except KeyboardInterrupt:
         print("\n\n👋 程序已退出，感谢使用！")
     except Exception as e:
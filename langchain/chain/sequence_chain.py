@@ -1,11 +1,15 @@
 import os
+import sys
 
 from dotenv import load_dotenv
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
-from langchain_openai import ChatOpenAI
+from langchain_core.output_parsers import StrOutputParser
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.chain_graph import ChainGraph
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -13,7 +17,7 @@ base_url = os.getenv("GPTSAPI_BASE_URL")
 
 # 初始化统一模型（也可给不同角色配置不同 temperature，如植物学家 0.3 更严谨）
 try:
-    model = ChatOpenAI(
+    model = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -35,8 +39,8 @@ botanist_prompt = ChatPromptTemplate.from_messages([
     ("user", "请提供 {flower_type} 的专业植物学知识。")
 ])
 
-# 构建植物学家 Chain
-botanist_chain = botanist_prompt | model
+# 构建植物学家 Chain（输出字符串，供后续 prompt 直接引用）
+botanist_chain = botanist_prompt | model | StrOutputParser()
 
 # ---------------------- 第二步：鲜花评论者 → 基于植物学知识写评论 ----------------------
 critic_prompt = ChatPromptTemplate.from_messages([
@@ -52,14 +56,8 @@ critic_prompt = ChatPromptTemplate.from_messages([
     ("user", "请基于上述植物学知识，点评 {flower_type}。")
 ])
 
-# 构建评论者 Chain（依赖第一步的植物学知识）
-critic_chain = (
-        RunnablePassthrough.assign(
-            botanist_knowledge=botanist_chain  # 先执行植物学家 Chain，获取知识
-        )
-        | critic_prompt
-        | model
-)
+# 构建评论者 Chain（prompt 引用了 {botanist_knowledge}，链图据此推断它依赖第一步）
+critic_chain = critic_prompt | model | StrOutputParser()
 
 # ---------------------- 第三步：运营经理 → 基于前两步写社交媒体文案 ----------------------
 marketer_prompt = ChatPromptTemplate.from_messages([
@@ -78,15 +76,17 @@ marketer_prompt = ChatPromptTemplate.from_messages([
 ])
 
 # 构建运营经理 Chain（依赖第一步和第二步的结果）
-full_chain = (
-        RunnablePassthrough.assign(
-            # 先执行前两步，获取依赖数据
-            botanist_knowledge=botanist_chain,
-            critic_comment=critic_chain
-        )
-        | marketer_prompt
-        | model
+marketer_chain = marketer_prompt | model | StrOutputParser()
+
+# ---------------------- 组装链图：依赖关系由各 prompt 的输入变量自动推断 ----------------------
+# 每个节点只执行一次；新增的步骤若不依赖其他节点的输出，会自动与它们并行执行
+flower_graph = (
+    ChainGraph()
+    .add("botanist_knowledge", botanist_chain)
+    .add("critic_comment", critic_chain)
+    .add("marketer_copy", marketer_chain)
 )
+full_chain = flower_graph.as_runnable()  # 输出 {"flower_type", "botanist_knowledge", "critic_comment", "marketer_copy"}
 
 
 # ---------------------- 执行完整流程 ----------------------
@@ -97,18 +97,15 @@ def generate_flower_full_flow(flower_type: str) -> dict:
     :return: 包含三步结果的字典
     """
     try:
-        # 执行完整 Chain，传入鲜花类型
-        result = full_chain.invoke({"flower_type": flower_type})
-
-        # 单独获取前两步的结果（用于展示）
-        botanist_result = botanist_chain.invoke({"flower_type": flower_type}).content.strip()
-        critic_result = critic_chain.invoke({"flower_type": flower_type}).content.strip()
-        marketer_result = result.content.strip()
+        # 执行链图（一次执行即得到三步的结果，不再为展示而重复调用前两步）
+        run = flower_graph.run({"flower_type": flower_type})
+        outputs = run["outputs"]
+        print(f"⏱️ 关键路径：{' → '.join(run['critical_path'])}（{run['critical_seconds']:.1f}s）")
 
         return {
-            "植物学家知识": botanist_result,
-            "鲜花评论者点评": critic_result,
-            "社交媒体运营文案": marketer_result
+            "植物学家知识": outputs["botanist_knowledge"].strip(),
+            "鲜花评论者点评": outputs["critic_comment"].strip(),
+            "社交媒体运营文案": outputs["marketer_copy"].strip()
         }
     except OpenAIError as e:
         raise RuntimeError(f"API 调用失败：{str(e)}") from e
@@ -1,8 +1,10 @@
 import os
+import sys
 from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.tools import tool
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
 # 修正导入路径：直接从 tool_calling 模块导入
 from langchain.chains import create_tool_calling_chain
 from langchain_core.output_parsers import StrOutputParser
@@ -36,7 +38,7 @@ def get_flower_care_guide(flower_type: str) -> str:
 tools = [check_flower_order, track_flower_logistics, get_flower_care_guide]
 
 # ---------------------- 初始化 LLM ----------------------
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",
@@ -0,0 +1,181 @@
+"""
+声明式链图（DAG）执行器
+
+多步链原来用嵌套的 RunnablePassthrough.assign 手工串联：依赖关系写死在嵌套结构里，
+互不依赖的步骤也只能顺序执行，同一步骤还容易被不同分支重复调用。这里改为声明式：
+- 每个节点是一个以 prompt 开头的 Runnable，依赖关系从 prompt 的输入变量自动推断：
+  变量名与某个节点同名 → 依赖该节点的输出，其余变量为整个图的外部输入；
+- 执行时每个节点等到依赖就绪立即启动（asyncio 并发），互不依赖的节点并行执行，每个节点只执行一次；
+- 节点输出按 (节点, 该节点的输入) 缓存，相同输入不再重复调用 LLM；
+- 每次执行返回关键路径（决定总耗时的依赖链）及各节点耗时，便于找出值得优化的步骤。
+
+用法：
+    graph = ChainGraph()
+    graph.add("botanist_knowledge", botanist_prompt | model | StrOutputParser())
+    graph.add("critic_comment", critic_prompt | model | StrOutputParser())  # prompt 中引用了 {botanist_knowledge}
+    run = graph.run({"flower_type": "洋桔梗"})  # {"outputs", "critical_path", "critical_seconds", "timings"}
+"""
+import asyncio
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from langchain_core.runnables import Runnable, RunnableLambda
+
+
+def _input_variables(runnable: Runnable) -> List[str]:
+    """取 Runnable 的输入变量：prompt 本身，或以 prompt 开头的 RunnableSequence"""
+    for candidate in (runnable, getattr(runnable, "first", None)):
+        variables = getattr(candidate, "input_variables", None)
+        if variables is not None:
+            return list(variables)
+    raise ValueError(f"无法推断 {type(runnable).__name__} 的输入变量，请通过 inputs 参数显式指定")
+
+
+class ChainGraph:
+    """
+    :param cache_size: 节点输出缓存的最大条目数（LRU），0 表示不缓存
+    """
+
+    def __init__(self, cache_size: int = 256):
+        self.nodes: Dict[str, Runnable] = {}
+        self.inputs: Dict[str, List[str]] = {}
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"node_calls": 0, "cache_hits": 0}
+
+    def add(self, name: str, runnable: Runnable, inputs: Optional[List[str]] = None) -> "ChainGraph":
+        """
+        添加节点，输出以 name 为变量名供后续节点引用
+        :param inputs: 节点的输入变量，不传时从 prompt 的 input_variables 推断
+        """
+        if name in self.nodes:
+            raise ValueError(f"节点 {name} 已存在")
+        self.nodes[name] = runnable
+        self.inputs[name] = list(inputs) if inputs is not None else _input_variables(runnable)
+        return self
+
+    def dependencies(self, name: str) -> List[str]:
+        return [var for var in self.inputs[name] if var in self.nodes]
+
+    def external_inputs(self) -> List[str]:
+        return sorted({var for name in self.nodes for var in self.inputs[name] if var not in self.nodes})
+
+    def stages(self) -> List[List[str]]:
+        """按依赖分层：同一层的节点可并行执行；存在环时抛出 ValueError"""
+        remaining = {name: set(self.dependencies(name)) for name in self.nodes}
+        done, stages = set(), []
+        while remaining:
+            ready = [name for name, deps in remaining.items() if deps <= done]
+            if not ready:
+                raise ValueError(f"链图存在循环依赖：{sorted(remaining)}")
+            stages.append(ready)
+            done.update(ready)
+            for name in ready:
+                del remaining[name]
+        return stages
+
+    # ---------------------- 节点输出缓存 ----------------------
+    def _cache_key(self, name: str, values: Dict[str, Any]) -> str:
+        payload = json.dumps(values, ensure_ascii=False, sort_keys=True, default=str)
+        return hashlib.sha256(f"{name}\n{payload}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str):
+        with self._lock:
+            if key not in self._cache:
+                return False, None
+            self._cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return True, self._cache[key]
+
+    def _cache_put(self, key: str, value):
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def clear_cache(self):
+        with self._lock:
+            self._cache.clear()
+
+    # ---------------------- 执行 ----------------------
+    async def arun(self, inputs: Dict[str, Any], config=None) -> Dict[str, Any]:
+        """
+        执行整个图
+        :return: {"outputs": 外部输入 + 各节点输出, "critical_path": [节点名, ...],
+                  "critical_seconds": 关键路径耗时, "timings": {节点: {"start", "end", "seconds", "cached"}}}
+        """
+        missing = [var for var in self.external_inputs() if var not in inputs]
+        if missing:
+            raise ValueError(f"缺少输入变量：{missing}")
+        self.stages()  # 提前检查循环依赖
+
+        started = time.perf_counter()
+        timings: Dict[str, dict] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+
+        async def run_node(name: str):
+            deps = self.dependencies(name)
+            dep_values = await asyncio.gather(*(tasks[dep] for dep in deps))
+            values = {**{var: inputs[var] for var in self.inputs[name] if var not in self.nodes},
+                      **dict(zip(deps, dep_values))}
+            node_start = time.perf_counter() - started
+            key = self._cache_key(name, values)
+            cached, output = self._cache_get(key)
+            if not cached:
+                self.stats["node_calls"] += 1
+                output = await self.nodes[name].ainvoke(values, config=config)
+                self._cache_put(key, output)
+            node_end = time.perf_counter() - started
+            timings[name] = {"start": node_start, "end": node_end, "seconds": node_end - node_start,
+                             "cached": cached}
+            return output
+
+        for name in self.nodes:
+            tasks[name] = asyncio.ensure_future(run_node(name))
+        try:
+            results = await asyncio.gather(*tasks.values())
+        except BaseException:
+            for task in tasks.values():
+                task.cancel()
+            raise
+
+        path = self._critical_path(timings)
+        return {
+            "outputs": {**inputs, **dict(zip(tasks, results))},
+            "critical_path": path,
+            "critical_seconds": timings[path[-1]]["end"] if path else 0.0,
+            "timings": timings
+        }
+
+    def _critical_path(self, timings: Dict[str, dict]) -> List[str]:
+        """从最后结束的节点出发，沿"最晚就绪的依赖"回溯"""
+        if not timings:
+            return []
+        node = max(timings, key=lambda name: timings[name]["end"])
+        path = [node]
+        while self.dependencies(node):
+            node = max(self.dependencies(node), key=lambda name: timings[name]["end"])
+            path.append(node)
+        return path[::-1]
+
+    def run(self, inputs: Dict[str, Any], config=None) -> Dict[str, Any]:
+        """同步执行（内部启动事件循环，不能在已运行的事件循环中调用）"""
+        return asyncio.run(self.arun(inputs, config=config))
+
+    async def ainvoke(self, inputs: Dict[str, Any], config=None) -> Dict[str, Any]:
+        return (await self.arun(inputs, config=config))["outputs"]
+
+    def invoke(self, inputs: Dict[str, Any], config=None) -> Dict[str, Any]:
+        return self.run(inputs, config=config)["outputs"]
+
+    def as_runnable(self) -> Runnable:
+        """包装为 Runnable（输出为外部输入 + 各节点输出），可继续用 | 组合"""
+        return RunnableLambda(self.invoke, afunc=self.ainvoke)
@@ -0,0 +1,134 @@
+"""
+预编译 Chat Prompt 模板
+
+ChatPromptTemplate 每次 invoke 都要重新解析各条消息的 f-string 模板、逐条重建消息对象，
+tot.py / react_with_third_api.py / sql.py 中几百字的静态 system prompt 每次调用都会被重新渲染一遍。
+CompiledChatPromptTemplate 在创建时一次性编译：
+- 每条消息模板解析为「固定文本 / 变量名」片段列表，渲染时只做一次 join；
+- 不含变量的消息（如静态 system prompt）在编译时直接生成消息对象，之后每次调用只做一次浅拷贝，
+  Agent 每一步推理都不再重新解析/渲染这段静态 prompt（返回副本，调用方修改消息不会影响模板）；
+- MessagesPlaceholder 原样保留。
+
+与 ChatPromptTemplate 的输入变量、partial、输出（ChatPromptValue）一致，可直接用于 prompt | model
+和 create_openai_tools_agent。仅支持 f-string 格式的文本消息模板（不支持格式说明符如 {x:>10}）。
+
+用法：把 ChatPromptTemplate.from_messages(...) 替换为 CompiledChatPromptTemplate.from_messages(...)，
+或用 CompiledChatPromptTemplate.from_prompt(已有的 ChatPromptTemplate) 转换。
+"""
+from string import Formatter
+from typing import Any, Dict, List, Sequence, Tuple, Type
+
+from langchain_core.messages import AIMessage, BaseMessage, HumanMessage, SystemMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder, PromptTemplate
+from langchain_core.prompts.chat import (AIMessagePromptTemplate, BaseChatPromptTemplate,
+                                         HumanMessagePromptTemplate, SystemMessagePromptTemplate)
+
+_ROLE_MESSAGES: Dict[str, Type[BaseMessage]] = {
+    "system": SystemMessage, "human": HumanMessage, "user": HumanMessage, "ai": AIMessage, "assistant": AIMessage
+}
+_TEMPLATE_MESSAGES = {
+    SystemMessagePromptTemplate: SystemMessage, HumanMessagePromptTemplate: HumanMessage,
+    AIMessagePromptTemplate: AIMessage
+}
+
+
+def compile_template(template: str) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+    """
+    把 f-string 模板解析为片段：返回 (固定文本, 变量名)，固定文本比变量名多一个，
+    渲染结果为 literals[0] + str(v0) + literals[1] + ... + literals[-1]
+    """
+    literals, variables, pending = [], [], ""
+    for literal, field, spec, conversion in Formatter().parse(template):
+        pending += literal  # Formatter 已把 {{ }} 还原为 { }
+        if field is None:
+            continue
+        if spec or conversion or not field.isidentifier():
+            raise ValueError(f"预编译模板不支持格式说明符或属性访问：{{{field}}}")
+        literals.append(pending)
+        variables.append(field)
+        pending = ""
+    literals.append(pending)
+    return tuple(literals), tuple(variables)
+
+
+class _CompiledMessage:
+    """含变量的单条消息：渲染时一次 join"""
+    __slots__ = ("message_class", "literals", "variables", "_pairs")
+
+    def __init__(self, message_class: Type[BaseMessage], template: str):
+        self.message_class = message_class
+        self.literals, self.variables = compile_template(template)
+        self._pairs = tuple(zip(self.variables, self.literals[1:]))
+
+    def render(self, values: Dict[str, Any]) -> BaseMessage:
+        parts = [self.literals[0]]
+        for variable, literal in self._pairs:
+            parts.append(str(values[variable]))
+            parts.append(literal)
+        return self.message_class(content="".join(parts))
+
+
+def _compile_part(message_class: Type[BaseMessage], template: str):
+    compiled = _CompiledMessage(message_class, template)
+    if not compiled.variables:
+        return message_class(content=compiled.literals[0])  # 静态消息：编译时生成一次
+    return compiled
+
+
+class CompiledChatPromptTemplate(BaseChatPromptTemplate):
+    """预编译的 ChatPromptTemplate（见模块说明）"""
+
+    parts: List[Any]  # BaseMessage（静态）/ _CompiledMessage / MessagesPlaceholder
+
+    @property
+    def _prompt_type(self) -> str:
+        return "compiled-chat"
+
+    @classmethod
+    def from_messages(cls, messages: Sequence[Any], **kwargs) -> "CompiledChatPromptTemplate":
+        """
+        :param messages: 与 ChatPromptTemplate.from_messages 相同：(角色, 模板) 元组、MessagesPlaceholder、
+                         消息对象或 System/Human/AI MessagePromptTemplate
+        """
+        parts, input_variables = [], []
+        for message in messages:
+            if isinstance(message, MessagesPlaceholder):
+                part = message
+                variables = [] if message.optional else [message.variable_name]
+            elif isinstance(message, BaseMessage):
+                part, variables = message, []
+            elif isinstance(message, tuple) and len(message) == 2 and isinstance(message[1], str):
+                role, template = message
+                if role not in _ROLE_MESSAGES:
+                    raise ValueError(f"不支持的消息角色：{role}")
+                part = _compile_part(_ROLE_MESSAGES[role], template)
+                variables = list(getattr(part, "variables", ()))
+            elif type(message) in _TEMPLATE_MESSAGES and isinstance(message.prompt, PromptTemplate) \
+                    and message.prompt.template_format == "f-string":
+                part = _compile_part(_TEMPLATE_MESSAGES[type(message)], message.prompt.template)
+                variables = list(getattr(part, "variables", ()))
+            else:
+                raise ValueError(f"不支持预编译的消息类型：{type(message).__name__}")
+            parts.append(part)
+            input_variables.extend(var for var in variables if var not in input_variables)
+
+        partial_variables = kwargs.pop("partial_variables", {})
+        input_variables = sorted(var for var in input_variables if var not in partial_variables)
+        return cls(parts=parts, input_variables=input_variables, partial_variables=partial_variables, **kwargs)
+
+    @classmethod
+    def from_prompt(cls, prompt: ChatPromptTemplate) -> "CompiledChatPromptTemplate":
+        """编译已有的 ChatPromptTemplate（保留其 partial 变量）"""
+        return cls.from_messages(prompt.messages, partial_variables=dict(prompt.partial_variables))
+
+    def format_messages(self, **kwargs: Any) -> List[BaseMessage]:
+        values = self._merge_partial_and_user_variables(**kwargs)
+        messages = []
+        for part in self.parts:
+            if isinstance(part, BaseMessage):
+                messages.append(part.model_copy())  # 副本：下游修改返回的消息（如 id、content）不会污染模板
+            elif isinstance(part, _CompiledMessage):
+                messages.append(part.render(values))
+            else:
+                messages.extend(part.format_messages(**values))
+        return messages
@@ -0,0 +1,88 @@
+"""
+按 token 预算打包 RAG 上下文
+
+检索结果直接拼接时，相邻片段因 CHUNK_OVERLAP 存在重复文本，且总长度没有上限。打包步骤：
+1. 按相关性得分（metadata["score"]，没有时保持检索顺序）排序；
+2. 去重：与已选片段高度重复的片段整体丢弃；同一来源中与已选片段首尾重叠的部分裁掉；
+3. 用目标模型的分词器计数，累加到预算为止，最后一个片段按剩余预算截断。
+"""
+from typing import List, Sequence, Set
+
+from langchain_core.documents import Document
+
+from common.token_counter import DEFAULT_MODEL, count_tokens, truncate_to_tokens
+
+_SHINGLE_SIZE = 5  # 字符级 shingle 长度（中文按字计）
+_MIN_OVERLAP = 8  # 重合少于该字符数时视为巧合（如同样以「。」结尾），不裁剪
+
+
+def _shingles(text: str) -> Set[str]:
+    text = "".join(text.split())
+    return {text[i:i + _SHINGLE_SIZE] for i in range(max(len(text) - _SHINGLE_SIZE + 1, 1))}
+
+
+def _overlap_length(previous: str, current: str, max_overlap: int) -> int:
+    """previous 的后缀与 current 的前缀重合的最大长度（即分割时的 overlap 部分）"""
+    for length in range(min(len(previous), len(current), max_overlap), _MIN_OVERLAP - 1, -1):
+        if previous.endswith(current[:length]):
+            return length
+    return 0
+
+
+class ContextPacker:
+    """
+    :param token_budget: 上下文最大 token 数
+    :param model_name: 计数所用的目标模型分词器
+    :param dedup_threshold: 片段与已选片段的 shingle 包含率超过该值时视为重复
+    :param max_overlap: 裁剪首尾重叠时检查的最大字符数（≥ CHUNK_OVERLAP）
+    :param min_tail_tokens: 剩余预算低于该值时不再截断塞入半个片段
+    """
+
+    def __init__(self, token_budget: int = 1500, model_name: str = DEFAULT_MODEL, dedup_threshold: float = 0.8,
+                 max_overlap: int = 200, min_tail_tokens: int = 50, separator: str = "\n\n"):
+        self.token_budget = token_budget
+        self.model_name = model_name
+        self.dedup_threshold = dedup_threshold
+        self.max_overlap = max_overlap
+        self.min_tail_tokens = min_tail_tokens
+        self.separator = separator
+
+    def pack_documents(self, docs: Sequence[Document]) -> List[Document]:
+        """返回打包后的片段（新 Document，不修改原检索结果）"""
+        ranked = sorted(enumerate(docs), key=lambda x: (-x[1].metadata.get("score", 0.0), x[0]))
+
+        packed: List[Document] = []
+        packed_shingles: List[Set[str]] = []
+        separator_tokens = count_tokens(self.separator, self.model_name)
+        remaining = self.token_budget
+        for _, doc in ranked:
+            text = doc.page_content.strip()
+            shingles = _shingles(text)
+            if any(len(shingles & seen) / len(shingles) >= self.dedup_threshold for seen in packed_shingles):
+                continue  # 与已选片段高度重复
+
+            source = doc.metadata.get("source")
+            for chosen in packed:
+                if chosen.metadata.get("source") == source:
+                    # 已选片段在前：裁掉当前片段开头的重叠；已选片段在后：裁掉当前片段结尾的重叠
+                    text = text[_overlap_length(chosen.page_content, text, self.max_overlap):]
+                    text = text[:len(text) - _overlap_length(text, chosen.page_content, self.max_overlap)]
+            if not text.strip():
+                continue
+
+            cost = count_tokens(text, self.model_name) + (separator_tokens if packed else 0)
+            if cost > remaining:
+                if remaining - separator_tokens < self.min_tail_tokens:
+                    break
+                text = truncate_to_tokens(text, remaining - separator_tokens, self.model_name)
+                cost = remaining
+            packed.append(Document(page_content=text, metadata=doc.metadata))
+            packed_shingles.append(shingles)
+            remaining -= cost
+            if remaining <= 0:
+                break
+        return packed
+
+    def pack(self, docs: Sequence[Document]) -> str:
+        """打包并拼接为上下文字符串"""
+        return self.separator.join(d.page_content for d in self.pack_documents(docs))
@@ -0,0 +1,168 @@
+"""
+持久化嵌入缓存（多个 demo 共用）
+
+按 (模型名, 规范化文本哈希) 把向量存入 SQLite，同样的文本跨运行、跨脚本只向量化一次；
+缓存条目数超过上限时，按最近访问时间淘汰最久未使用的条目。
+
+用法：
+    embedding = CachedEmbeddings(SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2"))
+    db = Chroma.from_documents(documents=chunks, embedding=embedding)
+"""
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+# 缓存文件路径与容量（可通过环境变量覆盖）
+DEFAULT_CACHE_PATH = os.getenv(
+    "EMBEDDING_CACHE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "embedding_cache.sqlite3")
+)
+DEFAULT_MAX_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", "500000"))
+
+# SQLite 单条语句的参数个数有上限，批量查询时分组
+_SQL_BATCH = 500
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本：全角/半角统一（NFKC）+ 合并空白，保证等价文本命中同一缓存"""
+    return " ".join(unicodedata.normalize("NFKC", text).split())
+
+
+def text_hash(text: str) -> str:
+    return hashlib.sha256(normalize_text(text).encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """SQLite 向量缓存：主键 (model, text_hash)，向量以 float32 BLOB 存储"""
+
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_entries: int = DEFAULT_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")  # 读写并发更友好
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_access ON embeddings (last_access)")
+        self._conn.commit()
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model: str, hashes: List[str]) -> Dict[str, List[float]]:
+        """批量查询，返回命中的 {text_hash: 向量}，并刷新命中条目的访问时间"""
+        found = {}
+        with self._lock:
+            for i in range(0, len(hashes), _SQL_BATCH):
+                batch = hashes[i:i + _SQL_BATCH]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model, *batch]
+                ).fetchall()
+                for h, blob in rows:
+                    found[h] = array("f", blob).tolist()
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, h) for h in found]
+                )
+                self._conn.commit()
+        return found
+
+    def put_many(self, model: str, items: List[Tuple[str, List[float]]]):
+        """批量写入 (text_hash, 向量)，超出容量时淘汰最久未访问的条目"""
+        if not items:
+            return
+        now = time.time()
+        with self._lock:
+            before = self._conn.total_changes
+            self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [(model, h, array("f", vector).tobytes(), now) for h, vector in items]
+            )
+            self._count += self._conn.total_changes - before
+            if self._count > self.max_entries:
+                self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """一次淘汰到容量的 90%，避免每次写入都触发淘汰"""
+        n_evict = self._count - int(self.max_entries * 0.9)
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE (model, text_hash) IN "
+            "(SELECT model, text_hash FROM embeddings ORDER BY last_access LIMIT ?)",
+            (n_evict,)
+        )
+        self._count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+
+# 同一进程内共享同一个缓存连接
+_shared_caches: Dict[str, EmbeddingCache] = {}
+
+
+def get_embedding_cache(path: str = DEFAULT_CACHE_PATH) -> EmbeddingCache:
+    if path not in _shared_caches:
+        _shared_caches[path] = EmbeddingCache(path)
+    return _shared_caches[path]
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    带持久化缓存的嵌入模型包装器：先查缓存，只把未命中的文本交给底层模型
+    :param underlying: 任意 LangChain Embeddings（SentenceTransformerEmbeddings、OpenAIEmbeddings 等）
+    :param model_name: 缓存键中的模型名（或本地模型路径）；不传时从底层模型的 model_name/model 属性推断。
+                       缓存键不含包装类名，同一模型换用其他运行方式（如 BatchedSentenceTransformerEmbeddings）时缓存仍然有效
+    :param cache: 缓存实例；不传时使用进程内共享的默认缓存
+    """
+
+    def __init__(self, underlying: Embeddings, model_name: Optional[str] = None,
+                 cache: Optional[EmbeddingCache] = None):
+        self.underlying = underlying
+        name = model_name or getattr(underlying, "model_name", None) or getattr(underlying, "model", None)
+        if not name:
+            raise ValueError("无法推断嵌入模型名称，请显式传入 model_name")
+        self.model_key = name
+        self.cache = cache or get_embedding_cache()
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, self.model_key, self.underlying.embed_documents)
+
+    def embed_query(self, text: str) -> List[float]:
+        # 部分模型的查询向量与文档向量不同，使用独立的缓存命名空间
+        return self._embed([text], self.model_key + ":query",
+                           lambda batch: [self.underlying.embed_query(t) for t in batch])[0]
+
+    def _embed(self, texts: List[str], model_key: str, embed_fn) -> List[List[float]]:
+        hashes = [text_hash(t) for t in texts]
+        vectors = self.cache.get_many(model_key, list(set(hashes)))
+
+        # 未命中的文本去重后再向量化（同一批内的重复文本也只算一次）
+        missing = {}
+        for h, t in zip(hashes, texts):
+            if h not in vectors and h not in missing:
+                missing[h] = t
+        if missing:
+            new_vectors = embed_fn(list(missing.values()))
+            vectors.update(zip(missing.keys(), new_vectors))
+            self.cache.put_many(model_key, list(zip(missing.keys(), new_vectors)))
+
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [vectors[h] for h in hashes]
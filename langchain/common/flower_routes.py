@@ -0,0 +1,53 @@
+"""
+鲜花客服路由的共享定义（chain/router_chain.py 与 chain/router_chain_v2.py 共用）
+
+两个路由 demo 的分类规整、路由示例问题和路由链构建逻辑一致，放在这里只定义一次，避免两边各改各的。
+"""
+import os
+
+from langchain_core.runnables import Runnable
+
+from common.embedding_cache import CachedEmbeddings
+from common.embedding_runner import BatchedSentenceTransformerEmbeddings
+from common.intent_router import EmbeddingIntentRouter
+
+# 本地向量路由（默认）：置信度不足时才调用 LLM 分类器
+# ROUTER_MODE=llm 时每个问题都用 LLM 分类（原行为）
+ROUTER_MODE = os.getenv("ROUTER_MODE", "embedding")
+ROUTE_EXAMPLES = {
+    "养护": [
+        "玫瑰怎么保鲜更久？", "洋桔梗多久换一次水？", "百合花叶子发黄怎么办？", "鲜花需要施肥吗？",
+        "花茎发黑腐烂怎么处理？", "绿萝有虫子怎么办？", "郁金香放在哪里能活得更久？", "多肉浇水频率是多少？"
+    ],
+    "装饰": [
+        "客厅摆什么花好看？", "婚礼主舞台用什么花材搭配？", "粉色和白色的花怎么组合？", "生日派对怎么用鲜花布置？",
+        "插花用什么花瓶合适？", "餐桌花艺怎么设计？", "满天星适合搭配哪些花？", "办公室前台怎么用花装饰？"
+    ],
+}
+
+
+def normalize_query_type(label: str) -> str:
+    """规整分类结果（去掉空白/标点等），无法识别时归为"养护"，与兜底分支一致"""
+    return "装饰" if "装饰" in label else "养护"
+
+
+def build_route_chain(classifier_chain: Runnable) -> Runnable:
+    """
+    返回 输入 → {"label", "confidence", "source"} 的路由 Runnable
+    :param classifier_chain: LLM 分类链（输出"养护"或"装饰"），ROUTER_MODE=llm 或本地置信度不足时使用
+    """
+    if ROUTER_MODE == "llm":
+        return classifier_chain | (lambda label: {"label": label, "confidence": 1.0, "source": "llm"})
+    embedding = CachedEmbeddings(BatchedSentenceTransformerEmbeddings("paraphrase-multilingual-MiniLM-L12-v2"))
+    router = EmbeddingIntentRouter(embedding, ROUTE_EXAMPLES, threshold=0.7, fallback=classifier_chain)
+    return router.as_runnable()
+
+
+def describe_route(route: dict) -> str:
+    """
+    路由结果的展示文本
+    本地向量路由显示置信度；LLM 分类没有可比的置信度（兜底时 confidence 是本地未达阈值的分数），只标注来源
+    """
+    if route["source"] == "local":
+        return f"{route['label']}（置信度 {route['confidence']:.2f}，本地向量路由）"
+    return f"{route['label']}（LLM 分类）"
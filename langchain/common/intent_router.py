@@ -0,0 +1,92 @@
+"""
+本地向量意图路由（替代每次都调用 LLM 的分类器）
+
+用少量带标签的示例问题计算每个类别的向量质心；查询时只做一次本地向量化（带持久化缓存）和
+几次点积，按余弦相似度取最近的质心，并用 softmax 给出置信度：
+- 置信度 ≥ threshold：直接返回本地分类结果，省掉一次 LLM 往返；
+- 置信度 < threshold：回退到 LLM 分类器（难例/新类型问题）。
+
+用法：
+    router = EmbeddingIntentRouter(embedding, {"养护": [...], "装饰": [...]}, fallback=classifier_chain)
+    chain = RunnablePassthrough.assign(route=router.as_runnable())  # route = {"label", "confidence", "source"}
+"""
+import asyncio
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+from langchain_core.runnables import Runnable, RunnableLambda
+
+
+class EmbeddingIntentRouter:
+    """
+    最近质心意图分类器
+    :param embeddings: 嵌入模型（建议用 CachedEmbeddings 包装的本地多语言模型）
+    :param examples: {类别: [示例问题, ...]}
+    :param threshold: 本地分类的最低置信度，低于该值时使用 fallback
+    :param fallback: 回退分类器（输入与路由器相同，输出类别字符串），为 None 时总是使用本地结果
+    :param temperature: softmax 温度，越小置信度越"尖锐"
+    :param input_key: 输入为字典时，取该字段作为待分类文本
+    """
+
+    def __init__(self, embeddings: Embeddings, examples: Dict[str, List[str]], threshold: float = 0.7,
+                 fallback: Optional[Runnable] = None, temperature: float = 0.05, input_key: str = "user_query"):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.fallback = fallback
+        self.temperature = temperature
+        self.input_key = input_key
+        self.labels = list(examples)
+
+        # 示例批量向量化，每个类别取单位向量的均值作为质心
+        texts = [text for label in self.labels for text in examples[label]]
+        vectors = self._normalize(np.asarray(embeddings.embed_documents(texts), dtype=np.float32))
+        centroids, offset = [], 0
+        for label in self.labels:
+            n = len(examples[label])
+            centroids.append(vectors[offset:offset + n].mean(axis=0))
+            offset += n
+        self.centroids = self._normalize(np.stack(centroids))
+        self.stats = {"local": 0, "fallback": 0}
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1.0, norms)
+
+    def classify(self, text: str) -> Dict:
+        """本地分类，返回 {"label", "confidence", "similarity"}"""
+        query = self._normalize(np.asarray(self.embeddings.embed_query(text), dtype=np.float32))
+        similarities = self.centroids @ query
+        logits = (similarities - similarities.max()) / self.temperature
+        probs = np.exp(logits) / np.exp(logits).sum()
+        best = int(np.argmax(probs))
+        return {"label": self.labels[best], "confidence": float(probs[best]), "similarity": float(similarities[best])}
+
+    def _text(self, inputs) -> str:
+        return inputs[self.input_key] if isinstance(inputs, dict) else str(inputs)
+
+    def route(self, inputs) -> Dict:
+        """返回 {"label", "confidence", "source"}，source 为 "local" 或 "llm" """
+        result = self.classify(self._text(inputs))
+        if self.fallback is None or result["confidence"] >= self.threshold:
+            self.stats["local"] += 1
+            return {"label": result["label"], "confidence": result["confidence"], "source": "local"}
+        self.stats["fallback"] += 1
+        return {"label": self.fallback.invoke(inputs), "confidence": result["confidence"], "source": "llm"}
+
+    async def aroute(self, inputs) -> Dict:
+        # 本地向量化是 CPU 计算，放到线程中，不阻塞事件循环
+        result = await asyncio.to_thread(self.classify, self._text(inputs))
+        if self.fallback is None or result["confidence"] >= self.threshold:
+            self.stats["local"] += 1
+            return {"label": result["label"], "confidence": result["confidence"], "source": "local"}
+        self.stats["fallback"] += 1
+        return {"label": await self.fallback.ainvoke(inputs), "confidence": result["confidence"], "source": "llm"}
+
+    def as_runnable(self) -> Runnable:
+        return RunnableLambda(self.route, afunc=self.aroute)
+
+    def local_ratio(self) -> float:
+        total = self.stats["local"] + self.stats["fallback"]
+        return self.stats["local"] / total if total else 0.0
@@ -0,0 +1,261 @@
+"""
+本地确定性 JSON 修复（在调用 LLM 修复之前）
+
+parse_or_fix / auto_fix_parser 原来只要解析失败就再调用一次 LLM 修复，而大多数失败都很简单：
+markdown 代码块、JSON 前后多了说明文字、末尾多余的逗号、单引号、全角标点（｛｝：，“”）、键名没加引号、
+Python 风格的 True/False/None。这里先在本地按顺序修复：
+1. 文本修复：去掉代码块与前后说明文字，逐字符扫描（区分字符串内外），只替换 JSON 结构上的错误，
+   字符串内容（包括其中的中文标点）保持不变；
+2. 按 Pydantic 模型引导的类型规整：解开多余的外层包装（如 {"FlowerCopywriting": {...}}、单元素数组）、
+   键名大小写/分隔符对齐字段名、数字转字符串、字符串按顿号/逗号拆成列表、去掉首尾空白。
+长度等业务约束不做任何修改；本地修复失败时抛出 OutputParserException，由调用方再交给 LLM 修复。
+
+stats 统计直接成功 / 本地修复成功 / 需要 LLM 修复的次数，以及各类修复的命中次数；
+只统计模型第一次输出的解析，LLM 修复后的再次解析传 record=False，本地修复成功率才反映省掉的 LLM 调用。
+
+用法：
+    try:
+        result = get_json_repair().parse(text, FlowerCopywriting)
+    except OutputParserException as e:
+        fixed = ...  # 本地修复失败，调用 LLM 修复
+        result = get_json_repair().parse(fixed, FlowerCopywriting, record=False)
+"""
+import json
+import re
+import threading
+from typing import Any, Dict, List, Optional, Tuple, Type, TypeVar, get_args, get_origin
+
+from langchain_core.exceptions import OutputParserException
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+_FENCE = re.compile(r"```(?:json|JSON)?\s*(.*?)```", re.DOTALL)
+_FULL_WIDTH = {"｛": "{", "｝": "}", "［": "[", "］": "]", "：": ":"}  # 全角逗号与半角逗号一起处理（末尾逗号）
+_OPENERS, _CLOSERS = "{[｛［", "}]｝］"
+_QUOTE_PAIRS = {'"': '"', "'": "'", "“": "”", "‘": "’"}
+_LITERALS = {"True": "true", "False": "false", "None": "null"}
+_LIST_SEPARATORS = re.compile(r"[,，、;；\n]+")
+
+
+def _skip_string(text: str, i: int) -> int:
+    """text[i] 为引号：返回字符串结束引号之后的位置（未闭合时返回文本长度）"""
+    char = text[i]
+    closers = (_QUOTE_PAIRS[char], '"') if char == "“" else (_QUOTE_PAIRS[char],)
+    j = i + 1
+    while j < len(text) and text[j] not in closers:
+        j += 2 if text[j] == "\\" else 1
+    return j + 1
+
+
+def _balanced_end(text: str, start: int) -> int:
+    """从 start 处的 { / [ 开始扫描（跳过字符串内容），返回与之配对的闭合括号位置；未闭合时返回 -1"""
+    depth, i = 0, start
+    while i < len(text):
+        char = text[i]
+        if char in _QUOTE_PAIRS:
+            i = _skip_string(text, i)
+            continue
+        if char in _OPENERS:
+            depth += 1
+        elif char in _CLOSERS:
+            depth -= 1
+            if depth == 0:
+                return i
+        i += 1
+    return -1
+
+
+def _extract(text: str, fixes: List[str]) -> str:
+    """去掉代码块和 JSON 前后的说明文字（取第一个完整的对象/数组，之后的内容即使含括号也丢弃）"""
+    match = _FENCE.search(text)
+    if match:
+        text = match.group(1)
+        fixes.append("code_fence")
+    starts = [i for i in (text.find(c) for c in _OPENERS) if i >= 0]
+    if not starts:
+        return text
+    start = min(starts)
+    end = _balanced_end(text, start)
+    if end < 0:
+        return text[start:]
+    if text[:start].strip() or text[end + 1:].strip():
+        fixes.append("surrounding_text")
+    return text[start:end + 1]
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_-$"
+
+
+def repair_json_text(text: str) -> Tuple[str, List[str]]:
+    """修复 JSON 文本，返回 (修复后的文本, 命中的修复类型)"""
+    fixes: List[str] = []
+    text = _extract(text.strip(), fixes)
+    out: List[str] = []
+    i, n = 0, len(text)
+    while i < n:
+        char = text[i]
+        if char in _QUOTE_PAIRS:
+            # 字符串：统一输出为双引号，内容原样保留（仅转义内部的双引号）
+            closer = _QUOTE_PAIRS[char]
+            closers = (closer, '"') if char == "“" else (closer,)
+            if char != '"':
+                fixes.append("quotes")
+            j, content = i + 1, []
+            while j < n and text[j] not in closers:
+                if text[j] == "\\" and j + 1 < n:
+                    escaped = text[j + 1]
+                    content.append(escaped if escaped == "'" and char == "'" else text[j:j + 2])
+                    j += 2
+                    continue
+                content.append('\\"' if text[j] == '"' else text[j])
+                j += 1
+            out.append('"' + "".join(content) + '"')
+            i = j + 1
+        elif char in _FULL_WIDTH:
+            out.append(_FULL_WIDTH[char])
+            fixes.append("full_width")
+            i += 1
+        elif char in ",，":
+            # 末尾多余的逗号：后面（跳过空白）紧跟 } 或 ]
+            j = i + 1
+            while j < n and text[j].isspace():
+                j += 1
+            if j < n and text[j] in _CLOSERS:
+                fixes.append("trailing_comma")
+            else:
+                out.append(",")
+                if char == "，":
+                    fixes.append("full_width")
+            i += 1
+        elif _is_word_char(char) and not (char.isdigit() or char == "-"):
+            # 字符串外的裸单词：Python 字面量或未加引号的键名
+            j = i
+            while j < n and _is_word_char(text[j]):
+                j += 1
+            word = text[i:j]
+            k = j
+            while k < n and text[k].isspace():
+                k += 1
+            if word in _LITERALS:
+                out.append(_LITERALS[word])
+                fixes.append("python_literal")
+            elif k < n and text[k] in ":：":
+                out.append(json.dumps(word, ensure_ascii=False))
+                fixes.append("unquoted_key")
+            else:
+                out.append(word)
+            i = j
+        else:
+            out.append(char)
+            i += 1
+    return "".join(out), list(dict.fromkeys(fixes))
+
+
+def _normalize_key(key: str) -> str:
+    return re.sub(r"[\s_\-]", "", str(key)).lower()
+
+
+def _coerce_value(value: Any, annotation: Any) -> Any:
+    origin = get_origin(annotation)
+    if annotation is str:
+        if isinstance(value, (int, float)) and not isinstance(value, bool):
+            return str(value)
+        if isinstance(value, list) and all(isinstance(item, str) for item in value):
+            return "、".join(value)
+        return value.strip() if isinstance(value, str) else value
+    if origin in (list, List) and isinstance(value, str):
+        items = [item.strip() for item in _LIST_SEPARATORS.split(value) if item.strip()]
+        return [_coerce_value(item, (get_args(annotation) or (str,))[0]) for item in items]
+    if origin in (list, List) and isinstance(value, list):
+        item_type = (get_args(annotation) or (Any,))[0]
+        return [_coerce_value(item, item_type) for item in value]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel) and isinstance(value, dict):
+        return coerce_to_schema(value, annotation)
+    return value
+
+
+def coerce_to_schema(data: Any, pydantic_object: Type[BaseModel]) -> Any:
+    """按模型字段规整解析出的数据（不修改长度等业务约束）"""
+    fields = pydantic_object.model_fields
+    if isinstance(data, list) and len(data) == 1:
+        data = data[0]  # [{...}] → {...}
+    if not isinstance(data, dict):
+        return data
+    # {"模型名": {...}} / {"properties": {...}} 等单层包装
+    if len(data) == 1 and not set(data) & set(fields):
+        inner = next(iter(data.values()))
+        if isinstance(inner, dict) and {_normalize_key(k) for k in inner} & {_normalize_key(f) for f in fields}:
+            data = inner
+    by_key = {_normalize_key(name): name for name in fields}
+    coerced = {}
+    for key, value in data.items():
+        name = key if key in fields else by_key.get(_normalize_key(key), key)
+        coerced[name] = _coerce_value(value, fields[name].annotation) if name in fields else value
+    return coerced
+
+
+class LocalJsonRepair:
+    """本地解析 + 修复（线程安全统计）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {"clean": 0, "repaired": 0, "escalated": 0, "fixes": {}}
+
+    def _record(self, outcome: str, fixes: Optional[List[str]] = None, record: bool = True):
+        if not record:
+            return
+        with self._lock:
+            self.stats[outcome] += 1
+            for fix in fixes or []:
+                self.stats["fixes"][fix] = self.stats["fixes"].get(fix, 0) + 1
+
+    def parse(self, text: str, pydantic_object: Type[T], record: bool = True) -> T:
+        """
+        解析为模型对象：先直接解析，失败时本地修复；仍失败时抛出 OutputParserException（交给 LLM 修复）
+        :param record: 是否计入 stats；解析 LLM 修复后的输出时传 False（LLM 调用已经发生，也没有下一级可交）
+        """
+        try:
+            result = pydantic_object.model_validate_json(text.strip())
+            self._record("clean", record=record)
+            return result
+        except ValidationError as e:
+            first_error = e
+
+        repaired, fixes = repair_json_text(text)
+        try:
+            data = json.loads(repaired)
+            try:
+                result = pydantic_object.model_validate(data)
+            except ValidationError:
+                result = pydantic_object.model_validate(coerce_to_schema(data, pydantic_object))
+                fixes.append("schema_coercion")
+        except (ValueError, ValidationError) as e:
+            self._record("escalated", record=record)
+            error = e if isinstance(e, ValidationError) else first_error
+            raise OutputParserException(f"本地修复失败：{error}", llm_output=text) from e
+        self._record("repaired", fixes, record=record)
+        return result
+
+    def local_success_ratio(self) -> float:
+        """解析失败的输出中，本地修复成功（省掉一次 LLM 调用）的比例"""
+        failed = self.stats["repaired"] + self.stats["escalated"]
+        return self.stats["repaired"] / failed if failed else 0.0
+
+    def summary(self) -> str:
+        fixes = "，".join(f"{name}×{count}" for name, count in self.stats["fixes"].items()) or "无"
+        return (f"直接解析 {self.stats['clean']} 次，本地修复 {self.stats['repaired']} 次，"
+                f"交给 LLM 修复 {self.stats['escalated']} 次（本地修复成功率 {self.local_success_ratio():.0%}；"
+                f"修复类型：{fixes}）")
+
+
+_default_repair: Optional[LocalJsonRepair] = None
+
+
+def get_json_repair() -> LocalJsonRepair:
+    """进程内共享的本地修复器（统计在各调用方之间累计）"""
+    global _default_repair
+    if _default_repair is None:
+        _default_repair = LocalJsonRepair()
+    return _default_repair
@@ -0,0 +1,321 @@
+"""
+共享 LLM 客户端工厂（多个 demo 共用）
+
+原来每个模块在导入时各自 new 一个 ChatOpenAI，每个实例都有独立的 HTTP 客户端和连接池，
+每个进程的第一次调用都要重新建立 TCP/TLS 连接（100–300 ms）。这里统一为：
+- 进程内共享一个同步 httpx.Client 和一个异步 httpx.AsyncClient，配置相同（超时、连接池、HTTP/2）；
+  异步连接池属于创建它的事件循环，因此异步客户端为每个事件循环单独建一套传输栈（多次 asyncio.run 互不影响）；
+- 连接池保持长连接（keep-alive），安装了 h2 时启用 HTTP/2，多个请求复用同一条连接；
+- 按目标主机限制同时在途的请求数，超出时在本地排队，避免把代理/上游打满；
+- warm_up() / awarm_up()：交互式 demo 与服务启动时预先建立连接（异步入口预热当前事件循环的异步连接池），
+  第一次调用不再承担握手耗时；
+- 传输层内置 RPM/TPM 自适应限流与退避重试（见 common/rate_limiter.py），因此 ChatOpenAI 自身的重试默认关闭；
+- 进行中的相同请求合并为一次上游调用（见 common/single_flight.py）；
+- Claude 模型的请求自动标记 prompt 缓存断点，并统计每次调用的缓存命中 token（见 common/prompt_cache.py）。
+
+用法：把 ChatOpenAI(...) 替换为 get_chat_model(...)，参数不变（base_url 不传时与 ChatOpenAI 的默认端点相同）
+    llm = get_chat_model(model="gpt-3.5-turbo", temperature=0.6, timeout=15)
+"""
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+from functools import lru_cache
+from typing import Callable, Dict, Optional
+
+import httpx
+from langchain_core.callbacks import BaseCallbackManager, Callbacks
+from langchain_openai import ChatOpenAI
+
+from common.rate_limiter import (AdaptiveRateLimiter, AsyncRateLimitedTransport, RateLimitedTransport,
+                                 get_rate_limiter)
+from common.prompt_cache import AsyncPromptCacheTransport, PromptCacheTransport, get_prompt_cache_usage
+from common.single_flight import AsyncSingleFlightTransport, SingleFlightTransport
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+# 默认端点与连接池参数（可通过环境变量覆盖）；未配置 GPTSAPI_BASE_URL 时使用 ChatOpenAI 自身的默认端点
+DEFAULT_BASE_URL = os.getenv("GPTSAPI_BASE_URL")
+DEFAULT_API_KEY_ENV = "GPTSAPI_API_KEY"
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "100"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_MAX_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+MAX_CONCURRENCY_PER_HOST = int(os.getenv("LLM_MAX_CONCURRENCY_PER_HOST", "32"))
+
+
+def _host_key(request: httpx.Request) -> str:
+    return f"{request.url.host}:{request.url.port or ''}"
+
+
+class _ReleasingStream(httpx.SyncByteStream):
+    """响应体读完/关闭时才释放并发名额（流式输出期间仍占用名额）"""
+
+    def __init__(self, stream: httpx.SyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    def __iter__(self):
+        yield from self._stream
+
+    def close(self):
+        try:
+            self._stream.close()
+        finally:
+            self._release()
+
+
+class _AsyncReleasingStream(httpx.AsyncByteStream):
+    def __init__(self, stream: httpx.AsyncByteStream, release):
+        self._stream = stream
+        self._release = release
+
+    async def __aiter__(self):
+        async for chunk in self._stream:
+            yield chunk
+
+    async def aclose(self):
+        try:
+            await self._stream.aclose()
+        finally:
+            self._release()
+
+
+def _release_once(semaphore):
+    released = False
+
+    def release():
+        nonlocal released
+        if not released:
+            released = True
+            semaphore.release()
+    return release
+
+
+class HostLimitedTransport(httpx.BaseTransport):
+    """同步传输层：按主机限制同时在途的请求数"""
+
+    def __init__(self, transport: httpx.BaseTransport, max_concurrency: int):
+        self._transport = transport
+        self._max_concurrency = max_concurrency
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+
+    def _semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self._max_concurrency)
+            return self._semaphores[host]
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore(_host_key(request))
+        semaphore.acquire()
+        release = _release_once(semaphore)
+        try:
+            response = self._transport.handle_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _ReleasingStream(response.stream, release)
+        return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncHostLimitedTransport(httpx.AsyncBaseTransport):
+    """异步传输层：按主机限制同时在途的请求数（asyncio.Semaphore 属于单个事件循环，见 PerLoopAsyncTransport）"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, max_concurrency: int):
+        self._transport = transport
+        self._max_concurrency = max_concurrency
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+
+    def _semaphore(self, host: str) -> asyncio.Semaphore:
+        if host not in self._semaphores:
+            self._semaphores[host] = asyncio.Semaphore(self._max_concurrency)
+        return self._semaphores[host]
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        semaphore = self._semaphore(_host_key(request))
+        await semaphore.acquire()
+        release = _release_once(semaphore)
+        try:
+            response = await self._transport.handle_async_request(request)
+        except BaseException:
+            release()
+            raise
+        response.stream = _AsyncReleasingStream(response.stream, release)
+        return response
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class PerLoopAsyncTransport(httpx.AsyncBaseTransport):
+    """
+    每个事件循环一套独立的异步传输栈
+    连接池中的连接、asyncio.Semaphore、请求合并表都属于创建它们的事件循环，脚本多次调用 asyncio.run 时，
+    第二次运行复用第一次的连接会报 Event loop is closed。这里按运行中的事件循环懒创建传输栈，
+    并在该循环结束时（asyncio.run 退出前会取消剩余任务）关闭它的连接池。
+    :param factory: 创建一套异步传输栈
+    """
+
+    def __init__(self, factory: Callable[[], httpx.AsyncBaseTransport]):
+        self._factory = factory
+        # 事件循环 → (传输栈, 循环结束时负责关闭的常驻任务)；以循环对象为键，不会因 id 复用而串用
+        self._transports: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, tuple]" = weakref.WeakKeyDictionary()
+        self._lock = threading.Lock()  # 不同线程可能各自运行事件循环
+
+    def _current(self) -> httpx.AsyncBaseTransport:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            entry = self._transports.get(loop)
+            if entry is None:
+                transport = self._factory()
+                entry = (transport, loop.create_task(self._close_with_loop(loop, transport)))
+                self._transports[loop] = entry
+        return entry[0]
+
+    async def _close_with_loop(self, loop: asyncio.AbstractEventLoop, transport: httpx.AsyncBaseTransport):
+        try:
+            await loop.create_future()  # 一直等待，直到事件循环结束时被取消
+        finally:
+            with self._lock:
+                self._transports.pop(loop, None)
+            await transport.aclose()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        return await self._current().handle_async_request(request)
+
+    async def aclose(self):
+        """关闭当前事件循环的传输栈"""
+        with self._lock:
+            entry = self._transports.get(asyncio.get_running_loop())
+        if entry is not None:
+            entry[1].cancel()
+            await asyncio.gather(entry[1], return_exceptions=True)
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def build_http_client(limiter: AdaptiveRateLimiter) -> httpx.Client:
+    # 由外到内：请求合并 → 限流/重试 → 缓存断点标记 → 按主机限并发 → 连接池
+    # 被合并的请求不占用限流配额；退避等待期间不占用按主机的并发名额
+    transport = httpx.HTTPTransport(http2=HTTP2_AVAILABLE, limits=_limits(), retries=1)
+    transport = PromptCacheTransport(HostLimitedTransport(transport, MAX_CONCURRENCY_PER_HOST))
+    transport = RateLimitedTransport(transport, limiter)
+    transport = SingleFlightTransport(transport)
+    client = httpx.Client(transport=transport, timeout=httpx.Timeout(60.0, connect=10.0))
+    atexit.register(client.close)
+    return client
+
+
+def build_async_http_client(limiter: AdaptiveRateLimiter) -> httpx.AsyncClient:
+    def build_transport() -> httpx.AsyncBaseTransport:
+        transport = httpx.AsyncHTTPTransport(http2=HTTP2_AVAILABLE, limits=_limits(), retries=1)
+        transport = AsyncPromptCacheTransport(AsyncHostLimitedTransport(transport, MAX_CONCURRENCY_PER_HOST))
+        transport = AsyncRateLimitedTransport(transport, limiter)  # 限流器跨事件循环共享配额
+        return AsyncSingleFlightTransport(transport)
+
+    return httpx.AsyncClient(transport=PerLoopAsyncTransport(build_transport),
+                             timeout=httpx.Timeout(60.0, connect=10.0))
+
+
+@lru_cache(maxsize=None)
+def get_http_client() -> httpx.Client:
+    """进程内共享的同步 HTTP 客户端（使用默认限流器）"""
+    return build_http_client(get_rate_limiter())
+
+
+@lru_cache(maxsize=None)
+def get_async_http_client() -> httpx.AsyncClient:
+    """进程内共享的异步 HTTP 客户端（与同步客户端配置相同，共用同一个限流器；连接池按事件循环区分）"""
+    return build_async_http_client(get_rate_limiter())
+
+
+def _with_usage_handler(callbacks: Callbacks) -> Callbacks:
+    """在调用方传入的 callbacks 基础上挂载共享的缓存命中统计（不修改调用方的列表/管理器）"""
+    handler = get_prompt_cache_usage()
+    if callbacks is None:
+        return [handler]
+    if isinstance(callbacks, BaseCallbackManager):
+        if handler in callbacks.handlers:
+            return callbacks
+        manager = callbacks.copy()
+        manager.add_handler(handler, inherit=True)
+        return manager
+    return list(callbacks) if handler in callbacks else [*callbacks, handler]
+
+
+def get_chat_model(api_key: Optional[str] = None, base_url: Optional[str] = None, **kwargs) -> ChatOpenAI:
+    """
+    创建使用共享连接池的 ChatOpenAI，参数与 ChatOpenAI 相同
+    :param api_key: 不传时读取环境变量 GPTSAPI_API_KEY
+    :param base_url: 不传时使用 GPTSAPI_BASE_URL；也未配置时为 None，即 ChatOpenAI 的默认端点
+    """
+    kwargs.setdefault("model", "gpt-3.5-turbo")
+    kwargs.setdefault("max_retries", 0)  # 重试由传输层统一调度
+    kwargs.setdefault("stream_usage", True)  # 流式调用（如 Agent 循环）也返回 usage，用于统计缓存命中
+    kwargs["callbacks"] = _with_usage_handler(kwargs.get("callbacks"))
+    return ChatOpenAI(
+        api_key=api_key or os.getenv(DEFAULT_API_KEY_ENV),
+        base_url=base_url or DEFAULT_BASE_URL,  # None 时由 ChatOpenAI 使用其默认端点
+        http_client=get_http_client(),
+        http_async_client=get_async_http_client(),
+        **kwargs
+    )
+
+
+# ChatOpenAI 中由 http_client/http_async_client 派生的客户端字段，重建实例时不沿用
+_DERIVED_CLIENT_FIELDS = {"client", "async_client", "root_client", "root_async_client"}
+
+
+def with_rate_limit(llm: ChatOpenAI, limiter: Optional[AdaptiveRateLimiter] = None) -> ChatOpenAI:
+    """
+    为已有的 ChatOpenAI 实例启用共享连接池与限流：按原参数重建实例，只替换 HTTP 客户端
+    :param limiter: 不传时使用进程内共享的默认限流器（与 get_chat_model 创建的模型共用配额）
+    """
+    if limiter is None:
+        http_client, http_async_client = get_http_client(), get_async_http_client()
+    else:
+        http_client, http_async_client = build_http_client(limiter), build_async_http_client(limiter)
+    params = llm.model_dump()
+    # model_dump 不包含 exclude 字段（callbacks/tags/metadata/cache/verbose 等），逐个带上，避免重建时被丢掉；
+    # client/async_client 等由 http_client 派生的字段不带，按新的 http_client 重新创建
+    params.update({name: getattr(llm, name) for name, field in type(llm).model_fields.items()
+                   if field.exclude and name not in _DERIVED_CLIENT_FIELDS})
+    params["callbacks"] = _with_usage_handler(llm.callbacks)  # 与 get_chat_model 一样记录缓存命中
+    params.update(http_client=http_client, http_async_client=http_async_client, max_retries=0)
+    return type(llm)(**params)
+
+
+def _warm_up_url(base_url: Optional[str]) -> str:
+    # 与 get_chat_model 使用同一端点：都未配置时为 openai 客户端的默认端点
+    return base_url or DEFAULT_BASE_URL or os.getenv("OPENAI_BASE_URL") or "https://api.openai.com/v1"
+
+
+def warm_up(base_url: Optional[str] = None):
+    """预先建立到 LLM 端点的连接（TCP + TLS），放回同步连接池供后续请求复用；失败不影响后续调用"""
+    try:
+        get_http_client().head(_warm_up_url(base_url), timeout=5)
+    except httpx.HTTPError as e:
+        print(f"⚠️  LLM 连接预热失败：{str(e)}")
+
+
+async def awarm_up(base_url: Optional[str] = None):
+    """warm_up 的异步版本：预热当前事件循环的异步连接池（ainvoke/astream 使用），需在之后处理请求的循环中调用"""
+    try:
+        await get_async_http_client().head(_warm_up_url(base_url), timeout=5)
+    except httpx.HTTPError as e:
+        print(f"⚠️  LLM 连接预热失败：{str(e)}")
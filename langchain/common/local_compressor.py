@@ -0,0 +1,99 @@
+"""
+本地上下文压缩器（替代 LLMChainExtractor）
+
+LLMChainExtractor 对每个检索片段都要额外调用一次 LLM；这里改为在本地对句子打分：
+- embedding 模式：问题向量与句子向量的余弦相似度（可复用带缓存的嵌入模型）；
+- cross_encoder 模式：CPU 上运行的交叉编码器重排模型，相关性判断更准；
+按得分从高到低保留句子，直到达到 token 预算，再按原文顺序拼回片段，耗时通常在毫秒级。
+与 LLMChainExtractor 一样实现 BaseDocumentCompressor，可直接放入 ContextualCompressionRetriever。
+"""
+import math
+import re
+from typing import List, Optional, Sequence
+
+from langchain_core.callbacks import Callbacks
+from langchain_core.documents import BaseDocumentCompressor, Document
+from langchain_core.embeddings import Embeddings
+from pydantic import ConfigDict, PrivateAttr
+
+from common.token_counter import DEFAULT_MODEL, count_tokens
+
+# 按中英文句末标点/换行切句（保留标点）
+_SENTENCE_SPLIT = re.compile(r"(?<=[。！？!?；;\n])")
+
+
+def split_sentences(text: str) -> List[str]:
+    return [s for s in _SENTENCE_SPLIT.split(text) if s.strip()]
+
+
+class LocalSentenceCompressor(BaseDocumentCompressor):
+    """
+    句子级本地压缩器
+    :param mode: "embedding" 或 "cross_encoder"
+    :param embeddings: embedding 模式使用的嵌入模型
+    :param cross_encoder_model: cross_encoder 模式使用的模型名
+    :param threshold: 句子保留阈值（embedding 为余弦相似度；cross_encoder 为 sigmoid 后的相关概率）
+    :param token_budget: 所有片段压缩后的总 token 上限
+    :param model_name: 计算 token 时使用的目标模型分词器
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    mode: str = "embedding"
+    embeddings: Optional[Embeddings] = None
+    cross_encoder_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # 多语言（含中文）
+    threshold: float = 0.3
+    token_budget: int = 800
+    model_name: str = DEFAULT_MODEL
+
+    _cross_encoder = PrivateAttr(default=None)
+
+    def _score(self, query: str, sentences: List[str]) -> List[float]:
+        if self.mode == "cross_encoder":
+            if self._cross_encoder is None:
+                from sentence_transformers import CrossEncoder
+                self._cross_encoder = CrossEncoder(self.cross_encoder_model, device="cpu")
+            logits = self._cross_encoder.predict([(query, s) for s in sentences])
+            return [1 / (1 + math.exp(-float(x))) for x in logits]
+
+        if self.embeddings is None:
+            raise ValueError("embedding 模式需要传入 embeddings")
+        query_vector = self.embeddings.embed_query(query)
+        query_norm = math.sqrt(sum(x * x for x in query_vector)) or 1.0
+        scores = []
+        for vector in self.embeddings.embed_documents(sentences):
+            norm = math.sqrt(sum(x * x for x in vector)) or 1.0
+            scores.append(sum(a * b for a, b in zip(query_vector, vector)) / (query_norm * norm))
+        return scores
+
+    def compress_documents(self, documents: Sequence[Document], query: str,
+                           callbacks: Optional[Callbacks] = None) -> Sequence[Document]:
+        # 所有片段的句子一次性打分（批量推理）
+        sentences = []  # (片段序号, 句内序号, 句子)
+        for doc_idx, doc in enumerate(documents):
+            for sent_idx, sentence in enumerate(split_sentences(doc.page_content)):
+                sentences.append((doc_idx, sent_idx, sentence))
+        if not sentences:
+            return []
+        scores = self._score(query, [s for _, _, s in sentences])
+
+        # 全局按得分贪心选句，直到 token 预算用完
+        kept, used_tokens = {}, 0
+        for (doc_idx, sent_idx, sentence), score in sorted(zip(sentences, scores), key=lambda x: -x[1]):
+            if score < self.threshold:
+                break
+            tokens = count_tokens(sentence, self.model_name)
+            if used_tokens + tokens > self.token_budget:
+                continue
+            used_tokens += tokens
+            kept.setdefault(doc_idx, []).append((sent_idx, sentence, score))
+
+        # 按原文顺序拼回每个片段，丢弃没有相关句子的片段
+        compressed = []
+        for doc_idx in sorted(kept, key=lambda i: -max(s for _, _, s in kept[i])):
+            items = sorted(kept[doc_idx])
+            doc = documents[doc_idx]
+            compressed.append(Document(
+                page_content="".join(sentence for _, sentence, _ in items),
+                metadata={**doc.metadata, "score": max(score for _, _, score in items)}
+            ))
+        return compressed
@@ -0,0 +1,80 @@
+"""
+并行任务流式输出（RunnableParallel 的流式版本）
+
+RunnableParallel.invoke 要等所有分支都完成才返回，界面上的等待时间等于最慢的那个分支。
+这里把各分支作为独立任务并发执行，按完成顺序逐个产出：
+- 分段模式（默认）：某个分支完成即产出 {"key", "type": "done", "content": 完整结果}；
+- token 模式（stream_tokens=True）：各分支的 token 交错产出 {"key", "type": "token", "content": 片段}，
+  分支结束时再产出一条 done 事件；
+- 每个分支可设置超时：超时的分支被取消并产出 {"type": "timeout", "content": 已生成的部分（分段模式为 None）}，
+  不会拖住其他分支；分支出错时产出 {"type": "error", "content": None, "error": 异常}，其他分支照常输出。
+
+用法：
+    async for event in astream_parallel(marketing_tasks, {"flower_type": "绣球花"}, timeout=10):
+        print(event["key"], event["type"], event["content"])
+"""
+import asyncio
+from typing import AsyncIterator, Dict, Mapping, Optional
+
+from langchain_core.runnables import Runnable
+
+
+async def _run_task(key: str, runnable: Runnable, inputs, queue: asyncio.Queue, stream_tokens: bool,
+                    timeout: Optional[float]):
+    chunks = []
+
+    async def run():
+        if not stream_tokens:
+            return await runnable.ainvoke(inputs)
+        async for chunk in runnable.astream(inputs):
+            chunks.append(chunk)
+            queue.put_nowait({"key": key, "type": "token", "content": chunk})
+        return "".join(chunks)
+
+    try:
+        event = {"key": key, "type": "done", "content": await asyncio.wait_for(run(), timeout)}
+    except asyncio.TimeoutError:
+        event = {"key": key, "type": "timeout", "content": "".join(chunks) if stream_tokens else None}
+    except Exception as e:
+        event = {"key": key, "type": "error", "content": None, "error": e}
+    queue.put_nowait(event)
+
+
+async def astream_parallel(tasks: Mapping[str, Runnable], inputs, stream_tokens: bool = False,
+                           timeout: Optional[float] = None,
+                           timeouts: Optional[Dict[str, float]] = None) -> AsyncIterator[Dict]:
+    """
+    并发执行多个分支，按完成顺序产出事件
+    :param tasks: {分支名: Runnable}（与 RunnableParallel 的参数相同）
+    :param inputs: 所有分支共用的输入
+    :param stream_tokens: 是否交错产出各分支的 token
+    :param timeout: 每个分支的默认超时（秒），None 表示不限制
+    :param timeouts: 按分支单独设置的超时，覆盖 timeout
+    """
+    timeouts = timeouts or {}
+    queue: asyncio.Queue = asyncio.Queue()
+    running = [
+        asyncio.create_task(_run_task(key, runnable, inputs, queue, stream_tokens, timeouts.get(key, timeout)))
+        for key, runnable in tasks.items()
+    ]
+    remaining = len(running)
+    try:
+        while remaining:
+            event = await queue.get()
+            if event["type"] != "token":
+                remaining -= 1
+            yield event
+    finally:
+        # 调用方提前退出时取消仍在运行的分支
+        for task in running:
+            task.cancel()
+        await asyncio.gather(*running, return_exceptions=True)
+
+
+async def ainvoke_parallel(tasks: Mapping[str, Runnable], inputs, timeout: Optional[float] = None,
+                           timeouts: Optional[Dict[str, float]] = None, default=None) -> Dict:
+    """等价于 RunnableParallel.ainvoke，但超时/出错的分支取 default，不影响其他分支的结果"""
+    results = {}
+    async for event in astream_parallel(tasks, inputs, timeout=timeout, timeouts=timeouts):
+        results[event["key"]] = event["content"] if event["type"] == "done" else default
+    return {key: results[key] for key in tasks}
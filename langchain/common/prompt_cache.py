@@ -0,0 +1,167 @@
+"""
+服务端 prompt 前缀缓存（prompt caching）支持
+
+Agent 每轮推理都会重新发送同一段几百 token 的静态 system prompt（max_iterations=5 时同一前缀最多发送 5 次）。
+各家模型服务对重复前缀都有缓存，命中部分的输入 token 更便宜、首 token 更快，前提是前缀逐字节一致：
+- OpenAI：自动缓存 ≥1024 token 的相同前缀，无需标记，只要消息顺序稳定（静态内容在前、变化内容在后）；
+- Anthropic（Claude）：需要在消息中用 cache_control 显式标记缓存断点。
+
+PromptCacheTransport 放在共享 HTTP 传输层（见 common.llm_factory），对 Claude 模型的请求自动加两个断点：
+开头连续 system 消息的末尾（静态前缀，含 tools 定义）和最后一条消息（Agent 下一轮推理可复用本轮的全部上下文）。
+其他模型的请求体保持不变。
+
+PromptCacheUsageHandler 是回调：按次记录 usage 中的 cache_read / cache_creation token，统计命中率。
+"""
+import json
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+import httpx
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+_CACHE_CONTROL = {"type": "ephemeral"}
+
+
+def supports_cache_control(model: str) -> bool:
+    """需要显式标记 cache_control 的模型（OpenAI 系列为自动前缀缓存，无需标记）"""
+    return "claude" in (model or "").lower()
+
+
+def _mark(message: Dict[str, Any]) -> bool:
+    content = message.get("content")
+    if isinstance(content, str) and content:
+        message["content"] = [{"type": "text", "text": content, "cache_control": _CACHE_CONTROL}]
+        return True
+    if isinstance(content, list) and content and isinstance(content[-1], dict):
+        content[-1]["cache_control"] = _CACHE_CONTROL
+        return True
+    return False
+
+
+def add_cache_breakpoints(payload: Dict[str, Any]) -> bool:
+    """
+    在 chat completions 请求体中加缓存断点（原地修改），返回是否有改动；已有 cache_control 时不重复标记
+    """
+    messages: List[Dict[str, Any]] = payload.get("messages") or []
+    if not messages or any(isinstance(part, dict) and "cache_control" in part
+                           for message in messages if isinstance(message.get("content"), list)
+                           for part in message["content"]):
+        return False
+    prefix_end = 0
+    while prefix_end < len(messages) and messages[prefix_end].get("role") in ("system", "developer"):
+        prefix_end += 1
+    marked = False
+    if prefix_end:
+        marked = _mark(messages[prefix_end - 1])
+    if len(messages) > prefix_end:
+        marked = _mark(messages[-1]) or marked
+    return marked
+
+
+def _rewrite(request: httpx.Request, body: bytes) -> Optional[httpx.Request]:
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return None
+    if not isinstance(payload, dict) or not supports_cache_control(payload.get("model")):
+        return None
+    if not add_cache_breakpoints(payload):
+        return None
+    headers = request.headers.copy()
+    headers.pop("content-length", None)
+    return httpx.Request(request.method, request.url, headers=headers,
+                         content=json.dumps(payload, ensure_ascii=False).encode("utf-8"),
+                         extensions=request.extensions)
+
+
+class PromptCacheTransport(httpx.BaseTransport):
+    """同步传输层：为支持的模型标记缓存断点"""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+        self.stats = {"marked": 0}
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            rewritten = _rewrite(request, request.read())
+            if rewritten is not None:
+                self.stats["marked"] += 1
+                request = rewritten
+        return self._transport.handle_request(request)
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncPromptCacheTransport(httpx.AsyncBaseTransport):
+    """异步传输层：为支持的模型标记缓存断点"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self.stats = {"marked": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method == "POST":
+            rewritten = _rewrite(request, await request.aread())
+            if rewritten is not None:
+                self.stats["marked"] += 1
+                request = rewritten
+        return await self._transport.handle_async_request(request)
+
+    async def aclose(self):
+        await self._transport.aclose()
+
+
+class PromptCacheUsageHandler(BaseCallbackHandler):
+    """
+    记录每次调用的缓存命中 token（来自 usage_metadata.input_token_details）
+    :param max_records: 保留的最近调用记录数
+    """
+    run_inline = True
+
+    def __init__(self, max_records: int = 1000):
+        self.records: deque = deque(maxlen=max_records)
+        self.stats = {"calls": 0, "input_tokens": 0, "cache_read_tokens": 0, "cache_creation_tokens": 0}
+        self._lock = threading.Lock()
+
+    def on_llm_end(self, response: LLMResult, **kwargs) -> None:
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None)
+                if not usage:
+                    continue
+                details = usage.get("input_token_details") or {}
+                record = {
+                    "model": (getattr(generation.message, "response_metadata", None) or {}).get("model_name"),
+                    "input_tokens": usage.get("input_tokens", 0),
+                    "cache_read_tokens": details.get("cache_read") or 0,
+                    "cache_creation_tokens": details.get("cache_creation") or 0
+                }
+                with self._lock:
+                    self.records.append(record)
+                    self.stats["calls"] += 1
+                    for key in ("input_tokens", "cache_read_tokens", "cache_creation_tokens"):
+                        self.stats[key] += record[key]
+
+    def hit_ratio(self) -> float:
+        """输入 token 中命中缓存的比例"""
+        total = self.stats["input_tokens"]
+        return self.stats["cache_read_tokens"] / total if total else 0.0
+
+    def summary(self) -> str:
+        return (f"{self.stats['calls']} 次调用，输入 {self.stats['input_tokens']} tokens，"
+                f"缓存命中 {self.stats['cache_read_tokens']} tokens（{self.hit_ratio():.0%}），"
+                f"写入缓存 {self.stats['cache_creation_tokens']} tokens")
+
+
+_usage_handler: Optional[PromptCacheUsageHandler] = None
+
+
+def get_prompt_cache_usage() -> PromptCacheUsageHandler:
+    """进程内共享的缓存命中统计（get_chat_model 创建的模型默认挂载）"""
+    global _usage_handler
+    if _usage_handler is None:
+        _usage_handler = PromptCacheUsageHandler()
+    return _usage_handler
@@ -0,0 +1,292 @@
+"""
+LLM 调用自适应限流 + 重试调度（RPM + TPM 双令牌桶）
+
+各 demo 原来只靠 timeout 和 openai SDK 自带的重试，多个并发调用之间没有协调：
+突发流量触发 429 后，所有调用在同一时刻重试，吞吐反而下降。这里在共享 HTTP 传输层统一处理：
+- 每个请求按「预估 token 数」同时从 RPM、TPM 两个令牌桶预约额度，额度不足时排队等待
+  （允许预约为负，后来者自动排在前面的请求之后，不会同时醒来）；
+- 非流式响应返回后，按 usage.total_tokens 修正预估误差；
+- 收到 429 时：按 Retry-After 暂停所有调用方，并把速率减半（AIMD），之后每次成功逐步恢复；
+- 429/5xx/连接错误按「指数退避 + 全抖动」重试，避免重试风暴。
+
+通过 common.llm_factory.get_chat_model 创建的模型默认已启用；任意已有的 ChatOpenAI 实例可用
+llm_factory.with_rate_limit(llm) 包装。
+"""
+import asyncio
+import json
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+from common.token_counter import count_tokens
+
+# 默认配额（按所用账号/代理的限额调整，可通过环境变量覆盖）
+DEFAULT_RPM = float(os.getenv("LLM_RPM", "500"))
+DEFAULT_TPM = float(os.getenv("LLM_TPM", "200000"))
+DEFAULT_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "4"))
+
+_RETRY_STATUS = {408, 409, 429, 500, 502, 503, 504}
+_DEFAULT_COMPLETION_TOKENS = 256  # 请求未指定 max_tokens 时，按此估算输出长度
+
+
+def backoff_delay(attempt: int, base: float = 0.5, cap: float = 30.0) -> float:
+    """指数退避 + 全抖动：在 [0, min(cap, base * 2^attempt)] 内均匀取值"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def parse_retry_after(headers: httpx.Headers) -> Optional[float]:
+    """解析 retry-after-ms / Retry-After（秒数或 HTTP 日期），返回需等待的秒数"""
+    if "retry-after-ms" in headers:
+        try:
+            return float(headers["retry-after-ms"]) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        try:
+            return max(parsedate_to_datetime(value).timestamp() - time.time(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+
+def estimate_request_tokens(body: bytes) -> int:
+    """按请求体估算本次调用消耗的 token 数：输入消息 + 最大输出长度"""
+    try:
+        payload = json.loads(body)
+    except (ValueError, UnicodeDecodeError):
+        return _DEFAULT_COMPLETION_TOKENS
+    model = payload.get("model") or "gpt-3.5-turbo"
+    prompt_tokens = 0
+    for message in payload.get("messages", []):
+        content = message.get("content")
+        if isinstance(content, list):  # 多模态/分段内容
+            content = "".join(part.get("text", "") for part in content if isinstance(part, dict))
+        prompt_tokens += count_tokens(content or "", model) + 4
+    completion_tokens = payload.get("max_completion_tokens") or payload.get("max_tokens") or _DEFAULT_COMPLETION_TOKENS
+    return prompt_tokens + completion_tokens
+
+
+class _Bucket:
+    """令牌桶：每秒补充 rate 个，容量为 capacity；允许预约为负（欠账由后续请求排队偿还）"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.max_rate = per_minute / 60
+        self.rate = self.max_rate
+        self.burst_seconds = burst_seconds
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    @property
+    def capacity(self) -> float:
+        return self.rate * self.burst_seconds
+
+    def reserve(self, cost: float, now: float) -> float:
+        """扣除额度，返回需要等待的秒数"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        self.level -= cost
+        return max(-self.level / self.rate, 0.0)
+
+
+class AdaptiveRateLimiter:
+    """
+    RPM + TPM 自适应限流器（线程安全，同一个实例可同时用于同步线程和 asyncio）
+    :param rpm: 每分钟请求数上限
+    :param tpm: 每分钟 token 数上限
+    :param burst_seconds: 允许的突发量（相当于多少秒的配额）
+    :param min_rate_ratio: 收到 429 后速率最低降到配置值的比例
+    """
+
+    def __init__(self, rpm: float = DEFAULT_RPM, tpm: float = DEFAULT_TPM, burst_seconds: float = 5.0,
+                 min_rate_ratio: float = 0.1):
+        self.requests = _Bucket(rpm, burst_seconds)
+        self.tokens = _Bucket(tpm, burst_seconds)
+        self.min_rate_ratio = min_rate_ratio
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"requests": 0, "throttled": 0, "rate_limited": 0, "retries": 0}
+
+    def reserve(self, tokens: int) -> float:
+        """预约一次调用的额度，返回调用前需要等待的秒数"""
+        with self._lock:
+            now = time.monotonic()
+            wait = max(self.requests.reserve(1, now), self.tokens.reserve(tokens, now))
+            if self._blocked_until > now:
+                # 暂停期间的调用在恢复时刻附近随机错开，避免同时醒来
+                wait = max(wait, self._blocked_until - now + random.uniform(0, 1))
+            self.stats["requests"] += 1
+            if wait > 0:
+                self.stats["throttled"] += 1
+            return wait
+
+    def acquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int):
+        wait = self.reserve(tokens)
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+    def adjust(self, delta_tokens: int):
+        """用实际消耗修正预估值（delta 为 实际 - 预估）"""
+        with self._lock:
+            self.tokens.level -= delta_tokens
+
+    def on_rate_limited(self, retry_after: Optional[float]):
+        """收到 429：暂停到 Retry-After 之后，速率减半"""
+        with self._lock:
+            self.stats["rate_limited"] += 1
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+            for bucket in (self.requests, self.tokens):
+                bucket.rate = max(bucket.rate * 0.5, bucket.max_rate * self.min_rate_ratio)
+
+    def on_success(self):
+        """调用成功：速率线性恢复（每次 +5%），直到配置值"""
+        with self._lock:
+            for bucket in (self.requests, self.tokens):
+                if bucket.rate < bucket.max_rate:
+                    bucket.rate = min(bucket.rate + bucket.max_rate * 0.05, bucket.max_rate)
+
+
+_default_limiter: Optional[AdaptiveRateLimiter] = None
+
+
+def get_rate_limiter() -> AdaptiveRateLimiter:
+    """进程内共享的默认限流器"""
+    global _default_limiter
+    if _default_limiter is None:
+        _default_limiter = AdaptiveRateLimiter()
+    return _default_limiter
+
+
+def _is_stream(body: bytes) -> bool:
+    try:
+        return bool(json.loads(body).get("stream"))
+    except (ValueError, UnicodeDecodeError, AttributeError):
+        return False
+
+
+def _usage_tokens(raw: bytes, headers: httpx.Headers) -> Optional[int]:
+    try:
+        # 用临时 Response 按 Content-Encoding 解码原始响应体
+        return json.loads(httpx.Response(200, headers=headers, content=raw).content)["usage"]["total_tokens"]
+    except (ValueError, KeyError, TypeError, httpx.DecodingError):
+        return None
+
+
+def _buffered(response: httpx.Response, raw: bytes) -> httpx.Response:
+    """原始响应体已读出：换成可重复读取的内存流，交给上层（及 single-flight）继续使用"""
+    return httpx.Response(response.status_code, headers=response.headers, stream=httpx.ByteStream(raw),
+                          extensions=response.extensions)
+
+
+class RateLimitedTransport(httpx.BaseTransport):
+    """同步传输层：限流 + 重试（放在按主机限并发的传输层之外，退避等待时不占用并发名额）"""
+
+    def __init__(self, transport: httpx.BaseTransport, limiter: AdaptiveRateLimiter,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        self._transport = transport
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        body = request.read()
+        estimated = estimate_request_tokens(body)
+        stream = _is_stream(body)
+        for attempt in range(self.max_retries + 1):
+            self.limiter.acquire(estimated)
+            try:
+                response = self._transport.handle_request(request)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.stats["retries"] += 1
+                time.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code in _RETRY_STATUS and attempt < self.max_retries:
+                retry_after = parse_retry_after(response.headers)
+                if response.status_code == 429:
+                    self.limiter.on_rate_limited(retry_after)
+                response.close()
+                self.limiter.stats["retries"] += 1
+                time.sleep(max(retry_after or 0.0, backoff_delay(attempt)))
+                continue
+
+            if response.status_code < 400:
+                self.limiter.on_success()
+                if not stream:
+                    try:
+                        raw = b"".join(response.stream)
+                    finally:
+                        response.close()
+                    response = _buffered(response, raw)
+                    actual = _usage_tokens(raw, response.headers)
+                    if actual is not None:
+                        self.limiter.adjust(actual - estimated)
+            return response
+
+    def close(self):
+        self._transport.close()
+
+
+class AsyncRateLimitedTransport(httpx.AsyncBaseTransport):
+    """异步传输层：限流 + 重试"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport, limiter: AdaptiveRateLimiter,
+                 max_retries: int = DEFAULT_MAX_RETRIES):
+        self._transport = transport
+        self.limiter = limiter
+        self.max_retries = max_retries
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        estimated = estimate_request_tokens(body)
+        stream = _is_stream(body)
+        for attempt in range(self.max_retries + 1):
+            await self.limiter.aacquire(estimated)
+            try:
+                response = await self._transport.handle_async_request(request)
+            except httpx.TransportError:
+                if attempt == self.max_retries:
+                    raise
+                self.limiter.stats["retries"] += 1
+                await asyncio.sleep(backoff_delay(attempt))
+                continue
+
+            if response.status_code in _RETRY_STATUS and attempt < self.max_retries:
+                retry_after = parse_retry_after(response.headers)
+                if response.status_code == 429:
+                    self.limiter.on_rate_limited(retry_after)
+                await response.aclose()
+                self.limiter.stats["retries"] += 1
+                await asyncio.sleep(max(retry_after or 0.0, backoff_delay(attempt)))
+                continue
+
+            if response.status_code < 400:
+                self.limiter.on_success()
+                if not stream:
+                    try:
+                        raw = b"".join([chunk async for chunk in response.stream])
+                    finally:
+                        await response.aclose()
+                    response = _buffered(response, raw)
+                    actual = _usage_tokens(raw, response.headers)
+                    if actual is not None:
+                        self.limiter.adjust(actual - estimated)
+            return response
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,152 @@
+"""
+RAG 问答两级缓存（放在 LLM 调用之前）
+
+- 一级（精确）：规范化问题 + 检索上下文哈希 完全一致时直接返回答案；
+- 二级（语义）：问题向量与已缓存问题的余弦相似度 ≥ 阈值时返回答案（近似重复问题）；
+- 多轮对话传入 history：精确键包含对话历史，语义匹配只在对话历史相同的条目之间进行
+  （追问依赖上文，历史不同的相似问题答案不能互用）；
+- 两级缓存都有 TTL 过期 + LRU 容量淘汰；
+- 文档重新索引后，调用 invalidate_sources 删除引用了这些文档的缓存答案。
+"""
+import hashlib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from common.embedding_cache import normalize_text
+
+# 问句末尾的标点不影响语义
+_TRAILING_PUNCT = re.compile(r"[\s?？!！。.~～]+$")
+
+
+def normalize_question(question: str) -> str:
+    return _TRAILING_PUNCT.sub("", normalize_text(question).lower())
+
+
+class _TTLLRUStore:
+    """OrderedDict 实现的 LRU，条目带过期时间"""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries: "OrderedDict[str, dict]" = OrderedDict()
+
+    def get(self, key: str) -> Optional[dict]:
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.time():
+            del self.entries[key]
+            return None
+        self.entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: dict):
+        entry["expires_at"] = time.time() + self.ttl_seconds
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def purge_expired(self):
+        now = time.time()
+        for key in [k for k, e in self.entries.items() if e["expires_at"] < now]:
+            del self.entries[key]
+
+    def remove_where(self, predicate) -> int:
+        keys = [k for k, e in self.entries.items() if predicate(e)]
+        for key in keys:
+            del self.entries[key]
+        return len(keys)
+
+
+class ResponseCache:
+    """
+    精确 + 语义 两级答案缓存
+    :param embeddings: 用于语义匹配的嵌入模型；为 None 时只启用精确缓存
+    :param similarity_threshold: 语义命中阈值（余弦相似度）
+    :param ttl_seconds: 缓存有效期（秒）
+    :param max_entries: 每级缓存的最大条目数
+    """
+
+    def __init__(self, embeddings: Optional[Embeddings] = None, similarity_threshold: float = 0.95,
+                 ttl_seconds: float = 3600, max_entries: int = 1000):
+        self.embeddings = embeddings
+        self.similarity_threshold = similarity_threshold
+        self.exact = _TTLLRUStore(max_entries, ttl_seconds)
+        self.semantic = _TTLLRUStore(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+
+    @staticmethod
+    def _history_hash(history: str) -> str:
+        return hashlib.sha256(history.encode("utf-8")).hexdigest() if history else ""
+
+    @staticmethod
+    def _exact_key(question: str, context: str, history: str = "") -> str:
+        context_hash = hashlib.sha256(context.encode("utf-8")).hexdigest()
+        key = f"{normalize_question(question)}\x00{context_hash}\x00{ResponseCache._history_hash(history)}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest()
+
+    def _question_vector(self, question: str) -> np.ndarray:
+        vector = np.asarray(self.embeddings.embed_query(normalize_question(question)), dtype=np.float32)
+        return vector / (np.linalg.norm(vector) or 1.0)
+
+    def lookup(self, question: str, context: str, history: str = "") -> Optional[str]:
+        """
+        查询缓存，命中返回答案，未命中返回 None
+        :param history: 生成答案时使用的对话历史（文本形式）；单轮问答为空
+        """
+        with self._lock:
+            entry = self.exact.get(self._exact_key(question, context, history))
+            if entry is not None:
+                self.stats["exact_hits"] += 1
+                return entry["answer"]
+
+        if self.embeddings is not None:
+            query_vector = self._question_vector(question)
+            with self._lock:
+                self.semantic.purge_expired()
+                scope = self._history_hash(history)
+                keys = [k for k, e in self.semantic.entries.items() if e["scope"] == scope]
+                if keys:
+                    matrix = np.stack([self.semantic.entries[k]["vector"] for k in keys])
+                    scores = matrix @ query_vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.similarity_threshold:
+                        self.stats["semantic_hits"] += 1
+                        return self.semantic.get(keys[best])["answer"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def store(self, question: str, context: str, answer: str, sources: Iterable[str] = (), history: str = ""):
+        """写入两级缓存；sources 为答案所依据的文档，用于重新索引后的失效；history 同 lookup"""
+        sources = frozenset(s for s in sources if s)
+        vector = self._question_vector(question) if self.embeddings is not None else None
+        with self._lock:
+            self.exact.put(self._exact_key(question, context, history), {"answer": answer, "sources": sources})
+            if vector is not None:
+                scope = self._history_hash(history)
+                self.semantic.put(f"{scope}\x00{normalize_question(question)}",
+                                  {"answer": answer, "sources": sources, "vector": vector, "scope": scope})
+
+    def invalidate_sources(self, sources: Iterable[str]) -> int:
+        """删除引用了指定文档的缓存条目，返回删除的条目数"""
+        sources = set(sources)
+        if not sources:
+            return 0
+        with self._lock:
+            removed = self.exact.remove_where(lambda e: e["sources"] & sources)
+            removed += self.semantic.remove_where(lambda e: e["sources"] & sources)
+        return removed
+
+    def hit_rate(self) -> float:
+        total = sum(self.stats.values())
+        return (self.stats["exact_hits"] + self.stats["semantic_hits"]) / total if total else 0.0
@@ -0,0 +1,231 @@
+"""
+多会话对话历史存储（多个 demo 共用）
+
+原来各 demo 用函数属性/全局字典保存 {session_id: InMemoryChatMessageHistory}，会话数无上限且重启即丢失。
+这里分为两层：
+- 热层：进程内 LRU，只保留最近活跃的 max_sessions 个会话，超出时淘汰最久未访问的会话；
+- 冷层：只追加写入的持久化后端（SQLite 或 JSONL 文件），被淘汰或重启后的会话按需从冷层重新加载。
+  除消息外，冷层还可按 key 保存会话的派生状态（如摘要记忆的摘要与已摘要消息数），恢复时不必重新计算。
+
+SessionStore 实例本身可直接作为 RunnableWithMessageHistory 的 get_session_history：
+    session_store = get_session_store()
+    chain_with_history = RunnableWithMessageHistory(runnable=chain, get_session_history=session_store, ...)
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage, message_to_dict, messages_from_dict
+
+# 存储路径与热层容量（可通过环境变量覆盖）
+DEFAULT_SESSION_PATH = os.getenv(
+    "SESSION_STORE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "session_store.sqlite3")
+)
+DEFAULT_MAX_SESSIONS = int(os.getenv("SESSION_STORE_MAX_SESSIONS", "1000"))
+
+
+class SQLiteMessageBackend:
+    """SQLite 冷层：每条消息一行，只追加；按 (session_id, seq) 顺序读回"""
+
+    def __init__(self, path: str = DEFAULT_SESSION_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS messages (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                message TEXT NOT NULL,
+                created_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session ON messages (session_id, seq)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS session_state (
+                session_id TEXT NOT NULL,
+                key TEXT NOT NULL,
+                value TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (session_id, key)
+            )
+        """)
+        self._conn.commit()
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT message FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+        return messages_from_dict([json.loads(row[0]) for row in rows])
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        now = time.time()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO messages (session_id, message, created_at) VALUES (?, ?, ?)",
+                [(session_id, json.dumps(message_to_dict(m), ensure_ascii=False), now) for m in messages]
+            )
+            self._conn.commit()
+
+    def load_state(self, session_id: str, key: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM session_state WHERE session_id = ? AND key = ?", (session_id, key)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_state(self, session_id: str, key: str, state: dict):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO session_state (session_id, key, value, updated_at) VALUES (?, ?, ?, ?)",
+                (session_id, key, json.dumps(state, ensure_ascii=False), time.time())
+            )
+            self._conn.commit()
+
+    def clear(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            self._conn.execute("DELETE FROM session_state WHERE session_id = ?", (session_id,))
+            self._conn.commit()
+
+
+class JSONLMessageBackend:
+    """文件冷层：每个会话一个 JSONL 文件，每行一条消息，只追加；派生状态每个 key 一个 JSON 文件"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id: str, suffix: str = ".jsonl") -> str:
+        # session_id 可能包含路径分隔符等字符，文件名使用其哈希
+        return os.path.join(self.directory, hashlib.sha256(session_id.encode("utf-8")).hexdigest()[:32] + suffix)
+
+    def _state_path(self, session_id: str, key: str) -> str:
+        return self._path(session_id, f".{key}.json")
+
+    def load(self, session_id: str) -> List[BaseMessage]:
+        path = self._path(session_id)
+        if not os.path.exists(path):
+            return []
+        with self._lock, open(path, "r", encoding="utf-8") as f:
+            # 进程在写入过程中退出时，最后一行可能不完整，跳过
+            records = []
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    continue
+        return messages_from_dict(records)
+
+    def append(self, session_id: str, messages: Sequence[BaseMessage]):
+        lines = "".join(json.dumps(message_to_dict(m), ensure_ascii=False) + "\n" for m in messages)
+        with self._lock, open(self._path(session_id), "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    def load_state(self, session_id: str, key: str) -> Optional[dict]:
+        path = self._state_path(session_id, key)
+        if not os.path.exists(path):
+            return None
+        with self._lock, open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def save_state(self, session_id: str, key: str, state: dict):
+        # 先写临时文件再替换，中途退出时保留上一次的完整状态
+        path = self._state_path(session_id, key)
+        with self._lock:
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(state, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+
+    def clear(self, session_id: str):
+        prefix = os.path.basename(self._path(session_id, ""))
+        with self._lock:
+            for name in os.listdir(self.directory):
+                if name.startswith(prefix):
+                    os.remove(os.path.join(self.directory, name))
+
+
+class PersistentChatMessageHistory(BaseChatMessageHistory):
+    """热层中的单个会话：消息保存在内存列表中，写入时同步追加到冷层"""
+
+    def __init__(self, session_id: str, backend):
+        self.session_id = session_id
+        self.backend = backend
+        self._messages: List[BaseMessage] = backend.load(session_id)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return list(self._messages)
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        messages = list(messages)
+        self.backend.append(self.session_id, messages)
+        self._messages.extend(messages)
+
+    def load_state(self, key: str) -> Optional[dict]:
+        """读取会话的派生状态（如摘要），没有时返回 None"""
+        return self.backend.load_state(self.session_id, key)
+
+    def save_state(self, key: str, state: dict):
+        self.backend.save_state(self.session_id, key, state)
+
+    def clear(self) -> None:
+        self.backend.clear(self.session_id)
+        self._messages = []
+
+
+class SessionStore:
+    """
+    LRU 热层 + 持久化冷层 的会话存储
+    :param backend: 冷层后端（SQLiteMessageBackend / JSONLMessageBackend），默认使用 SQLite
+    :param max_sessions: 热层最多保留的会话数
+    """
+
+    def __init__(self, backend=None, max_sessions: int = DEFAULT_MAX_SESSIONS):
+        self.backend = backend or SQLiteMessageBackend()
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, PersistentChatMessageHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hot_hits": 0, "cold_loads": 0, "evictions": 0}
+
+    def get(self, session_id: str = "default") -> PersistentChatMessageHistory:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is not None:
+                self._sessions.move_to_end(session_id)
+                self.stats["hot_hits"] += 1
+                return history
+            history = PersistentChatMessageHistory(session_id, self.backend)
+            self._sessions[session_id] = history
+            self.stats["cold_loads"] += 1
+            # 被淘汰的会话已全部写入冷层，直接从热层移除即可
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+                self.stats["evictions"] += 1
+            return history
+
+    # 兼容 RunnableWithMessageHistory 的 get_session_history(session_id) 调用方式
+    __call__ = get
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+
+# 同一进程内共享同一个会话存储
+_shared_stores: Dict[str, SessionStore] = {}
+
+
+def get_session_store(path: str = DEFAULT_SESSION_PATH, max_sessions: Optional[int] = None) -> SessionStore:
+    if path not in _shared_stores:
+        _shared_stores[path] = SessionStore(SQLiteMessageBackend(path), max_sessions or DEFAULT_MAX_SESSIONS)
+    return _shared_stores[path]
@@ -0,0 +1,264 @@
+"""
+相同 LLM 请求合并（single-flight）
+
+多个用户同时问同一个问题（同一模型、同样的消息、同样的参数）时，原来每个请求各自调用一次 LLM。
+这里在共享 HTTP 传输层按 (URL, 请求体) 合并正在进行中的相同请求：
+- 第一个请求真正发往上游，之后到达的相同请求直接加入，共用同一次上游调用；
+- 上游响应体由后台任务持续读取并缓存，每个调用方都从头拿到完整的字节流，
+  流式输出（astream/stream）时所有调用方收到相同的 token 流，调用方中途断开不影响其他人；
+- 上游调用结束即从合并表中移除，之后的相同请求重新调用（这里只做合并，不做缓存）；
+- 所有调用方都断开（如投机路由取消落选分支、流式解析提前终止）时，停止上游调用：
+  异步模式取消后台任务，同步模式由后台线程在收到下一个片段时关闭上游响应；
+  被放弃的调用同时立即移出合并表，之后到达的相同请求重新调用，不会加入一个正在停止的调用。
+
+请求体包含模型名、渲染后的消息和全部参数，因此只有完全相同的调用才会合并。
+由 common.llm_factory 放在传输层最外层，被合并的请求不占用限流配额。
+"""
+import asyncio
+import hashlib
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+import httpx
+
+
+def _flight_key(request: httpx.Request, body: bytes) -> str:
+    digest = hashlib.sha256()
+    digest.update(f"{request.method} {request.url}\n".encode("utf-8"))
+    digest.update(request.headers.get("authorization", "").encode("utf-8"))  # 不同账号不合并
+    digest.update(body)
+    return digest.hexdigest()
+
+
+class _Flight:
+    """一次正在进行的上游调用：响应头 + 已读取的响应体片段"""
+
+    def __init__(self):
+        self.status_code: Optional[int] = None
+        self.headers: Optional[httpx.Headers] = None
+        self.extensions: dict = {}
+        self.chunks: List[bytes] = []
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.consumers = 0  # 仍在等待/读取该响应的调用方数
+        self.abandoned = False  # 所有调用方都已断开，上游应停止
+        self.task: Optional[asyncio.Task] = None  # 异步模式的后台任务
+        self.on_abandon: Optional[Callable[[], None]] = None  # 放弃时调用：把自己移出合并表
+
+    def release(self):
+        """一个调用方断开；没有调用方且上游尚未结束时放弃该调用（同步模式需在合并表的锁内调用）"""
+        self.consumers -= 1
+        if self.consumers == 0 and not self.done:
+            self.abandoned = True
+            if self.on_abandon is not None:
+                self.on_abandon()
+            if self.task is not None:
+                self.task.cancel()
+
+
+class _FlightStream(httpx.SyncByteStream):
+    def __init__(self, flight: _Flight, condition: threading.Condition, release: Callable[[], None]):
+        self._flight = flight
+        self._condition = condition
+        self._release = release
+        self._closed = False
+
+    def __iter__(self):
+        index = 0
+        while True:
+            with self._condition:
+                while index >= len(self._flight.chunks) and not self._flight.done:
+                    self._condition.wait()
+                chunks = self._flight.chunks[index:]
+                done = self._flight.done
+            yield from chunks
+            index += len(chunks)
+            if done and index >= len(self._flight.chunks):
+                if self._flight.error is not None:
+                    raise self._flight.error
+                return
+
+    def close(self):
+        if not self._closed:
+            self._closed = True
+            self._release()
+
+
+class SingleFlightTransport(httpx.BaseTransport):
+    """同步传输层：合并进行中的相同 POST 请求"""
+
+    def __init__(self, transport: httpx.BaseTransport):
+        self._transport = transport
+        self._flights: Dict[str, Tuple[_Flight, threading.Condition]] = {}
+        self._lock = threading.Lock()
+        self.stats = {"upstream": 0, "coalesced": 0}
+
+    def handle_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":
+            return self._transport.handle_request(request)
+        key = _flight_key(request, request.read())
+        with self._lock:
+            entry = self._flights.get(key)
+            if entry is None:
+                entry = (_Flight(), threading.Condition())
+                self._flights[key] = entry
+                entry[0].on_abandon = lambda: self._forget(key, entry[0])
+                self.stats["upstream"] += 1
+                threading.Thread(target=self._pump, args=(key, request, *entry), daemon=True).start()
+            else:
+                self.stats["coalesced"] += 1
+            entry[0].consumers += 1  # 与 release 在同一把锁内，不会加入一个刚被放弃的调用
+        flight, condition = entry
+
+        try:
+            with condition:
+                while flight.status_code is None and flight.error is None:
+                    condition.wait()
+        except BaseException:
+            self._release(flight)  # 等待响应头期间被中断
+            raise
+        if flight.status_code is None:
+            self._release(flight)
+            raise flight.error
+        return httpx.Response(flight.status_code, headers=flight.headers,
+                              stream=_FlightStream(flight, condition, lambda: self._release(flight)),
+                              extensions=flight.extensions)
+
+    def _release(self, flight: _Flight):
+        with self._lock:
+            flight.release()
+
+    def _forget(self, key: str, flight: _Flight):
+        """移出合并表（调用方持有 self._lock）；该键已被新的调用占用时不动"""
+        entry = self._flights.get(key)
+        if entry is not None and entry[0] is flight:
+            del self._flights[key]
+
+    def _pump(self, key: str, request: httpx.Request, flight: _Flight, condition: threading.Condition):
+        """后台线程：发起上游请求并持续读取响应体"""
+        try:
+            response = self._transport.handle_request(request)
+            with condition:
+                flight.status_code, flight.headers = response.status_code, response.headers
+                flight.extensions = {k: v for k, v in response.extensions.items() if k != "network_stream"}
+                condition.notify_all()
+            try:
+                for chunk in response.stream:
+                    if flight.abandoned:  # 所有调用方都已断开：关闭上游响应，上游停止生成
+                        break
+                    with condition:
+                        flight.chunks.append(chunk)
+                        condition.notify_all()
+            finally:
+                response.close()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            with self._lock:
+                self._forget(key, flight)
+            with condition:
+                flight.done = True
+                condition.notify_all()
+
+    def close(self):
+        self._transport.close()
+
+
+class _AsyncFlightStream(httpx.AsyncByteStream):
+    def __init__(self, flight: _Flight, condition: asyncio.Condition):
+        self._flight = flight
+        self._condition = condition
+        self._closed = False
+
+    async def __aiter__(self):
+        index = 0
+        while True:
+            async with self._condition:
+                await self._condition.wait_for(lambda: index < len(self._flight.chunks) or self._flight.done)
+                chunks = self._flight.chunks[index:]
+                done = self._flight.done
+            for chunk in chunks:
+                yield chunk
+            index += len(chunks)
+            if done and index >= len(self._flight.chunks):
+                if self._flight.error is not None:
+                    raise self._flight.error
+                return
+
+    async def aclose(self):
+        if not self._closed:
+            self._closed = True
+            self._flight.release()
+
+
+class AsyncSingleFlightTransport(httpx.AsyncBaseTransport):
+    """异步传输层：合并进行中的相同 POST 请求（asyncio.Condition 属于单个事件循环，由 llm_factory 按循环创建）"""
+
+    def __init__(self, transport: httpx.AsyncBaseTransport):
+        self._transport = transport
+        self._flights: Dict[str, Tuple[_Flight, asyncio.Condition]] = {}
+        self._tasks = set()  # 保留后台任务的引用，避免被垃圾回收
+        self.stats = {"upstream": 0, "coalesced": 0}
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST":
+            return await self._transport.handle_async_request(request)
+        key = _flight_key(request, await request.aread())
+        entry = self._flights.get(key)
+        if entry is None:
+            entry = (_Flight(), asyncio.Condition())
+            self._flights[key] = entry
+            entry[0].on_abandon = lambda: self._forget(key, entry[0])
+            self.stats["upstream"] += 1
+            # 上游调用放在独立任务中：第一个调用方被取消时，其他调用方不受影响
+            task = asyncio.create_task(self._pump(key, request, *entry))
+            entry[0].task = task
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+        else:
+            self.stats["coalesced"] += 1
+        flight, condition = entry
+
+        flight.consumers += 1
+        try:
+            async with condition:
+                await condition.wait_for(lambda: flight.status_code is not None or flight.error is not None)
+        except BaseException:
+            flight.release()  # 等待响应头期间被取消
+            raise
+        if flight.status_code is None:
+            flight.release()
+            raise flight.error
+        return httpx.Response(flight.status_code, headers=flight.headers,
+                              stream=_AsyncFlightStream(flight, condition), extensions=flight.extensions)
+
+    async def _pump(self, key: str, request: httpx.Request, flight: _Flight, condition: asyncio.Condition):
+        try:
+            response = await self._transport.handle_async_request(request)
+            async with condition:
+                flight.status_code, flight.headers = response.status_code, response.headers
+                flight.extensions = {k: v for k, v in response.extensions.items() if k != "network_stream"}
+                condition.notify_all()
+            try:
+                async for chunk in response.stream:
+                    async with condition:
+                        flight.chunks.append(chunk)
+                        condition.notify_all()
+            finally:
+                await response.aclose()
+        except BaseException as e:
+            flight.error = e
+        finally:
+            self._forget(key, flight)
+            async with condition:
+                flight.done = True
+                condition.notify_all()
+
+    def _forget(self, key: str, flight: _Flight):
+        """移出合并表；该键已被新的调用占用时不动（被取消的调用结束得比新调用开始晚）"""
+        entry = self._flights.get(key)
+        if entry is not None and entry[0] is flight:
+            del self._flights[key]
+
+    async def aclose(self):
+        await self._transport.aclose()
@@ -0,0 +1,148 @@
+"""
+投机并行路由：分类的同时先启动候选专家链，分类结果出来后保留胜出分支、取消其余分支
+
+串行路由的延迟 = 分类耗时 + 专家回复耗时；投机模式下专家链与分类并行，
+胜出分支在分类期间已经生成的内容直接输出，延迟约为 max(分类耗时, 专家首 token 耗时)。
+代价是落选分支消耗的 token，通过 stats 中的浪费统计（调用次数、输入/输出 token 数）与
+节省的时间（胜出分支的领先时长）一起暴露，便于权衡。
+
+用法（可选模式，默认仍为串行路由）：
+    router = SpeculativeRouter(route_chain, {"养护": chatbot_a_chain, "装饰": chatbot_b_chain}, default_label="养护")
+    async for event in router.astream({"user_query": "..."}):
+        ...  # 先产出 {"route": {...}}，再逐段产出 {"answer": "..."}
+"""
+import asyncio
+import time
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.runnables import Runnable
+
+from common.token_counter import DEFAULT_MODEL, count_message_tokens, count_tokens
+
+_DONE = object()
+
+
+class _TokenTally(BaseCallbackHandler):
+    """统计单个分支已消耗的输入/输出 token"""
+    run_inline = True
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.input_tokens = 0
+        self.output_tokens = 0
+
+    def on_chat_model_start(self, serialized: Dict[str, Any], messages: List[List[Any]], **kwargs) -> None:
+        self.input_tokens += sum(count_message_tokens(m, self.model_name) for batch in messages for m in batch)
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        self.output_tokens += count_tokens(token, self.model_name)
+
+
+class _Branch:
+    """一个投机执行中的专家分支：后台任务把输出写入队列"""
+
+    def __init__(self, chain: Runnable, inputs, model_name: str):
+        self.tally = _TokenTally(model_name)
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.started = time.perf_counter()
+        self.task = asyncio.create_task(self._run(chain, inputs))
+
+    async def _run(self, chain: Runnable, inputs):
+        try:
+            async for chunk in chain.astream(inputs, config={"callbacks": [self.tally]}):
+                self.queue.put_nowait(chunk)
+        except Exception as e:
+            self.queue.put_nowait(e)
+        self.queue.put_nowait(_DONE)
+
+    async def stream(self) -> AsyncIterator:
+        while True:
+            item = await self.queue.get()
+            if item is _DONE:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+
+class SpeculativeRouter:
+    """
+    :param route: 分类 Runnable，输出类别字符串或 {"label": ..., ...}
+    :param branches: {类别: 专家链}，专家链需支持 astream
+    :param default_label: 分类结果不在 branches 中时使用的分支
+    :param speculate: 参与投机的类别（默认全部）；不在其中的类别在分类完成后再启动
+    :param model_name: 统计浪费 token 时使用的分词器
+    """
+
+    def __init__(self, route: Runnable, branches: Dict[str, Runnable], default_label: str,
+                 speculate: Optional[List[str]] = None, model_name: str = DEFAULT_MODEL):
+        self.route = route
+        self.branches = branches
+        self.default_label = default_label
+        self.speculate = speculate if speculate is not None else list(branches)
+        self.model_name = model_name
+        self.stats = {
+            "requests": 0, "speculative_hits": 0, "speculative_calls": 0,
+            "wasted_calls": 0, "wasted_input_tokens": 0, "wasted_output_tokens": 0,
+            "used_input_tokens": 0, "used_output_tokens": 0,
+            "head_start_seconds": 0.0  # 胜出分支在分类完成前已运行的时长（即节省的延迟）
+        }
+
+    async def astream(self, inputs) -> AsyncIterator[Dict]:
+        self.stats["requests"] += 1
+        running = {label: _Branch(self.branches[label], inputs, self.model_name) for label in self.speculate}
+        self.stats["speculative_calls"] += len(running)
+        try:
+            route = await self.route.ainvoke(inputs)
+        except BaseException:
+            await self._cancel(running.values())
+            raise
+        route = route if isinstance(route, dict) else {"label": route}
+        label = route["label"] if route["label"] in self.branches else self.default_label
+
+        winner = running.pop(label, None)
+        # 落选分支立即取消（关闭 HTTP 流，上游停止生成），并计入浪费
+        await self._cancel(running.values())
+        if winner is None:
+            winner = _Branch(self.branches[label], inputs, self.model_name)
+        else:
+            self.stats["speculative_hits"] += 1
+            self.stats["head_start_seconds"] += time.perf_counter() - winner.started
+
+        yield {"route": {**route, "label": label}}
+        try:
+            async for chunk in winner.stream():
+                yield {"answer": chunk}
+        finally:
+            if not winner.task.done():  # 调用方中途退出
+                winner.task.cancel()
+            self.stats["used_input_tokens"] += winner.tally.input_tokens
+            self.stats["used_output_tokens"] += winner.tally.output_tokens
+
+    async def _cancel(self, branches):
+        branches = list(branches)
+        for branch in branches:
+            branch.task.cancel()
+        await asyncio.gather(*(b.task for b in branches), return_exceptions=True)
+        for branch in branches:
+            self.stats["wasted_calls"] += 1
+            self.stats["wasted_input_tokens"] += branch.tally.input_tokens
+            self.stats["wasted_output_tokens"] += branch.tally.output_tokens
+
+    async def ainvoke(self, inputs) -> Dict:
+        """返回 {"route": {...}, "answer": 完整回复}"""
+        result, chunks = {}, []
+        async for event in self.astream(inputs):
+            if "route" in event:
+                result["route"] = event["route"]
+            else:
+                chunks.append(event["answer"])
+        result["answer"] = "".join(chunks)
+        return result
+
+    def wasted_token_ratio(self) -> float:
+        """落选分支消耗的 token 占全部 token 的比例（用于权衡延迟收益与额外成本）"""
+        wasted = self.stats["wasted_input_tokens"] + self.stats["wasted_output_tokens"]
+        used = self.stats["used_input_tokens"] + self.stats["used_output_tokens"]
+        return wasted / (wasted + used) if wasted + used else 0.0
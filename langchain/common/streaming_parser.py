@@ -0,0 +1,134 @@
+"""
+流式增量 Pydantic 解析（边生成边校验，违反约束时提前终止）
+
+PydanticOutputParser 要等模型输出完整 JSON 后才解析、校验：某个字段早就超长了，
+也要等剩余内容全部生成完才报错，浪费的输出 token 和等待时间都算在重试之前。这里改为消费 stream/astream 的片段：
+- 每收到一个片段，按「部分 JSON」解析当前已生成的内容，产出只含已生成字段的部分对象（model_construct）；
+- 字段一结束（后面出现了下一个字段或对象已闭合）立即按该字段的约束校验（类型、min_length 等）；
+- 正在生成的字符串字段一旦超过 max_length 立即判定失败，不等它结束；
+- 校验失败抛出 StreamingValidationError（OutputParserException 的子类），同时关闭模型的流，
+  调用方可以马上带着错误信息重试。关闭流会关闭 HTTP 响应、上游停止生成；经 common.llm_factory 的共享
+  客户端发出、与其他调用方合并的请求，要等所有调用方都断开后才停止（见 common.single_flight）。
+
+用法：
+    async for partial in aparse_stream(chain.astream(inputs), FlowerCopywriting):
+        print(partial)  # 最后一个为完整校验通过的对象
+    result = parse_stream(llm.stream(messages), FlowerCopywriting)  # 同步版本，返回完整对象
+"""
+import json
+from typing import AsyncIterator, Dict, Iterator, Optional, Type, TypeVar
+
+from langchain_core.exceptions import OutputParserException
+from langchain_core.output_parsers import PydanticOutputParser
+from langchain_core.utils.json import parse_partial_json
+from pydantic import BaseModel, ValidationError
+
+T = TypeVar("T", bound=BaseModel)
+
+
+class StreamingValidationError(OutputParserException):
+    """流式解析中途发现字段违反约束"""
+
+    def __init__(self, field: str, message: str, llm_output: str):
+        super().__init__(f"字段 {field} 不符合要求：{message}", llm_output=llm_output)
+        self.field = field
+
+
+def _max_length(field_info) -> Optional[int]:
+    for constraint in field_info.metadata:
+        if getattr(constraint, "max_length", None) is not None:
+            return constraint.max_length
+    return None
+
+
+def _chunk_text(chunk) -> str:
+    content = getattr(chunk, "content", chunk)  # AIMessageChunk 或 StrOutputParser 之后的字符串
+    if isinstance(content, list):
+        return "".join(part.get("text", "") for part in content if isinstance(part, dict))
+    return content if isinstance(content, str) else ""
+
+
+class IncrementalPydanticParser:
+    """
+    增量解析器：逐段 feed 模型输出
+    :param pydantic_object: 目标 Pydantic 模型（字段约束即校验规则）
+    """
+
+    def __init__(self, pydantic_object: Type[T]):
+        self.pydantic_object = pydantic_object
+        self.text = ""
+        self.closed: Dict[str, object] = {}  # 已结束并通过校验的字段
+        self._last: Optional[dict] = None
+
+    def _check_field(self, name: str, value):
+        if name not in self.pydantic_object.model_fields or name in self.closed:
+            return
+        try:
+            self.pydantic_object.__pydantic_validator__.validate_assignment(
+                self.pydantic_object.model_construct(), name, value)
+        except ValidationError as e:
+            raise StreamingValidationError(name, e.errors()[0]["msg"], self.text) from e
+        self.closed[name] = value
+
+    def feed(self, chunk) -> Optional[T]:
+        """加入一段输出；部分结果有变化时返回部分对象，否则返回 None；字段违反约束时抛出 StreamingValidationError"""
+        self.text += _chunk_text(chunk)
+        start = self.text.find("{")
+        if start < 0:
+            return None
+        body = self.text[start:]
+        try:
+            data, _ = json.JSONDecoder().raw_decode(body)
+            complete = True
+        except ValueError:
+            data, complete = parse_partial_json(body), False
+        if not isinstance(data, dict) or data == self._last:
+            return None
+        self._last = data
+
+        keys = list(data)
+        for name in keys if complete else keys[:-1]:  # JSON 按顺序生成：除最后一个外的字段都已结束
+            self._check_field(name, data[name])
+        if not complete and keys:
+            name, value = keys[-1], data[keys[-1]]
+            field_info = self.pydantic_object.model_fields.get(name)
+            limit = _max_length(field_info) if field_info is not None else None
+            if limit is not None and isinstance(value, str) and len(value) > limit:
+                raise StreamingValidationError(name, f"已超过最大长度 {limit}（生成中途终止）", self.text)
+        return self.pydantic_object.model_construct(**{k: v for k, v in data.items()
+                                                        if k in self.pydantic_object.model_fields})
+
+    def finish(self) -> T:
+        """输出结束：按完整规则解析、校验（与 PydanticOutputParser.parse 相同）"""
+        return PydanticOutputParser(pydantic_object=self.pydantic_object).parse(self.text)
+
+
+def parse_stream(chunks: Iterator, pydantic_object: Type[T], on_partial=None) -> T:
+    """
+    同步消费 llm.stream()/chain.stream() 的输出，返回校验通过的完整对象
+    :param on_partial: 每次部分结果更新时的回调（如刷新界面）
+    """
+    parser = IncrementalPydanticParser(pydantic_object)
+    try:
+        for chunk in chunks:
+            partial = parser.feed(chunk)
+            if partial is not None and on_partial is not None:
+                on_partial(partial)
+    finally:
+        if hasattr(chunks, "close"):
+            chunks.close()  # 提前终止时关闭流，释放 HTTP 响应
+    return parser.finish()
+
+
+async def aparse_stream(chunks: AsyncIterator, pydantic_object: Type[T]) -> AsyncIterator[T]:
+    """异步消费 astream() 的输出：逐个产出部分对象，最后产出校验通过的完整对象"""
+    parser = IncrementalPydanticParser(pydantic_object)
+    try:
+        async for chunk in chunks:
+            partial = parser.feed(chunk)
+            if partial is not None:
+                yield partial
+    finally:
+        if hasattr(chunks, "aclose"):
+            await chunks.aclose()
+    yield parser.finish()
@@ -0,0 +1,171 @@
+"""
+后台增量摘要记忆（替代 ConversationSummaryMemory / ConversationSummaryBufferMemory）
+
+原实现在用户这一轮对话内同步调用 LLM 生成摘要，摘要耗时直接叠加到响应延迟上。这里改为：
+- 写入消息后立即返回，近期消息超过 token 阈值时，把最早的消息移入待摘要队列，交给后台线程处理；
+- 增量摘要：每次只把「已有摘要 + 新移出的消息」交给 LLM，不重新总结整段历史；
+- 后台摘要完成前，待摘要的消息仍以原文出现在 messages 中，上下文不会丢失；
+- 同一会话的摘要任务串行执行，多次触发时合并为一次 LLM 调用；
+- 有持久化的 chat_memory 时，摘要和已摘要的消息数（水位）随会话一起保存，重启或会话被 LRU 淘汰后
+  直接恢复摘要，只把水位之后的消息重新放入窗口，不会把整段历史重新摘要一遍。
+
+用法（作为 RunnableWithMessageHistory 的 get_session_history）：
+    summary_store = SummaryBufferStore(llm, max_token_limit=200)
+    chain = RunnableWithMessageHistory(runnable=prompt | llm, get_session_history=summary_store, ...)
+"""
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List, Optional, Sequence
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage, SystemMessage, get_buffer_string
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from common.token_counter import DEFAULT_MODEL
+from common.window_memory import TokenWindow
+
+SUMMARY_PROMPT = ChatPromptTemplate.from_messages([
+    ("system", "你负责逐步总结对话内容。在已有摘要的基础上加入新的对话内容，返回新的摘要。"
+               "保留用户的关键需求和已确认的信息（如花材、数量、价格、包装、配送时间/地址），不要编造内容。"),
+    ("human", "已有摘要：\n{summary}\n\n新的对话：\n{new_lines}\n\n新的摘要：")
+])
+
+# 摘要状态在 chat_memory 中的 key
+_STATE_KEY = "summary"
+
+# 所有会话共用的后台摘要线程池
+_summary_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="summary")
+
+
+class AsyncSummaryBufferHistory(BaseChatMessageHistory):
+    """
+    摘要 + 近期原文 的对话历史，摘要在后台线程中增量生成
+    :param llm: 生成摘要的模型
+    :param max_token_limit: 近期原文的 token 上限，超过后最早的消息进入摘要（为 0 时每轮都摘要，只保留最新一条原文）
+    :param chat_memory: 可选，保存完整原始消息的历史（如 SessionStore 中的会话），用于持久化与恢复；
+                        支持 load_state/save_state 时摘要与水位一并持久化
+    :param model_name: 计算 token 时使用的分词器
+    :param summary_prefix: 摘要消息的前缀
+    """
+
+    def __init__(self, llm: BaseChatModel, max_token_limit: int = 200,
+                 chat_memory: Optional[BaseChatMessageHistory] = None, model_name: str = DEFAULT_MODEL,
+                 summary_prefix: str = "早期对话摘要："):
+        self.summarize_chain = SUMMARY_PROMPT | llm | StrOutputParser()
+        self.chat_memory = chat_memory
+        self.model_name = model_name
+        self.summary_prefix = summary_prefix
+        self.summary = ""
+        self._summarized = 0  # 水位：chat_memory 中已并入摘要的消息数
+        self._window = TokenWindow(max_token_limit, model_name)  # 近期原文（缓存每条消息的 token 数）
+        self._pending: List[BaseMessage] = []  # 已移出近期窗口、等待并入摘要的消息
+        self._lock = threading.Lock()  # 保护以上状态
+        self._summary_lock = threading.Lock()  # 同一会话的摘要任务串行
+        self._future: Optional[Future] = None
+        if chat_memory is not None:
+            messages = chat_memory.messages
+            state = chat_memory.load_state(_STATE_KEY) if hasattr(chat_memory, "load_state") else None
+            if state and state["summarized"] <= len(messages):
+                self.summary = state["summary"]
+                self._summarized = state["summarized"]
+                messages = messages[self._summarized:]
+            if messages:
+                self._append(messages)  # 水位之后的历史照常进入窗口，超出部分在后台摘要
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with self._lock:
+            prefix = [SystemMessage(content=self.summary_prefix + self.summary)] if self.summary else []
+            return prefix + self._pending + self._window.messages
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        messages = list(messages)
+        if self.chat_memory is not None:
+            self.chat_memory.add_messages(messages)
+        self._append(messages)
+
+    def _append(self, messages: Sequence[BaseMessage]):
+        with self._lock:
+            # 超出阈值：把最早的消息移入待摘要队列（只对新消息分词，不重复计数整个窗口）
+            evicted = self._window.append(messages)
+            if evicted:
+                self._pending.extend(evicted)
+                self._future = _summary_executor.submit(self._summarize_pending)
+
+    def _summarize_pending(self):
+        with self._summary_lock:
+            with self._lock:
+                batch = list(self._pending)
+                summary = self.summary
+            if not batch:  # 已被前一个任务合并处理
+                return
+            try:
+                new_summary = self.summarize_chain.invoke({
+                    "summary": summary or "（无）",
+                    "new_lines": get_buffer_string(batch, human_prefix="用户", ai_prefix="助手")
+                })
+            except Exception as e:
+                # 失败时消息保留在待摘要队列中（仍以原文参与上下文），下次触发时重试
+                print(f"⚠️  后台摘要失败：{str(e)}")
+                return
+            with self._lock:
+                self.summary = new_summary.strip()
+                del self._pending[:len(batch)]
+                self._summarized += len(batch)
+                state = {"summary": self.summary, "summarized": self._summarized}
+            if hasattr(self.chat_memory, "save_state"):
+                self.chat_memory.save_state(_STATE_KEY, state)
+
+    def wait(self, timeout: Optional[float] = None):
+        """等待后台摘要完成（演示/测试时查看最终摘要用）"""
+        future = self._future
+        if future is not None:
+            future.result(timeout=timeout)
+
+    def clear(self) -> None:
+        self.wait()
+        with self._lock:
+            self.summary = ""
+            self._summarized = 0
+            self._window.clear()
+            self._pending = []
+        if self.chat_memory is not None:
+            self.chat_memory.clear()
+
+
+class SummaryBufferStore:
+    """
+    按 session_id 管理 AsyncSummaryBufferHistory（LRU，只保留最近活跃的会话）
+    :param chat_memory_factory: 可选，session_id → 完整原始历史（如 get_session_store()），被淘汰的会话可从中恢复
+    """
+
+    def __init__(self, llm: BaseChatModel, max_token_limit: int = 200,
+                 chat_memory_factory: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+                 max_sessions: int = 1000, model_name: str = DEFAULT_MODEL):
+        self.llm = llm
+        self.max_token_limit = max_token_limit
+        self.chat_memory_factory = chat_memory_factory
+        self.max_sessions = max_sessions
+        self.model_name = model_name
+        self._sessions: "OrderedDict[str, AsyncSummaryBufferHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str = "default") -> AsyncSummaryBufferHistory:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = AsyncSummaryBufferHistory(
+                    self.llm, self.max_token_limit,
+                    chat_memory=self.chat_memory_factory(session_id) if self.chat_memory_factory else None,
+                    model_name=self.model_name
+                )
+                self._sessions[session_id] = history
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return history
+
+    __call__ = get
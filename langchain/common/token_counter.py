@@ -0,0 +1,62 @@
+"""
+Token 计数工具（多个模块共用）
+
+优先使用 tiktoken 按目标模型的分词器精确计数；未安装 tiktoken 时按经验估算
+（中文约 1 字 1 token，其余约 4 字符 1 token）。
+"""
+import re
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+DEFAULT_MODEL = "gpt-3.5-turbo"
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u4e00-\u9fff\uff00-\uffef]")
+_MESSAGE_OVERHEAD = 4
+
+
+@lru_cache(maxsize=16)
+def get_encoding(model: str = DEFAULT_MODEL):
+    """按模型名获取分词器（结果缓存，避免重复加载词表）；未知模型回退到 cl100k_base"""
+    if tiktoken is None:
+        return None
+    try:
+        return tiktoken.encoding_for_model(model)
+    except KeyError:
+        return tiktoken.get_encoding("cl100k_base")
+
+
+def count_tokens(text: str, model: str = DEFAULT_MODEL) -> int:
+    encoding = get_encoding(model)
+    if encoding is not None:
+        return len(encoding.encode(text, disallowed_special=()))
+    cjk = len(_CJK_PATTERN.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def count_message_tokens(message, model: str = DEFAULT_MODEL) -> int:
+    """单条对话消息的 token 数：内容 + 角色等格式开销（OpenAI 聊天格式每条约 4 个 token）"""
+    content = message.content if isinstance(message.content, str) else str(message.content)
+    return count_tokens(content, model) + _MESSAGE_OVERHEAD
+
+
+def truncate_to_tokens(text: str, max_tokens: int, model: str = DEFAULT_MODEL) -> str:
+    """截断到不超过 max_tokens 个 token"""
+    if max_tokens <= 0:
+        return ""
+    encoding = get_encoding(model)
+    if encoding is not None:
+        tokens = encoding.encode(text, disallowed_special=())
+        return text if len(tokens) <= max_tokens else encoding.decode(tokens[:max_tokens])
+    # 无 tiktoken：二分查找满足预算的最长前缀
+    low, high = 0, len(text)
+    while low < high:
+        mid = (low + high + 1) // 2
+        if count_tokens(text[:mid], model) <= max_tokens:
+            low = mid
+        else:
+            high = mid - 1
+    return text[:low]
@@ -0,0 +1,137 @@
+"""
+按 token 预算截断的窗口记忆（替代按轮数截断的 ConversationBufferWindowMemory）
+
+- 消息与其 token 数一起放入环形缓冲区（deque），每条消息只在写入时分词一次；
+- 维护窗口内 token 总数，超出预算时从最早的消息开始弹出，每轮的截断开销为均摊 O(1)；
+- 使用目标模型的分词器计数（见 common/token_counter.py），与实际计费/上下文长度一致。
+
+用法（作为 RunnableWithMessageHistory 的 get_session_history）：
+    window_store = TokenWindowStore(max_tokens=500, model_name="gpt-3.5-turbo")
+    chain = RunnableWithMessageHistory(runnable=prompt | llm, get_session_history=window_store, ...)
+"""
+import threading
+from collections import OrderedDict, deque
+from typing import Callable, Deque, List, Optional, Sequence, Tuple
+
+from langchain_core.chat_history import BaseChatMessageHistory
+from langchain_core.messages import BaseMessage
+
+from common.token_counter import DEFAULT_MODEL, count_message_tokens
+
+
+class TokenWindow:
+    """
+    token 预算内的消息环形缓冲区（非线程安全，由调用方加锁）
+    :param max_tokens: 窗口内消息的 token 上限
+    :param model_name: 计数所用的分词器
+    :param start_on_human: 截断后窗口是否从用户消息开始（避免以孤立的助手回复开头）
+    """
+
+    def __init__(self, max_tokens: int, model_name: str = DEFAULT_MODEL, start_on_human: bool = True):
+        self.max_tokens = max_tokens
+        self.model_name = model_name
+        self.start_on_human = start_on_human
+        self.items: Deque[Tuple[BaseMessage, int]] = deque()
+        self.total_tokens = 0
+
+    def append(self, messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+        """写入消息并截断到预算，返回被移出窗口的消息（按时间顺序）"""
+        for message in messages:
+            tokens = count_message_tokens(message, self.model_name)
+            self.items.append((message, tokens))
+            self.total_tokens += tokens
+
+        evicted = []
+        # 至少保留最新的一条消息，即使它本身超出预算
+        while len(self.items) > 1 and self.total_tokens > self.max_tokens:
+            evicted.append(self._popleft())
+        if evicted and self.start_on_human:
+            while len(self.items) > 1 and self.items[0][0].type != "human":
+                evicted.append(self._popleft())
+        return evicted
+
+    def _popleft(self) -> BaseMessage:
+        message, tokens = self.items.popleft()
+        self.total_tokens -= tokens
+        return message
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        return [message for message, _ in self.items]
+
+    def clear(self):
+        self.items.clear()
+        self.total_tokens = 0
+
+
+class TokenWindowChatMessageHistory(BaseChatMessageHistory):
+    """
+    只保留 token 预算内近期消息的对话历史
+    :param max_tokens: 窗口 token 上限
+    :param chat_memory: 可选，保存完整原始消息的历史（如 SessionStore 中的会话），用于持久化与恢复
+    :param model_name: 计数所用的分词器
+    """
+
+    def __init__(self, max_tokens: int = 500, chat_memory: Optional[BaseChatMessageHistory] = None,
+                 model_name: str = DEFAULT_MODEL):
+        self.window = TokenWindow(max_tokens, model_name)
+        self.chat_memory = chat_memory
+        self._lock = threading.Lock()
+        if chat_memory is not None:
+            self.window.append(chat_memory.messages)
+
+    @property
+    def messages(self) -> List[BaseMessage]:
+        with self._lock:
+            return self.window.messages
+
+    @property
+    def total_tokens(self) -> int:
+        return self.window.total_tokens
+
+    def add_messages(self, messages: Sequence[BaseMessage]) -> None:
+        messages = list(messages)
+        if self.chat_memory is not None:
+            self.chat_memory.add_messages(messages)
+        with self._lock:
+            self.window.append(messages)
+
+    def clear(self) -> None:
+        with self._lock:
+            self.window.clear()
+        if self.chat_memory is not None:
+            self.chat_memory.clear()
+
+
+class TokenWindowStore:
+    """
+    按 session_id 管理 TokenWindowChatMessageHistory（LRU，只保留最近活跃的会话）
+    :param chat_memory_factory: 可选，session_id → 完整原始历史（如 get_session_store()），被淘汰的会话可从中恢复
+    """
+
+    def __init__(self, max_tokens: int = 500, model_name: str = DEFAULT_MODEL,
+                 chat_memory_factory: Optional[Callable[[str], BaseChatMessageHistory]] = None,
+                 max_sessions: int = 1000):
+        self.max_tokens = max_tokens
+        self.model_name = model_name
+        self.chat_memory_factory = chat_memory_factory
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, TokenWindowChatMessageHistory]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str = "default") -> TokenWindowChatMessageHistory:
+        with self._lock:
+            history = self._sessions.get(session_id)
+            if history is None:
+                history = TokenWindowChatMessageHistory(
+                    self.max_tokens,
+                    chat_memory=self.chat_memory_factory(session_id) if self.chat_memory_factory else None,
+                    model_name=self.model_name
+                )
+                self._sessions[session_id] = history
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            return history
+
+    __call__ = get
@@ -1,4 +1,6 @@
 import os
+import sys
+
 from langchain_openai import ChatOpenAI
 
 # -------------------------- 1. 基础配置（必填）--------------------------
@@ -17,24 +19,36 @@ llm = ChatOpenAI(
 )
 
 # -------------------------- 2. 初始化 Memory（你的指定路径）--------------------------
-from langchain_classic import ConversationChain
-from langchain_classic.memory import ConversationBufferWindowMemory
-
-# 只保留最近 2 轮对话（k=2）
-memory = ConversationBufferWindowMemory(
-    k=2,  # 窗口大小：保留最近 2 轮（每轮含用户+助手消息）
-    return_messages=True
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables.history import RunnableWithMessageHistory
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.window_memory import TokenWindowStore
+
+# 只保留最近 120 个 token 以内的对话（ConversationBufferWindowMemory(k=2) 按轮数截断，长回复会撑爆上下文）
+# 每条消息只在写入时分词一次，截断时按缓存的 token 数从最早的消息弹出
+window_store = TokenWindowStore(max_tokens=120, model_name="gpt-3.5-turbo")
+
+prompt = ChatPromptTemplate.from_messages([
+    MessagesPlaceholder(variable_name="history"),
+    ("human", "{input}")
+])
+chain = RunnableWithMessageHistory(
+    runnable=prompt | llm,
+    get_session_history=window_store,
+    input_messages_key="input",
+    history_messages_key="history"
 )
-
-chain = ConversationChain(llm=llm, memory=memory, verbose=False)
-
-# 测试多轮对话（超过 2 轮后，最早的对话会被丢弃）
-print("=== ConversationBufferWindowMemory（k=2）===")
-print(chain.invoke({"input": "红玫瑰单价多少？"})["response"])
-print(chain.invoke({"input": "买10束能打折吗？"})["response"])
-print(chain.invoke({"input": "北京能当天送吗？"})["response"])  # 此时会丢弃第一轮“红玫瑰价格”的记忆
-
-# 查看当前记忆（仅保留后 2 轮）
-print("\n当前记忆内容：")
-for msg in memory.load_memory_variables({})["history"]:
-    print(f"{msg.type}: {msg.content}")
\ No newline at end of file
+config = {"configurable": {"session_id": "window_demo"}}
+
+# 测试多轮对话（超过 token 预算后，最早的对话会被丢弃）
+print("=== TokenWindowChatMessageHistory（max_tokens=120）===")
+print(chain.invoke({"input": "红玫瑰单价多少？"}, config=config).content)
+print(chain.invoke({"input": "买10束能打折吗？"}, config=config).content)
+print(chain.invoke({"input": "北京能当天送吗？"}, config=config).content)  # 超出预算时会丢弃最早的“红玫瑰价格”的记忆
+
+# 查看当前记忆（仅保留预算内的近期对话）
+memory = window_store.get("window_demo")
+print(f"\n当前记忆内容（{memory.total_tokens} tokens）：")
+for msg in memory.messages:
+    print(f"{msg.type}: {msg.content}")
@@ -1,11 +1,13 @@
 import os
+import sys
 
 from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory
-from langchain_core.runnables.history import BaseChatMessageHistory
-from langchain_core.chat_history import InMemoryChatMessageHistory
-from langchain_classic.memory import ConversationSummaryBufferMemory
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.session_store import get_session_store
+from common.summary_memory import SummaryBufferStore
 
 # -------------------------- 1. 基础配置（必填）--------------------------
 # 1. 读取 API Key（你的代理密钥，环境变量名：GPTSAPI_API_KEY）
@@ -23,13 +25,8 @@ llm = ChatOpenAI(
 )
 
 # -------------------------- 多会话存储（通用工具）--------------------------
-def get_session_history(session_id: str = "default") -> BaseChatMessageHistory:
-    """多会话隔离存储（临时用字典，实际可替换为 Redis/MongoDB）"""
-    if not hasattr(get_session_history, "session_store"):
-        get_session_history.session_store = {}
-    if session_id not in get_session_history.session_store:
-        get_session_history.session_store[session_id] = InMemoryChatMessageHistory()
-    return get_session_history.session_store[session_id]
+# LRU 热层 + SQLite 冷层，按 session_id 路由（保存完整原始消息）
+session_store = get_session_store()
 
 
 # -------------------------- ConversationSummaryBufferMemory 实例 --------------------------
@@ -40,14 +37,11 @@ def run_summary_buffer_memory_demo(session_id: str = "summary_buffer_demo"):
     print("=" * 60)
 
     # 1. 初始化 SummaryBuffer 记忆（关键参数配置）
-    memory = ConversationSummaryBufferMemory(
-        chat_memory=get_session_history(session_id),  # 绑定会话历史
+    # 摘要在后台线程中增量生成，不阻塞当前这一轮的回复
+    summary_store = SummaryBufferStore(
         llm=llm,  # 用于生成摘要的 LLM
-        max_token_limit=50,  # 核心阈值：缓冲区最大 Token 数（超阈值触发摘要）
-        return_messages=True,  # 返回 ChatMessage 格式（易读+适配 Prompt）
-        moving_summary_buffer="100",  # 可选：摘要缓冲区大小（控制摘要长度）
-        human_prefix="用户",  # 可选：自定义用户角色前缀
-        ai_prefix="助手"  # 可选：自定义助手角色前缀
+        max_token_limit=50,  # 核心阈值：缓冲区最大 Token 数（超阈值后最早的消息进入摘要）
+        chat_memory_factory=session_store  # 完整原始消息持久化到会话存储
     )
 
     # 2. 构建带记忆的 Prompt（注入历史对话/摘要）
@@ -65,7 +59,7 @@ def run_summary_buffer_memory_demo(session_id: str = "summary_buffer_demo"):
     # 3. 构建带记忆的链（基于 RunnableWithMessageHistory 新版架构）
     chain = RunnableWithMessageHistory(
         runnable=prompt | llm,
-        get_session_history=lambda: get_session_history(session_id),
+        get_session_history=summary_store,
         input_messages_key="input",
         history_messages_key="chat_history"
     )
@@ -97,12 +91,14 @@ def run_summary_buffer_memory_demo(session_id: str = "summary_buffer_demo"):
     print("\n" + "=" * 60)
     print("最终记忆结构（早期摘要 + 近期原文）")
     print("=" * 60)
-    memory_content = memory.load_memory_variables({})["history"]
+    memory = summary_store.get(session_id)
+    memory.wait()  # 等待后台摘要完成
+    memory_content = memory.messages
     print(memory_content)
 
-    # 区分摘要和原文（摘要存储在 AIMessage 中，原文是 HumanMessage/AIMessage 对）
+    # 区分摘要和原文（摘要存储在 SystemMessage 中，原文是 HumanMessage/AIMessage 对）
     for msg in memory_content:
-        if msg.type == "ai" and "摘要：" in msg.content:
+        if msg.type == "system":
             print(f"【早期对话摘要】：{msg.content}")
         else:
             role = "用户" if msg.type == "human" else "助手"
@@ -1,6 +1,6 @@
 import os
+import sys
 
-from langchain_classic.chains.conversation.base import ConversationChain
 from langchain_openai import ChatOpenAI
 
 # -------------------------- 1. 基础配置（必填）--------------------------
@@ -19,30 +19,42 @@ llm = ChatOpenAI(
 )
 
 # -------------------------- 2. 初始化 Memory（你的指定路径）--------------------------
-from langchain_classic import ConversationChain
-from langchain_classic.chains.conversation.memory import ConversationSummaryMemory
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.runnables.history import RunnableWithMessageHistory  # 官方推荐替代组件
-# ConversationBufferMemory：完整存储所有对话，不截断，不压缩
-memory = ConversationSummaryMemory(
-    llm=llm,
-    return_messages=True,  # 返回 ChatMessage 格式（HumanMessage/AIMessage），更易读
-    memory_key="history" # 与 ConversationChain 的记忆键对应（默认就是 chat_history，可省略）
-)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.summary_memory import SummaryBufferStore
+
+# 摘要记忆：max_token_limit=0 表示每轮对话都并入摘要，只保留最新一条回复原文
+# ConversationSummaryMemory 在每一轮回复前同步调用 LLM 更新摘要；这里改为回复后在后台增量更新
+summary_store = SummaryBufferStore(llm=llm, max_token_limit=0)
 
 # -------------------------- 3. 创建带记忆的对话链 --------------------------
-chain = ConversationChain(llm=llm, memory=memory, verbose=False)
+prompt = ChatPromptTemplate.from_messages([
+    ("system", "你是鲜花店的客服助手，根据对话摘要回答用户的问题。"),
+    MessagesPlaceholder(variable_name="history"),
+    ("human", "{input}")
+])
+chain = RunnableWithMessageHistory(
+    runnable=prompt | llm,
+    get_session_history=summary_store,
+    input_messages_key="input",
+    history_messages_key="history"
+)
+config = {"configurable": {"session_id": "summary_demo"}}
 
 # -------------------------- 3. 测试超长对话 --------------------------
 print("=== ConversationSummaryMemory（摘要记忆）===")
-chain.invoke({"input": "红玫瑰单价 39 元/束，含包装"})
-chain.invoke({"input": "买 10 束打 9 折，总价 351 元"})
-chain.invoke({"input": "北京主城区支持当日达，14:00 前下单"})
-chain.invoke({"input": "需要粉色包装+白色满天星点缀"})
+chain.invoke({"input": "红玫瑰单价 39 元/束，含包装"}, config=config)
+chain.invoke({"input": "买 10 束打 9 折，总价 351 元"}, config=config)
+chain.invoke({"input": "北京主城区支持当日达，14:00 前下单"}, config=config)
+chain.invoke({"input": "需要粉色包装+白色满天星点缀"}, config=config)
 
 # 让助手总结订单信息（基于摘要记忆）
-print(chain.invoke({"input": "总结一下我的订单所有信息？"})["response"])
+print(chain.invoke({"input": "总结一下我的订单所有信息？"}, config=config).content)
 
-# 查看生成的对话摘要
+# 查看生成的对话摘要（等待后台摘要完成）
 print("\n对话摘要：")
-summary = memory.load_memory_variables({})["history"][0].content
-print(summary)
\ No newline at end of file
+memory = summary_store.get("summary_demo")
+memory.wait()
+print(memory.summary)
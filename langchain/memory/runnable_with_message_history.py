@@ -1,10 +1,13 @@
 import os
+import sys
 
-from langchain_core.chat_history import InMemoryChatMessageHistory, BaseChatMessageHistory
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.runnables import RunnableWithMessageHistory
 from langchain_openai import ChatOpenAI
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.session_store import get_session_store
+
 # -------------------------- 1. 基础配置（必填）--------------------------
 # 1. 读取 API Key（你的代理密钥，环境变量名：GPTSAPI_API_KEY）
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -22,7 +25,6 @@ llm = ChatOpenAI(
 
 # -------------------------- 2. 构建基础链（无记忆的核心逻辑）--------------------------
 from langchain_classic.chains.conversation.memory import ConversationBufferWindowMemory
-from langchain_core.chat_history import InMemoryChatMessageHistory  # 对话存储核心
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 # 提示词模板：必须包含 MessagesPlaceholder（变量名默认是 "history"）
 prompt = ChatPromptTemplate.from_messages([
@@ -37,20 +39,15 @@ output_parser = StrOutputParser()
 base_chain = prompt | llm | output_parser
 
 # -------------------------- 3. 配置记忆组件 --------------------------
-def get_session_history(session_id: str = "default") -> BaseChatMessageHistory:
-    """多会话隔离存储（临时用字典，实际可替换为 Redis/MongoDB）"""
-    if not hasattr(get_session_history, "session_store"):
-        get_session_history.session_store = {}
-    if session_id not in get_session_history.session_store:
-        get_session_history.session_store[session_id] = InMemoryChatMessageHistory()
-    return get_session_history.session_store[session_id]
+# 多会话隔离存储：LRU 热层（只保留最近活跃的会话）+ SQLite 冷层（只追加，重启后可恢复）
+session_store = get_session_store()
 
 # ------------------------- 4. 绑定记忆到链（核心：RunnableWithMessageHistory）-------------------------
 # 用 RunnableWithMessageHistory 包装基础链，实现「自动记忆管理」：
 # 绑定记忆的最终链
 chain_with_history = RunnableWithMessageHistory(
     runnable=base_chain,  # 传入基础链
-    get_session_history=lambda :get_session_history(),  # 传入「记忆获取函数」（按 session_id 分配记忆）
+    get_session_history=session_store,  # 传入「记忆获取函数」（按 session_id 分配记忆）
     input_messages_key="input",  # 指定用户输入的变量名（对应 prompt 中的 {input}）
     history_messages_key="history",  # 指定对话历史的变量名（对应 prompt 中的 MessagesPlaceholder）
 )
@@ -1,21 +1,26 @@
 import os
+import sys
 from dotenv import load_dotenv
 from pydantic import BaseModel, Field
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.exceptions import OutputParserException
 from openai import OpenAIError
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.streaming_parser import StreamingValidationError, parse_stream
+from common.json_repair import get_json_repair
+
 # 加载环境变量
 load_dotenv()
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = 'https://api.gptsapi.net/v1'
 
-# 1. 定义 Pydantic 模型（与示例 1 一致）
+# 1. 定义 Pydantic 模型（与示例 1 一致，长度约束用于流式解析时提前发现问题）
 class FlowerAdCopy(BaseModel):
-    description: str = Field(description="15-30字鲜花营销文案")
-    reason: str = Field(description="15-30字文案理由")
+    description: str = Field(description="15-30字鲜花营销文案", min_length=15, max_length=30)
+    reason: str = Field(description="15-30字文案理由", min_length=15, max_length=30)
 
 # 2. 创建基础解析器
 base_parser = PydanticOutputParser(pydantic_object=FlowerAdCopy)
@@ -41,7 +46,7 @@ fix_prompt = ChatPromptTemplate.from_messages([
 
 # 4. 初始化模型
 try:
-    model = ChatOpenAI(
+    model = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -53,30 +58,39 @@ except Exception as e:
 
 # 5. 自动修复逻辑（核心）
 def auto_fix_parser(flower_type: str, occasion: str) -> FlowerAdCopy:
-    # 第一步：调用模型获取原始输出
+    # 第一步：流式调用模型，边生成边解析校验
     raw_prompt = task_prompt.format(flower_type=flower_type, occasion=occasion)
     messages = [("user", raw_prompt)]
     print(f"📝 TEST")
-    raw_output = model.invoke(messages).content.strip()
-    print(f"📝 模型原始输出：{raw_output}")
 
     try:
-        # 尝试解析原始输出
-        return base_parser.parse(raw_output)
+        # 字段违反约束时立即终止生成（抛出 OutputParserException 子类），直接进入修复，不等完整输出
+        return parse_stream(model.stream(messages), FlowerAdCopy)
     except OutputParserException as e:
-        # 解析失败，生成修复 Prompt
-        print(f"❌ 解析失败：{str(e)}，正在自动修复...")
-        fix_messages = fix_prompt.format_messages(
-            error=str(e),
-            format_instructions=format_instructions,
-            flower_type=flower_type,
-            occasion=occasion
-        )
-        # 调用模型修复输出
-        fixed_output = model.invoke(fix_messages).content.strip()
-        print(f"📝 模型修复后输出：{fixed_output}")
-        # 再次解析修复后的输出
-        return base_parser.parse(fixed_output)
+        error = e
+
+    # 输出完整但格式有问题：先在本地修复（代码块、多余逗号、单引号、全角标点等），省掉一次 LLM 调用
+    # 生成中途终止（StreamingValidationError）时输出不完整，本地无法修复，直接交给 LLM
+    if not isinstance(error, StreamingValidationError):
+        try:
+            return get_json_repair().parse(error.llm_output or "", FlowerAdCopy)
+        except OutputParserException:
+            pass
+
+    print(f"📝 模型原始输出：{error.llm_output}")
+    # 本地修复失败，生成修复 Prompt
+    print(f"❌ 解析失败：{str(error)}，正在自动修复...")
+    fix_messages = fix_prompt.format_messages(
+        error=str(error),
+        format_instructions=format_instructions,
+        flower_type=flower_type,
+        occasion=occasion
+    )
+    # 调用模型修复输出
+    fixed_output = model.invoke(fix_messages).content.strip()
+    print(f"📝 模型修复后输出：{fixed_output}")
+    # 再次解析修复后的输出（同样先经过本地修复，不计入本地修复统计）
+    return get_json_repair().parse(fixed_output, FlowerAdCopy, record=False)
 
 # 6. 执行自动修复流程
 try:
@@ -88,4 +102,5 @@ try:
 except OpenAIError as e:
     print(f"❌ API 调用失败：{str(e)}")
 except Exception as e:
-    print(f"❌ 自动修复失败：{str(e)}")
\ No newline at end of file
+    print(f"❌ 自动修复失败：{str(e)}")
+print(f"🔧 JSON 修复统计：{get_json_repair().summary()}")
\ No newline at end of file
@@ -26,7 +26,9 @@ output_parser = PydanticOutputParser(pydantic_object=FlowerCopywriting)
 format_instructions = output_parser.get_format_instructions()
 
 import os
-from langchain_openai import ChatOpenAI
+import sys
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
 # llm = ChatOllama(
 #     model="llama3:8b",  # 或 qwen:7b（中文模型更推荐）
 #     base_url="http://localhost:11434",
@@ -36,7 +38,7 @@ from langchain_openai import ChatOpenAI
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = 'https://api.gptsapi.net/v1'
 try:
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -1,11 +1,15 @@
 from langchain_core.output_parsers import PydanticOutputParser
 from langchain_core.runnables import RunnableLambda
-from langchain_openai import ChatOpenAI
 import os
+import sys
 from langchain_core.prompts import PromptTemplate
 from langchain_core.exceptions import OutputParserException
 from pydantic import BaseModel, Field
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.json_repair import get_json_repair
+
 
 # --------------------------
 # 1. 定义 Pydantic 结构化模型（不变）
@@ -27,7 +31,7 @@ output_parser = PydanticOutputParser(pydantic_object=FlowerCopywriting)
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = 'https://api.gptsapi.net/v1'
 try:
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -62,11 +66,11 @@ fix_prompt = PromptTemplate(
 
 # 4. 自定义修复逻辑（RunnableLambda 嵌入函数）
 def parse_or_fix(input_data):
-    """解析失败则自动修复"""
+    """解析失败时先在本地修复（代码块、多余逗号、单引号、全角标点等），仍失败才调用 LLM 修复"""
     bad_output = input_data["model_output"]  # 模型原始输出
     try:
-        # 第一次尝试解析
-        return output_parser.parse(bad_output)
+        # 第一次尝试解析（含本地确定性修复，省掉大多数 LLM 修复调用）
+        return get_json_repair().parse(bad_output, FlowerCopywriting)
     except OutputParserException as e:
         error_msg = str(e)
         print(f"❌ 解析失败：{error_msg}，正在自动修复...")
@@ -78,8 +82,8 @@ def parse_or_fix(input_data):
         }).content
 
         print(f"✅ 修复后输出：{fixed_output}")
-        # 修复后重新解析
-        return output_parser.parse(fixed_output)
+        # 修复后重新解析（同样先经过本地修复，不计入本地修复统计）
+        return get_json_repair().parse(fixed_output, FlowerCopywriting, record=False)
 
 
 # 5. 构建完整链（生成 → 修复 → 解析）
@@ -98,4 +102,5 @@ if __name__ == "__main__":
         print(f"文案：{result.description}")
         print(f"理由：{result.reason}")
     except Exception as e:
-        print(f"\n❌ 修复失败：{str(e)[:200]}")
\ No newline at end of file
+        print(f"\n❌ 修复失败：{str(e)[:200]}")
+    print(f"\n🔧 JSON 修复统计：{get_json_repair().summary()}")
\ No newline at end of file
@@ -1,12 +1,16 @@
 import os
+import sys
 import pandas as pd
 # 核心导入（LangChain v0.3+ 最新规范，替换废弃的 ResponseSchema）
 from langchain_core.prompts import PromptTemplate
-from langchain_openai import ChatOpenAI
 from langchain_core.messages import HumanMessage
 from langchain_core.output_parsers.json import JsonOutputParser
 from pydantic import BaseModel, Field  # 用于定义 JSON 输出结构（替代 ResponseSchema）
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.streaming_parser import parse_stream
+
 # -------------------------- 1. 环境配置与依赖检查 --------------------------
 # 检查环境变量是否配置
 api_key = os.getenv("GPTSAPI_API_KEY")
@@ -57,13 +61,12 @@ prompt = PromptTemplate(
 print(format_instructions)
 
 # -------------------------- 5. 初始化聊天模型（兼容代理） --------------------------
-model = ChatOpenAI(
+model = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 代理支持的聊天模型
     temperature=0.7,  # 保留创意性
-    timeout=15,  # 超时保护
-    max_retries=2  # 失败自动重试（增强稳定性）
+    timeout=15  # 超时保护（失败重试由 get_chat_model 的传输层统一退避调度）
 )
 
 # -------------------------- 6. 数据准备（可扩展） --------------------------
@@ -86,12 +89,11 @@ for flower, price in flowers_data:
         # 1. 填充提示词（含花名、价格、格式要求）
         filled_prompt = prompt.format(flower_name=flower, price=price)
 
-        # 2. 调用模型（聊天模型需用 HumanMessage 包装）
+        # 2. 流式调用模型（聊天模型需用 HumanMessage 包装）
         messages = [HumanMessage(content=filled_prompt)]
-        response = model.invoke(messages)
 
-        # 3. 解析输出（自动校验格式，不符合会抛出异常）
-        parsed_output = output_parser.parse(response.content)
+        # 3. 边生成边解析校验：字段长度超限时立即终止生成并抛出异常（ValueError 子类），不再等完整输出
+        parsed_output = parse_stream(model.stream(messages), FlowerCopywriting).model_dump()
 
         # 4. 补充字段并添加到 DataFrame
         result_row = {
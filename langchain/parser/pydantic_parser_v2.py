@@ -14,10 +14,14 @@ class FlowerCopywriting(BaseModel):
     )
 
 import os
-from langchain_openai import ChatOpenAI
+import sys
 from langchain_core.prompts import PromptTemplate
 from langchain_core.output_parsers import PydanticOutputParser
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.streaming_parser import StreamingValidationError, parse_stream
+
 # 1. 初始化 Pydantic 输出解析器
 output_parser = PydanticOutputParser(pydantic_object=FlowerCopywriting)
 # 获取格式说明（会传给模型，告诉它该怎么输出）
@@ -34,7 +38,7 @@ prompt = PromptTemplate(
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = 'https://api.gptsapi.net/v1'
 try:
-    llm = ChatOpenAI(
+    llm = get_chat_model(
         api_key=api_key,
         base_url=base_url,
         model="gpt-3.5-turbo",
@@ -57,6 +61,19 @@ try:
 except Exception as e:
     print(f"❌ 解析失败：{e}")
 
+# 6. 流式增量解析：边生成边校验，字段超长时立即终止生成（不必等完整输出再报错）
+try:
+    result = parse_stream(
+        (prompt | llm).stream({"flower": "百合", "price": "30"}),
+        FlowerCopywriting,
+        on_partial=lambda partial: print(f"⏳ 生成中：{partial}")
+    )
+    print(f"✅ 流式解析结果：文案={result.description}，理由={result.reason}")
+except StreamingValidationError as e:
+    print(f"❌ 提前终止（已生成 {len(e.llm_output)} 字符）：{e.args[0]}")
+except Exception as e:
+    print(f"❌ 解析失败：{e}")
+
 # 模拟错误场景（故意让模型输出非 JSON 文本）
 # 若模型输出："文案：以爱之名，赠你浪漫；理由：情人节专属，传递心意"
 # 会抛出错误：Could not parse output as JSON: ...
\ No newline at end of file
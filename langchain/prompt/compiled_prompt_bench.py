@@ -0,0 +1,67 @@
+"""
+Prompt 渲染开销微基准：ChatPromptTemplate vs CompiledChatPromptTemplate（不调用任何外部接口）
+
+三种典型 prompt 结构：
+- agent：长静态 system prompt + 用户输入 + agent_scratchpad（tot.py / sql.py）
+- agent_memory：长静态 system prompt + 对话历史 + 用户输入 + agent_scratchpad（react_with_third_api.py）
+- chain：短 system prompt（含变量）+ 用户输入（chain/ 下的各个 demo）
+    python prompt/compiled_prompt_bench.py
+"""
+import os
+import sys
+import timeit
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.compiled_prompt import CompiledChatPromptTemplate
+
+NUMBER = 5000  # 每轮调用次数
+REPEAT = 5  # 取 REPEAT 轮中的最小值
+
+# 长度与 react_with_third_api.py 的 system prompt 相当（约 800 字）
+STATIC_SYSTEM = "\n".join(
+    f"    {i}. 规则：先判断问题是否在内部工具覆盖范围内，能回答则直接调用内部工具，否则调用搜索工具，"
+    f"并将结果提炼后用自然语言回答，注明信息来源，禁止猜测未覆盖的数据。"
+    for i in range(1, 13)
+)
+
+CASES = {
+    "agent": (
+        [("system", STATIC_SYSTEM), ("user", "{human_input}"), MessagesPlaceholder(variable_name="agent_scratchpad")],
+        {"human_input": "生成母亲节鲜花营销方案，覆盖不同预算的子女，突出感恩主题。", "agent_scratchpad": []}
+    ),
+    "agent_memory": (
+        [("system", STATIC_SYSTEM), MessagesPlaceholder(variable_name="chat_history"), ("user", "{input}"),
+         MessagesPlaceholder(variable_name="agent_scratchpad")],
+        {"input": "南京能送洋桔梗吗？", "agent_scratchpad": [],
+         "chat_history": [HumanMessage(content="玫瑰多少钱？"), AIMessage(content="玫瑰 50 元/束。")]}
+    ),
+    "chain": (
+        [("system", "你是鲜花养护专家，针对{flower_type}给出{count}条建议，语言通俗。"), ("user", "用户问题：{user_query}")],
+        {"flower_type": "洋桔梗", "count": 3, "user_query": "多久换一次水？"}
+    ),
+}
+
+
+def bench(func) -> float:
+    """返回单次调用的耗时（微秒）"""
+    func()  # 预热
+    return min(timeit.repeat(func, number=NUMBER, repeat=REPEAT)) / NUMBER * 1e6
+
+
+if __name__ == "__main__":
+    # format_messages：纯渲染开销；invoke：再加上 Runnable 的回调/配置处理（两者共有的固定开销）
+    print(f"{'case':<14}{'method':<17}{'ChatPromptTemplate':>20}{'Compiled':>12}{'speedup':>10}")
+    for name, (messages, inputs) in CASES.items():
+        original = ChatPromptTemplate.from_messages(messages)
+        compiled = CompiledChatPromptTemplate.from_messages(messages)
+        assert original.invoke(inputs) == compiled.invoke(inputs), f"{name}：渲染结果不一致"
+        for method in ("format_messages", "invoke"):
+            if method == "invoke":
+                before, after = bench(lambda: original.invoke(inputs)), bench(lambda: compiled.invoke(inputs))
+            else:
+                before = bench(lambda: original.format_messages(**inputs))
+                after = bench(lambda: compiled.format_messages(**inputs))
+            print(f"{name:<14}{method:<17}{before:>17.1f} µs{after:>9.1f} µs{before / after:>9.1f}x")
@@ -2,6 +2,10 @@
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_openai import ChatOpenAI
 import os
+import sys
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.embedding_cache import CachedEmbeddings
 
 # 1. 准备少样本示例（2个典型示例）
 few_shot_examples = [
@@ -61,10 +65,10 @@ all_examples = [
 # 2. 动态示例选择器（根据输入语义选最相似的1个示例）
 example_selector = SemanticSimilarityExampleSelector.from_examples(
     examples=all_examples,
-    embeddings=OpenAIEmbeddings(
+    embeddings=CachedEmbeddings(OpenAIEmbeddings(
         api_key=os.getenv("GPTSAPI_API_KEY"),
         base_url="https://api.gptsapi.net/v1"
-    ),
+    )),  # 静态示例的向量持久化缓存，重启后不再重复调用嵌入接口
     vectorstore_cls=Chroma,
     k=1  # 选1个最相似示例
 )
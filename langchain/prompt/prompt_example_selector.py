@@ -1,10 +1,14 @@
 import os
+import sys
 # 核心导入（LangChain 0.2.x+ 规范路径）
 from langchain_core.prompts import FewShotPromptTemplate, PromptTemplate
 from langchain_core.example_selectors import SemanticSimilarityExampleSelector
 from langchain_community.vectorstores import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI  # 最新版嵌入模型导入路径
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.embedding_cache import CachedEmbeddings
+
 # 1. 基础配置（代理 API Key + 代理地址，与之前的鲜花店代码保持一致）
 api_key = os.getenv("GPTSAPI_API_KEY")
 if not api_key:
@@ -29,10 +33,10 @@ prompt_sample = PromptTemplate(
 # 4. 初始化语义相似性示例选择器（关键适配最新版）
 example_selector = SemanticSimilarityExampleSelector.from_examples(
     examples=samples,  # 最新版参数名统一为 examples（旧版为 samples）
-    embeddings=OpenAIEmbeddings(
+    embeddings=CachedEmbeddings(OpenAIEmbeddings(
         api_key=api_key,
         base_url=base_url  # 嵌入模型也需要配置代理（避免直接调用 OpenAI 官方接口）
-    ),
+    )),  # 静态示例的向量持久化缓存，重启后不再重复调用嵌入接口
     vectorstore_cls=Chroma,  # 最新版参数名统一为 vectorstore_cls（旧版为 Chroma）
     k=1,  # 选择最相似的 1 个示例
     # vectorstore_kwargs={
@@ -1,12 +1,16 @@
 import os
-from langchain_core.prompts import ChatPromptTemplate
-from langchain_openai import ChatOpenAI
+import sys
 from langchain_core.tools import Tool
 from langchain_classic.agents import create_openai_tools_agent, AgentExecutor
 from langchain_core.prompts import MessagesPlaceholder
 
-# 1. 初始化模型
-llm = ChatOpenAI(
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.compiled_prompt import CompiledChatPromptTemplate
+from common.llm_factory import get_chat_model
+from common.prompt_cache import get_prompt_cache_usage
+
+# 1. 初始化模型（共享连接池 + prompt 缓存断点标记与命中统计）
+llm = get_chat_model(
     api_key=os.getenv("GPTSAPI_API_KEY"),
     base_url="https://api.gptsapi.net/v1",
     model="gpt-3.5-turbo",
@@ -54,7 +58,7 @@ tools = [
 ]
 
 # 4. ToT 提示模板（引导 Agent 拆解子问题、探索路径、评估回溯）
-tot_prompt = ChatPromptTemplate.from_messages([
+tot_prompt = CompiledChatPromptTemplate.from_messages([
     ("system", """
     你是花店营销方案规划师，需用树状思维（ToT）生成母亲节营销方案，步骤如下：
     1. 拆解主问题为子问题：目标人群（年轻/中年/老年子女）→ 花材组合 → 价格套餐 → 文案主题；
@@ -79,4 +83,5 @@ response = agent_executor.invoke({
 })
 
 print("\n=== 最终营销方案 ===")
-print(response["output"])
\ No newline at end of file
+print(response["output"])
+print(f"\n💾 prompt 缓存：{get_prompt_cache_usage().summary()}")
\ No newline at end of file
@@ -1,22 +1,29 @@
 import os
+import sys
+import time
 
-from langchain_core.chat_history import BaseChatMessageHistory, InMemoryChatMessageHistory
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
-from langchain_core.runnables import RunnablePassthrough, RunnableWithMessageHistory
+from langchain_core.runnables import RunnableBranch, RunnableLambda, RunnablePassthrough, RunnableWithMessageHistory
 from langchain_community.document_loaders import TextLoader
 from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_openai import ChatOpenAI
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_classic.chains.retrieval import create_retrieval_chain
 from langchain_classic.retrievers import ContextualCompressionRetriever
 from langchain_classic.retrievers.document_compressors import LLMChainExtractor
 from langchain_classic.chains.combine_documents import create_stuff_documents_chain
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # 引入 langchain/common 公共模块
+from common.embedding_cache import CachedEmbeddings
+from common.embedding_runner import BatchedSentenceTransformerEmbeddings
+from common.response_cache import ResponseCache
+from common.local_compressor import LocalSentenceCompressor
+from common.context_packer import ContextPacker
+from common.session_store import get_session_store
+from common.llm_factory import get_chat_model
+
 # --------------------------
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = os.getenv("GPTSAPI_BASE_URL")
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 推荐 gpt-3.5-turbo/gpt-4（支持工具调用）
@@ -43,8 +50,9 @@ print(f"📄 文档分割完成，共生成 {len(split_docs)} 个文本片段")
 # --------------------------
 # 3. 构建向量库（Chroma + 轻量嵌入模型）
 # --------------------------
-# 初始化嵌入模型（all-MiniLM-L6-v2：轻量、高效，适合本地运行）
-embedding = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
+# 初始化嵌入模型（all-MiniLM-L6-v2：轻量、高效，适合本地运行），带持久化缓存避免重复向量化
+# 底层为批量向量化引擎（长度排序分批、动态 batch size、分词与推理并行）
+embedding = CachedEmbeddings(BatchedSentenceTransformerEmbeddings("all-MiniLM-L6-v2"))
 
 # 构建 Chroma 向量库（persist_directory 可选：持久化向量库，下次直接加载）
 vector_db = Chroma.from_documents(
@@ -60,12 +68,49 @@ vector_db = Chroma.from_documents(
 # 基础检索器：从向量库中检索 top3 相关片段
 base_retriever = vector_db.as_retriever(search_kwargs={"k": 3})
 
-# 上下文压缩检索器（优化：用 LLM 过滤无关信息，提升检索质量）
-compressor = LLMChainExtractor.from_llm(llm)
-compression_retriever = ContextualCompressionRetriever(
-    base_compressor=compressor,
-    base_retriever=base_retriever
-)
+# 上下文压缩检索器（过滤无关信息，提升检索质量），支持多种压缩模式：
+# - llm：LLMChainExtractor，每个片段额外调用一次 LLM（最慢）；
+# - embedding：本地句子向量打分（毫秒级，复用带缓存的嵌入模型）；
+# - cross_encoder：本地 CPU 交叉编码器打分（较慢于 embedding，相关性更准）；
+# - none：不压缩，直接使用基础检索结果
+COMPRESSION_MODE = os.getenv("RAG_COMPRESSION_MODE", "embedding")
+COMPRESSION_TOKEN_BUDGET = 800  # 压缩后上下文的 token 上限（本地压缩模式）
+
+
+def build_compression_retriever(mode: str):
+    """按模式构建检索器（接口一致，可随时切换对比）"""
+    if mode == "none":
+        return base_retriever
+    if mode == "llm":
+        compressor = LLMChainExtractor.from_llm(llm)
+    elif mode in ("embedding", "cross_encoder"):
+        compressor = LocalSentenceCompressor(
+            mode=mode,
+            embeddings=embedding,
+            token_budget=COMPRESSION_TOKEN_BUDGET
+        )
+    else:
+        raise ValueError(f"未知压缩模式：{mode}（可选 llm/embedding/cross_encoder/none）")
+    return ContextualCompressionRetriever(
+        base_compressor=compressor,
+        base_retriever=base_retriever
+    )
+
+
+def compare_compression_modes(question: str, modes=("none", "embedding", "cross_encoder", "llm")):
+    """同一问题下对比各压缩模式的耗时与保留内容（质量/延迟权衡）"""
+    for mode in modes:
+        retriever = build_compression_retriever(mode)
+        start = time.perf_counter()
+        docs = retriever.invoke(question)
+        elapsed = time.perf_counter() - start
+        kept_chars = sum(len(d.page_content) for d in docs)
+        print(f"\n【{mode}】耗时 {elapsed * 1000:.0f}ms，保留 {len(docs)} 个片段 / {kept_chars} 字")
+        for i, doc in enumerate(docs, 1):
+            print(f"  {i}. {doc.page_content[:80]}...")
+
+
+compression_retriever = build_compression_retriever(COMPRESSION_MODE)
 
 # --------------------------
 # 5. 构建 RAG 链（最新版：create_retrieval_chain 简化配置）
@@ -86,30 +131,64 @@ prompt = ChatPromptTemplate.from_messages([
 # 构建「文档整合链」：将检索到的片段整合为上下文
 combine_docs_chain = create_stuff_documents_chain(llm, prompt)
 
-# 构建完整 RAG 链：检索 → 整合 → 生成
-rag_chain = create_retrieval_chain(
-    retriever=compression_retriever,  # 用压缩检索器（或 base_retriever）
-    combine_docs_chain=combine_docs_chain
+# 上下文打包：去掉重叠/重复片段，并按 token 预算截断（stuff 链本身不限制长度）
+context_packer = ContextPacker(token_budget=1200, model_name="gpt-3.5-turbo")
+
+# 问答缓存：精确匹配（问题 + 检索上下文 + 对话历史）+ 语义相似匹配，命中时跳过 LLM 生成
+response_cache = ResponseCache(embeddings=embedding, similarity_threshold=0.95, ttl_seconds=3600)
+
+
+def history_text(inputs: dict) -> str:
+    """答案依赖的对话历史（缓存键的一部分：同一问题在不同上文下的答案不能互用）"""
+    return "\n".join(f"{m.type}: {m.content}" for m in inputs.get("history") or [])
+
+
+def cache_context(inputs: dict) -> str:
+    return "\n\n".join(d.page_content for d in inputs["context"])
+
+
+def lookup_cache(inputs: dict):
+    return response_cache.lookup(inputs["input"], cache_context(inputs), history=history_text(inputs))
+
+
+def generate_and_store(inputs: dict) -> str:
+    """未命中缓存：用已检索的片段生成答案并写入缓存（不再重复检索）"""
+    answer = combine_docs_chain.invoke(inputs)
+    response_cache.store(inputs["input"], cache_context(inputs), answer,
+                         sources=[d.metadata.get("source") for d in inputs["context"]],
+                         history=history_text(inputs))
+    return answer
+
+
+# 构建完整 RAG 链：检索 → 打包 → 查缓存 →（未命中）整合 → 生成
+# 与 create_retrieval_chain 的输出一致（input / history / context / answer），另加 cached 表示是否命中缓存
+rag_chain = (
+        RunnablePassthrough.assign(
+            context=RunnableLambda(lambda x: x["input"])
+                    | compression_retriever  # 用压缩检索器（或 base_retriever）
+                    | RunnableLambda(context_packer.pack_documents)
+        )
+        | RunnablePassthrough.assign(cached=RunnableLambda(lookup_cache))
+        | RunnablePassthrough.assign(answer=RunnableBranch(
+            (lambda x: x["cached"] is not None, RunnableLambda(lambda x: x["cached"])),
+            RunnableLambda(generate_and_store)
+        ))
 )
 
 # --------------------------
 # 6. 可选：添加对话历史（基于 RunnableWithMessageHistory）
 # --------------------------
-def get_session_history(session_id: str = "default") -> BaseChatMessageHistory:
-    """多会话隔离存储（临时用字典，实际可替换为 Redis/MongoDB）"""
-    if not hasattr(get_session_history, "session_store"):
-        get_session_history.session_store = {}
-    if session_id not in get_session_history.session_store:
-        get_session_history.session_store[session_id] = InMemoryChatMessageHistory()
-    return get_session_history.session_store[session_id]
+# 多会话存储：LRU 热层 + SQLite 冷层（重启后历史不丢失），按 session_id 路由
+session_store = get_session_store()
 
 
 # 绑定对话历史的 RAG 链（启用多轮对话需用此链）
 rag_chain_with_history = RunnableWithMessageHistory(
     runnable=rag_chain,
-    get_session_history=lambda :get_session_history(),
+    get_session_history=session_store,
     input_messages_key="input",
     history_messages_key="history",
+    output_messages_key="answer",  # 缓存命中的答案同样写入对话历史，保证多轮对话上下文连贯
     session_id_key="session_id"
 )
 
@@ -126,14 +205,18 @@ def test_rag():
             print("👋 再见！")
             break
 
-        # 执行 RAG 链（启用对话历史用 rag_chain_with_history）
+        # 执行 RAG 链（启用对话历史用 rag_chain_with_history）：检索一次，缓存命中时跳过 LLM 生成
         result = rag_chain_with_history.invoke(
             input={"input": user_input},
             config={"configurable": {"session_id": current_session_id}}
         )
+        # result 包含 answer 和 context，可按需打印
+        answer = result["answer"]
+        if result["cached"] is not None:
+            print("⚡ 命中问答缓存")
 
-        # 输出结果（result 包含 answer 和 context，可按需打印）
-        print(f"助手：{result['answer']}")
+        # 输出结果
+        print(f"助手：{answer}")
 
         # 可选：打印检索到的相关上下文（调试用）
         # print("\n📌 检索到的相关信息：")
@@ -0,0 +1,351 @@
+"""
+混合检索：BM25 关键词检索 + 向量检索，用 RRF（倒数排名融合）合并结果
+
+- 倒排索引与 Chroma 中的片段一一对应（以 chunk_id 关联），持久化在向量库目录下；
+- 倒排表以 numpy 数组保存，加载时使用 mmap，启动快、常驻内存小；
+- 文档变化时只对变化的片段分词，写入小的增量段（基础段不动），增量段足够大时再合并；
+- 分词兼顾中文：中文连续片段切为字 bigram（安装了 jieba 时使用 jieba 搜索模式分词），
+  英文/数字整体保留（SKU、订单号等关键词可精确命中）。
+"""
+import json
+import math
+import os
+import re
+import shutil
+import unicodedata
+from collections import Counter, defaultdict
+from typing import Dict, List, Tuple
+
+import numpy as np
+from langchain_chroma import Chroma
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+
+try:
+    import jieba
+except ImportError:
+    jieba = None
+
+# 英文/数字 token（允许内部带 - _ . / ，如 SKU-2024-001、A12.5）或 连续中文
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[-_./][a-z0-9]+)*|[\u4e00-\u9fff]+")
+_CJK_PATTERN = re.compile(r"[\u4e00-\u9fff]")
+
+_CURRENT = "CURRENT"  # 当前版本指针文件
+# 增量段的片段数（新增 + 删除）超过 max(最小值, 基础段片段数 × 比例) 时合并进基础段
+DELTA_MERGE_MIN_DOCS = int(os.getenv("BM25_DELTA_MERGE_MIN_DOCS", "2000"))
+DELTA_MERGE_RATIO = float(os.getenv("BM25_DELTA_MERGE_RATIO", "0.1"))
+
+
+def tokenize(text: str) -> List[str]:
+    """中英文混合分词（检索与建索引使用同一套规则）"""
+    tokens = []
+    for match in _TOKEN_PATTERN.finditer(unicodedata.normalize("NFKC", text).lower()):
+        token = match.group()
+        if not _CJK_PATTERN.match(token):
+            tokens.append(token)
+            if re.search(r"[-_./]", token):
+                tokens.extend(re.split(r"[-_./]", token))  # 同时索引各段，支持部分编号检索
+        elif jieba is not None:
+            tokens.extend(t for t in jieba.lcut_for_search(token) if t.strip())
+        elif len(token) == 1:
+            tokens.append(token)
+        else:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+
+class BM25Index:
+    """
+    基于 numpy 数组的紧凑倒排索引：只读的基础段 + 小的增量段
+    目录结构：CURRENT（当前版本指针，JSON）、seg-<版本>/（基础段）、delta-<版本>.json（增量段）
+    基础段：meta.json（参数与统计）、vocab.json（词 → [偏移, 文档频率]）、doc_ids.json（行号 → chunk_id）、
+           postings_doc.npy / postings_tf.npy（按词连续存放的倒排表）、doc_len.npy（文档长度）
+    增量段：新增片段的词频 + 基础段中已删除的 chunk_id；超过阈值时与基础段合并为新的基础段
+
+    每次写入都生成新版本的文件，最后原子替换 CURRENT：中途退出时 CURRENT 仍指向完整的旧版本；
+    正在使用的旧索引通过 mmap 映射着旧文件，因此保留上一个版本，更早的版本才删除。
+    """
+
+    def __init__(self, index_dir: str, k1: float = 1.5, b: float = 0.75):
+        self.index_dir = index_dir
+        self.k1 = k1
+        self.b = b
+        self.state = _read_state(index_dir)
+        segment_dir = os.path.join(index_dir, self.state["segment"])
+        with open(os.path.join(segment_dir, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(segment_dir, "vocab.json"), "r", encoding="utf-8") as f:
+            self.vocab: Dict[str, List[int]] = json.load(f)
+        with open(os.path.join(segment_dir, "doc_ids.json"), "r", encoding="utf-8") as f:
+            self.doc_ids: List[str] = json.load(f)
+        self.base_total_len = meta["total_doc_len"]
+        # mmap 加载：只有被查询到的倒排表页才会读入内存
+        self.postings_doc = np.load(os.path.join(segment_dir, "postings_doc.npy"), mmap_mode="r")
+        self.postings_tf = np.load(os.path.join(segment_dir, "postings_tf.npy"), mmap_mode="r")
+        self.doc_len = np.load(os.path.join(segment_dir, "doc_len.npy"), mmap_mode="r")
+
+        delta = {"docs": {}, "deleted": []}
+        if self.state.get("delta"):
+            with open(os.path.join(index_dir, self.state["delta"]), "r", encoding="utf-8") as f:
+                delta = json.load(f)
+        self._load_delta(delta)
+
+    def _load_delta(self, delta: dict):
+        """增量段 → 查询用的数组：delta_ids / delta_len / delta_postings，以及基础段的存活掩码"""
+        self.delta = delta
+        self.delta_ids: List[str] = list(delta["docs"])
+        self.delta_len = np.array([delta["docs"][cid][0] for cid in self.delta_ids], dtype=np.float32)
+        postings: Dict[str, Tuple[List[int], List[float]]] = defaultdict(lambda: ([], []))
+        for row, cid in enumerate(self.delta_ids):
+            for term, tf in delta["docs"][cid][1].items():
+                postings[term][0].append(row)
+                postings[term][1].append(tf)
+        self.delta_postings = {term: (np.array(rows, dtype=np.int32), np.array(tfs, dtype=np.float32))
+                               for term, (rows, tfs) in postings.items()}
+
+        self.alive = None  # None 表示基础段没有删除
+        deleted_len = 0.0
+        if delta["deleted"]:
+            rows = self._base_rows()
+            deleted_rows = np.array([rows[cid] for cid in delta["deleted"] if cid in rows], dtype=np.int64)
+            self.alive = np.ones(len(self.doc_ids), dtype=bool)
+            self.alive[deleted_rows] = False
+            deleted_len = float(self.doc_len[deleted_rows].sum())
+        self.n_docs = int(self.alive.sum() if self.alive is not None else len(self.doc_ids)) + len(self.delta_ids)
+        total_len = self.base_total_len - deleted_len + float(self.delta_len.sum())
+        self.avg_doc_len = total_len / self.n_docs if self.n_docs else 0.0
+
+    def _base_rows(self) -> Dict[str, int]:
+        return {cid: row for row, cid in enumerate(self.doc_ids)}
+
+    @staticmethod
+    def exists(index_dir: str) -> bool:
+        return os.path.exists(os.path.join(index_dir, _CURRENT))
+
+    @staticmethod
+    def build(index_dir: str, chunks: List[Tuple[str, str]]):
+        """
+        从 (chunk_id, 文本) 列表构建完整索引（新的基础段，无增量段）
+        """
+        postings: Dict[str, Tuple[List[int], List[int]]] = defaultdict(lambda: ([], []))
+        doc_len = np.zeros(len(chunks), dtype=np.float32)
+        for row, (_, text) in enumerate(chunks):
+            counts = Counter(tokenize(text))
+            doc_len[row] = sum(counts.values())
+            for term, tf in counts.items():
+                postings[term][0].append(row)
+                postings[term][1].append(tf)
+        version = _next_version(index_dir)
+        _write_segment(os.path.join(index_dir, _segment_name(version)), [chunk_id for chunk_id, _ in chunks],
+                       doc_len, postings.items())
+        _switch(index_dir, {"version": version, "segment": _segment_name(version), "delta": None})
+
+    @staticmethod
+    def update(index_dir: str, added: List[Tuple[str, str]], deleted: List[str]):
+        """
+        增量更新：只对变化的片段分词，写入新的增量段；增量段超过阈值时与基础段合并
+        :param added: 新增的 (chunk_id, 文本)
+        :param deleted: 删除的 chunk_id
+        """
+        index = BM25Index(index_dir)
+        docs = dict(index.delta["docs"])
+        removed = set(index.delta["deleted"])
+        base_rows = index._base_rows()
+        for cid in deleted:
+            if docs.pop(cid, None) is None and cid in base_rows:
+                removed.add(cid)
+        for cid, text in added:
+            if cid in base_rows:
+                removed.discard(cid)  # chunk_id 即内容哈希：删除后又加回的片段直接恢复
+                continue
+            counts = Counter(tokenize(text))
+            docs[cid] = [sum(counts.values()), dict(counts)]
+        index._load_delta({"docs": docs, "deleted": sorted(removed)})
+
+        version = _next_version(index_dir)
+        if len(docs) + len(removed) > max(DELTA_MERGE_MIN_DOCS, DELTA_MERGE_RATIO * len(index.doc_ids)):
+            index._write_merged(os.path.join(index_dir, _segment_name(version)))
+            state = {"version": version, "segment": _segment_name(version), "delta": None}
+        else:
+            tmp_path = os.path.join(index_dir, _delta_name(version) + ".tmp")
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(index.delta, f, ensure_ascii=False)
+            os.replace(tmp_path, os.path.join(index_dir, _delta_name(version)))
+            state = {"version": version, "segment": index.state["segment"], "delta": _delta_name(version)}
+        _switch(index_dir, state)
+
+    def _write_merged(self, segment_dir: str):
+        """把增量段合并进基础段：去掉已删除的行并重新编号，追加增量段的文档"""
+        alive_rows = np.flatnonzero(self.alive) if self.alive is not None else np.arange(len(self.doc_ids))
+        remap = np.full(len(self.doc_ids), -1, dtype=np.int32)
+        remap[alive_rows] = np.arange(len(alive_rows), dtype=np.int32)
+        n_alive = len(alive_rows)
+
+        def merged_postings():
+            for term in self.vocab.keys() | self.delta_postings.keys():
+                docs, tfs = [], []
+                if term in self.vocab:
+                    offset, df = self.vocab[term]
+                    rows = remap[self.postings_doc[offset:offset + df]]
+                    keep = rows >= 0
+                    docs.append(rows[keep])
+                    tfs.append(self.postings_tf[offset:offset + df][keep])
+                if term in self.delta_postings:
+                    rows, tf = self.delta_postings[term]
+                    docs.append(rows + n_alive)
+                    tfs.append(tf)
+                yield term, (np.concatenate(docs), np.concatenate(tfs))
+
+        doc_ids = [self.doc_ids[row] for row in alive_rows] + self.delta_ids
+        doc_len = np.concatenate([self.doc_len[alive_rows], self.delta_len]).astype(np.float32)
+        _write_segment(segment_dir, doc_ids, doc_len, merged_postings())
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """返回 BM25 得分最高的 k 个 (chunk_id, 得分)；基础段行号在前，增量段行号接在后面"""
+        if self.n_docs == 0:
+            return []
+        n_base = len(self.doc_ids)
+        scores = np.zeros(n_base + len(self.delta_ids), dtype=np.float32)
+        for term in set(tokenize(query)):
+            parts = []  # (行号, 词频, 文档长度)
+            if term in self.vocab:
+                offset, df = self.vocab[term]
+                docs = self.postings_doc[offset:offset + df]
+                tf = self.postings_tf[offset:offset + df]
+                if self.alive is not None:
+                    keep = self.alive[docs]
+                    docs, tf = docs[keep], tf[keep]
+                parts.append((docs, tf, self.doc_len[docs]))
+            if term in self.delta_postings:
+                rows, tf = self.delta_postings[term]
+                parts.append((rows + n_base, tf, self.delta_len[rows]))
+            df = sum(len(docs) for docs, _, _ in parts)
+            if not df:
+                continue
+            idf = math.log(1 + (self.n_docs - df + 0.5) / (df + 0.5))
+            for docs, tf, lengths in parts:
+                norm = self.k1 * (1 - self.b + self.b * lengths / (self.avg_doc_len or 1.0))
+                scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+
+        candidates = np.flatnonzero(scores)
+        if len(candidates) > k:
+            candidates = candidates[np.argpartition(-scores[candidates], k)[:k]]
+        candidates = candidates[np.argsort(-scores[candidates])]
+        return [(self.doc_ids[i] if i < n_base else self.delta_ids[i - n_base], float(scores[i]))
+                for i in candidates]
+
+
+def _segment_name(version: int) -> str:
+    return f"seg-{version:06d}"
+
+
+def _delta_name(version: int) -> str:
+    return f"delta-{version:06d}.json"
+
+
+def _read_state(index_dir: str) -> dict:
+    with open(os.path.join(index_dir, _CURRENT), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _next_version(index_dir: str) -> int:
+    return _read_state(index_dir)["version"] + 1 if BM25Index.exists(index_dir) else 1
+
+
+def _write_segment(segment_dir: str, doc_ids: List[str], doc_len: np.ndarray, postings):
+    """写入基础段：postings 为 (词, (行号列表, 词频列表)) 序列"""
+    os.makedirs(segment_dir, exist_ok=True)
+    vocab, docs_parts, tf_parts, offset = {}, [], [], 0
+    for term, (docs, tfs) in postings:
+        if len(docs) == 0:
+            continue
+        vocab[term] = [offset, len(docs)]
+        docs_parts.append(np.asarray(docs, dtype=np.int32))
+        tf_parts.append(np.asarray(tfs, dtype=np.float32))
+        offset += len(docs)
+    postings_doc = np.concatenate(docs_parts) if docs_parts else np.empty(0, dtype=np.int32)
+    postings_tf = np.concatenate(tf_parts) if tf_parts else np.empty(0, dtype=np.float32)
+
+    np.save(os.path.join(segment_dir, "postings_doc.npy"), postings_doc)
+    np.save(os.path.join(segment_dir, "postings_tf.npy"), postings_tf)
+    np.save(os.path.join(segment_dir, "doc_len.npy"), doc_len)
+    with open(os.path.join(segment_dir, "vocab.json"), "w", encoding="utf-8") as f:
+        json.dump(vocab, f, ensure_ascii=False)
+    with open(os.path.join(segment_dir, "doc_ids.json"), "w", encoding="utf-8") as f:
+        json.dump(doc_ids, f)
+    with open(os.path.join(segment_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump({"n_docs": len(doc_ids), "total_doc_len": float(doc_len.sum())}, f)
+
+
+def _switch(index_dir: str, state: dict):
+    """原子替换 CURRENT 指向新版本，再清理不再需要的旧版本文件"""
+    previous = _read_state(index_dir) if BM25Index.exists(index_dir) else {}
+    tmp_path = os.path.join(index_dir, _CURRENT + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(index_dir, _CURRENT))
+
+    keep = {state["segment"], state["delta"], previous.get("segment"), previous.get("delta")}
+    for name in os.listdir(index_dir):
+        if name.startswith(("seg-", "delta-")) and name not in keep:
+            path = os.path.join(index_dir, name)
+            try:
+                shutil.rmtree(path) if os.path.isdir(path) else os.remove(path)
+            except OSError:
+                pass  # 其他进程仍在使用（如 Windows 上的 mmap），下次再清理
+
+
+def build_bm25_index(db: Chroma, index_dir: str, batch_size: int = 5000):
+    """分批读取向量库中的全部片段，全量重建倒排索引（首次建索引或索引丢失时使用）"""
+    chunks, offset = [], 0
+    while True:
+        batch = db.get(include=["documents"], limit=batch_size, offset=offset)
+        if not batch["ids"]:
+            break
+        chunks.extend(zip(batch["ids"], batch["documents"]))
+        offset += len(batch["ids"])
+    BM25Index.build(index_dir, chunks)
+    print(f"✅ BM25 倒排索引已重建：{len(chunks)} 个片段（{index_dir}）")
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    BM25 + 向量 混合检索器：两路各召回 candidate_k 个，按 RRF 融合后取前 k 个
+    融合得分写入 metadata["score"]，供后续上下文打包排序使用
+    """
+    vector_store: Chroma
+    index: BM25Index
+    k: int = 3
+    candidate_k: int = 20
+    rrf_k: int = 60  # RRF 平滑常数，越大排名靠后的结果权重越高
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        vector_docs = self.vector_store.similarity_search(query, k=self.candidate_k)
+        keyword_hits = self.index.search(query, self.candidate_k)
+
+        fused: Dict[str, float] = defaultdict(float)
+        docs_by_id: Dict[str, Document] = {}
+        for rank, doc in enumerate(vector_docs):
+            chunk_id = doc.metadata.get("chunk_id") or doc.id
+            docs_by_id[chunk_id] = doc
+            fused[chunk_id] += 1.0 / (self.rrf_k + rank + 1)
+        for rank, (chunk_id, _) in enumerate(keyword_hits):
+            fused[chunk_id] += 1.0 / (self.rrf_k + rank + 1)
+
+        top_ids = sorted(fused, key=fused.get, reverse=True)[:self.k]
+
+        # 只被 BM25 命中的片段，从向量库按 ID 取回原文
+        missing = [i for i in top_ids if i not in docs_by_id]
+        if missing:
+            found = self.vector_store.get(ids=missing, include=["documents", "metadatas"])
+            for chunk_id, text, metadata in zip(found["ids"], found["documents"], found["metadatas"]):
+                docs_by_id[chunk_id] = Document(page_content=text, metadata=metadata or {}, id=chunk_id)
+
+        results = []
+        for chunk_id in top_ids:
+            if chunk_id in docs_by_id:
+                doc = docs_by_id[chunk_id]
+                doc.metadata["score"] = fused[chunk_id]
+                results.append(doc)
+        return results
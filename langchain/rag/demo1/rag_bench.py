@@ -0,0 +1,144 @@
+"""
+RAG 异步服务本地压测（不调用任何外部接口）
+
+用模拟大模型（固定首 token 延迟 + 逐 token 延迟）和确定性假嵌入替换真实模型，
+通过 RAGScheduler 发起大量并发会话，统计 p50/p95/p99 延迟、首 token 延迟与 QPS，
+用于评估调度/排队/背压参数，而不是评估模型本身。
+流水线与 rag_server.py 相同（包括 Config.CACHE_ENABLED 时的问答缓存），压测的就是服务实际运行的路径。
+    python rag_bench.py
+"""
+import asyncio
+import statistics
+import time
+from typing import List
+
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.vectorstores import InMemoryVectorStore
+
+from rag_demo import config, build_rag_chain, build_response_cache
+from rag_server import RAGScheduler, ServerBusyError
+
+
+# -------------------------- 1. 压测配置--------------------------
+class BenchConfig:
+    TOTAL_REQUESTS = 2000  # 总请求数
+    CLIENTS = 500  # 并发会话数（每个会话串行发送问题）
+    MAX_CONCURRENCY = config.SERVER_MAX_CONCURRENCY  # 调度器并发上限
+    MAX_QUEUE = config.SERVER_MAX_QUEUE  # 调度器排队上限
+    REQUEST_TIMEOUT = config.SERVER_REQUEST_TIMEOUT
+    FIRST_TOKEN_LATENCY = 0.5  # 模拟 LLM 首 token 延迟（秒）
+    TOKEN_LATENCY = 0.005  # 模拟 LLM 每个 token 的输出间隔（秒）
+    N_DOCS = 2000  # 内存向量库中的模拟片段数
+
+
+bench_config = BenchConfig()
+
+
+# -------------------------- 2. 模拟大模型--------------------------
+class SimulatedChatModel(BaseChatModel):
+    """模拟大模型：固定首 token 延迟 + 逐 token 输出延迟，不发起网络请求"""
+    first_token_latency: float = 0.5
+    token_latency: float = 0.005
+    reply: str = "易速鲜花支持全国主要城市当日达，鲜花签收后 24 小时内如有损坏可申请补发。"
+
+    @property
+    def _llm_type(self) -> str:
+        return "simulated-chat-model"
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        time.sleep(self.first_token_latency + self.token_latency * len(self.reply))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs) -> ChatResult:
+        await asyncio.sleep(self.first_token_latency + self.token_latency * len(self.reply))
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=self.reply))])
+
+    async def _astream(self, messages, stop=None, run_manager=None, **kwargs):
+        await asyncio.sleep(self.first_token_latency)
+        for token in self.reply:
+            await asyncio.sleep(self.token_latency)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+
+def build_fake_rag_chain():
+    """与正式服务相同的 build_rag_chain（含问答缓存），只把向量库和大模型替换为本地模拟实现，返回 (流水线, 缓存)"""
+    embedding = DeterministicFakeEmbedding(size=384)
+    store = InMemoryVectorStore(embedding)
+    store.add_texts([f"易速鲜花知识片段 {i}：第 {i % 50} 类鲜花的养护与配送说明。" for i in range(bench_config.N_DOCS)])
+    retriever = store.as_retriever(search_kwargs={"k": config.RETRIEVE_TOP_K})
+    llm = SimulatedChatModel(
+        first_token_latency=bench_config.FIRST_TOKEN_LATENCY,
+        token_latency=bench_config.TOKEN_LATENCY
+    )
+    cache = build_response_cache(embedding)
+    return build_rag_chain(retriever, cache, llm=llm), cache
+
+
+# -------------------------- 3. 压测与统计--------------------------
+def percentile_report(name: str, values: List[float]) -> str:
+    if len(values) < 2:
+        return f"{name}：样本不足"
+    q = statistics.quantiles(values, n=100, method="inclusive")
+    return f"{name}：p50={q[49] * 1000:.0f}ms  p95={q[94] * 1000:.0f}ms  p99={q[98] * 1000:.0f}ms"
+
+
+async def run_benchmark():
+    rag_chain, cache = build_fake_rag_chain()
+    scheduler = RAGScheduler(
+        rag_chain,
+        max_concurrency=bench_config.MAX_CONCURRENCY,
+        max_queue_size=bench_config.MAX_QUEUE,
+        request_timeout=bench_config.REQUEST_TIMEOUT
+    )
+    await scheduler.start()
+
+    latencies, first_token_latencies = [], []
+    counters = {"sent": 0, "rejected": 0, "timeout": 0, "failed": 0}
+
+    async def client(client_id: int):
+        while counters["sent"] < bench_config.TOTAL_REQUESTS:
+            counters["sent"] += 1
+            question = f"会话 {client_id}：第 {counters['sent'] % 50} 类鲜花怎么保鲜？"
+            start = time.perf_counter()
+            first_token_at = None
+            try:
+                async for _ in scheduler.stream(question):
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+            except ServerBusyError:
+                counters["rejected"] += 1
+                await asyncio.sleep(0.05)  # 被拒绝后稍等再重试，模拟客户端退避
+                continue
+            except asyncio.TimeoutError:
+                counters["timeout"] += 1
+                continue
+            except Exception:
+                counters["failed"] += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            if first_token_at is not None:
+                first_token_latencies.append(first_token_at - start)
+
+    print(f"🚀 压测开始：{bench_config.TOTAL_REQUESTS} 个请求，{bench_config.CLIENTS} 个并发会话，"
+          f"调度并发上限 {bench_config.MAX_CONCURRENCY}，队列上限 {bench_config.MAX_QUEUE}")
+    wall_start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(bench_config.CLIENTS)))
+    wall_time = time.perf_counter() - wall_start
+    await scheduler.stop()
+
+    print("=" * 60)
+    print(f"✅ 成功 {len(latencies)} 个，拒绝 {counters['rejected']} 次，"
+          f"超时 {counters['timeout']} 个，失败 {counters['failed']} 个")
+    print(f"⏱️  总耗时 {wall_time:.2f}s，QPS={len(latencies) / wall_time:.1f}")
+    print(percentile_report("端到端延迟", latencies))
+    print(percentile_report("首 token 延迟", first_token_latencies))
+    print(f"📊 调度器统计：{scheduler.stats}")
+    if cache is not None:
+        print(f"📊 缓存命中率：{cache.hit_rate():.0%}（{cache.stats}）")
+
+
+if __name__ == "__main__":
+    asyncio.run(run_benchmark())
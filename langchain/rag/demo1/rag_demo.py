@@ -1,18 +1,31 @@
+import asyncio
+import hashlib
+import json
 import os
-from typing import List
-os.environ["TOKENIZERS_PARALLELISM"] = "false"
+import sys
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from itertools import islice
+from typing import AsyncIterator, Callable, Dict, Iterator, List, Set, Tuple
 
 # -------------------------- 1. 依赖导入（确保已安装所有依赖）--------------------------
 from langchain_community.document_loaders import PyPDFLoader, TextLoader, DirectoryLoader, Docx2txtLoader, \
     UnstructuredPDFLoader, UnstructuredFileLoader
 from langchain_classic.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 from langchain_chroma import Chroma
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnablePassthrough
+from langchain_core.runnables import RunnablePassthrough, RunnableLambda, RunnableBranch, RunnableConfig
 from langchain_core.output_parsers import StrOutputParser
 from langchain_core.documents import Document
+from langchain_core.language_models import BaseChatModel
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))  # 引入 langchain/common 公共模块
+from common.embedding_cache import CachedEmbeddings
+from common.embedding_runner import BatchedSentenceTransformerEmbeddings
+from common.response_cache import ResponseCache
+from common.context_packer import ContextPacker
+from common.llm_factory import get_chat_model, warm_up
+from hybrid_retriever import BM25Index, HybridRetriever, build_bm25_index
 
 
 # -------------------------- 2. 全局配置（需手动修改的部分）--------------------------
@@ -21,6 +34,11 @@ class Config:
     DOCS_DIR = "./docs"  # 请确保该文件夹存在，放入你的文档（如 PDF/TXT）
     # 向量数据库配置
     VECTOR_DB_DIR = "./chroma_rag_db"  # 向量数据持久化路径（自动创建）
+    MANIFEST_PATH = os.path.join(VECTOR_DB_DIR, "index_manifest.json")  # 增量索引清单（文件/片段哈希）
+    INDEX_BATCH_SIZE = 500  # 每批写入向量库的片段数（同时也是分割后片段的内存缓冲上限）
+    EMBED_BATCH_SIZE = None  # 向量化 batch size；None 表示按设备可用内存自动选择
+    LOADER_WORKERS = os.cpu_count() or 1  # 并行解析文档的进程数
+    MAX_INFLIGHT_FILES = (os.cpu_count() or 1) * 2  # 同时在途（解析中/待处理）的文件数上限
     EMBEDDING_MODEL = "all-MiniLM-L6-v2"  # 轻量开源嵌入模型（无需 API Key）
     # 大模型配置
     OPENAI_API_KEY = os.getenv("GPTSAPI_API_KEY")  # 替换为你的 API Key（支持 gptsapi 兼容接口）
@@ -30,112 +48,297 @@ class Config:
     CHUNK_SIZE = 500  # 文档分割片段长度（字）
     CHUNK_OVERLAP = 50  # 片段重叠长度（避免语义断裂）
     RETRIEVE_TOP_K = 3  # 检索时召回的相关片段数量（3-5 为宜）
+    CONTEXT_TOKEN_BUDGET = 1500  # 拼入 Prompt 的参考文档 token 上限（按 LLM_MODEL 的分词器计数）
+    RETRIEVE_MODE = "hybrid"  # similarity：纯向量检索；hybrid：BM25 + 向量（RRF 融合）
+    HYBRID_CANDIDATE_K = 20  # 混合检索时每一路的候选数量
+    BM25_INDEX_DIR = os.path.join(VECTOR_DB_DIR, "bm25_index")  # 倒排索引目录（与向量库放在一起）
     TEMPERATURE = 0.1  # 大模型温度（0.1-0.3 确保答案准确）
+    # 问答缓存配置（精确匹配 + 语义相似匹配）
+    CACHE_ENABLED = True
+    CACHE_SIMILARITY_THRESHOLD = 0.95  # 语义缓存命中阈值（余弦相似度，越高越保守）
+    CACHE_TTL_SECONDS = 3600  # 缓存有效期（秒）
+    CACHE_MAX_ENTRIES = 1000  # 每级缓存最大条目数（LRU 淘汰）
+    # 异步服务配置（rag_server.py）
+    SERVER_HOST = "127.0.0.1"
+    SERVER_PORT = 8765
+    SERVER_MAX_CONCURRENCY = 64  # 同时执行的请求数（同时在途的 LLM 调用上限）
+    SERVER_MAX_QUEUE = 1024  # 排队请求上限，超过后直接拒绝（背压）
+    SERVER_REQUEST_TIMEOUT = 60  # 单个请求超时（秒，含排队时间）
 
 
 # 初始化配置实例
 config = Config()
 
+# 上下文打包器：按得分排序、去掉 CHUNK_OVERLAP 带来的重复文本、按 token 预算截断
+context_packer = ContextPacker(token_budget=config.CONTEXT_TOKEN_BUDGET, model_name=config.LLM_MODEL)
+
 
 # -------------------------- 3. 工具函数：文档加载与处理--------------------------
-def load_documents(docs_dir: str) -> List[Document]:
+# 支持的文档类型 → (加载器, 加载参数)
+LOADER_MAPPING = {
+    ".pdf": (PyPDFLoader, {}),
+    ".docx": (UnstructuredFileLoader, {}),
+    ".txt": (TextLoader, {"encoding": "utf-8"}),
+}
+
+
+def file_sha256(path: str) -> str:
+    """按块读取文件并计算内容哈希（大文件不会一次性读入内存）"""
+    sha = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+def scan_doc_files(docs_dir: str) -> Dict[str, str]:
     """
-    加载指定目录下的所有 PDF/TXT 文档
+    扫描文档目录下所有支持的文件，并计算内容哈希
     :param docs_dir: 文档存放目录
-    :return: 加载后的原始文档列表
+    :return: {相对路径: 文件内容哈希}
     """
     if not os.path.exists(docs_dir):
         os.makedirs(docs_dir)
         print(f"⚠️  文档目录 {docs_dir} 不存在，已自动创建，请放入 PDF/DOC/TXT 文档后重新运行")
         exit(1)
 
-    # 定义加载器：支持 PDF 和 TXT 文件
-    loaders = [
-        DirectoryLoader(
-            docs_dir,
-            glob="*.pdf",
-            loader_cls=PyPDFLoader,
-            show_progress=True,
-        ),
-        DirectoryLoader(
-            docs_dir,
-            glob="*.docx",
-            loader_cls=UnstructuredFileLoader,
-            show_progress=True,
-        ),
-        DirectoryLoader(
-            docs_dir,
-            glob="*.txt",
-            loader_cls=TextLoader,
-            show_progress=True,
-            loader_kwargs={"encoding": "utf-8"}
-        ),
-    ]
-
-    # 加载所有文档
-    documents = []
-    for loader in loaders:
-        try:
-            docs = loader.load()
-            documents.extend(docs)
-        except Exception as e:
-            print(f"⚠️  加载 {loader.glob} 文档时出错：{str(e)}")
+    files = {}
+    for root, _, names in os.walk(docs_dir):
+        for name in sorted(names):
+            if os.path.splitext(name)[1].lower() not in LOADER_MAPPING:
+                continue
+            path = os.path.join(root, name)
+            files[os.path.relpath(path, docs_dir)] = file_sha256(path)
 
-    if not documents:
-        print(f"⚠️  未在 {docs_dir} 目录下找到 PDF/TXT 文档，请放入文档后重新运行")
+    if not files:
+        print(f"⚠️  未在 {docs_dir} 目录下找到 PDF/DOCX/TXT 文档，请放入文档后重新运行")
         exit(1)
+    return files
+
 
-    print(f"✅ 成功加载 {len(documents)} 个文档")
-    return documents
+def load_file(docs_dir: str, rel_path: str) -> Tuple[str, List[Document], str]:
+    """
+    加载单个 PDF/DOCX/TXT 文件（在子进程中执行，必须是模块顶层函数才能被 pickle）
+    :return: (相对路径, 文档列表, 错误信息；成功时为空串)
+    """
+    loader_cls, loader_kwargs = LOADER_MAPPING[os.path.splitext(rel_path)[1].lower()]
+    try:
+        docs = loader_cls(os.path.join(docs_dir, rel_path), **loader_kwargs).load()
+    except Exception as e:
+        return rel_path, [], str(e)
+    for doc in docs:
+        doc.metadata["source"] = rel_path  # 统一用相对路径标识来源，与索引清单一致
+    return rel_path, docs, ""
 
 
-def split_documents(documents: List[Document]) -> List[Document]:
+def load_documents(docs_dir: str, rel_paths: List[str]) -> Iterator[Tuple[str, List[Document]]]:
     """
-    将长文档分割为短片段（适配模型上下文窗口）
+    多进程并行解析文档，按完成顺序逐个文件产出（生成器）
+    同时在途的文件数不超过 MAX_INFLIGHT_FILES，内存占用与语料规模无关
+    :param docs_dir: 文档存放目录
+    :param rel_paths: 需要加载的文件（相对 docs_dir 的路径）
+    :return: 逐个产出 (相对路径, 该文件的文档列表)；加载失败的文件会被跳过
     """
-    text_splitter = RecursiveCharacterTextSplitter(
+    if config.LOADER_WORKERS <= 1 or len(rel_paths) <= 1:
+        results = (load_file(docs_dir, rel_path) for rel_path in rel_paths)
+    else:
+        results = _parallel_load(docs_dir, rel_paths)
+
+    loaded = 0
+    for rel_path, docs, error in results:
+        if error:
+            print(f"⚠️  加载 {rel_path} 时出错：{error}")
+            continue
+        loaded += 1
+        yield rel_path, docs
+    print(f"✅ 成功加载 {loaded}/{len(rel_paths)} 个文件")
+
+
+def _parallel_load(docs_dir: str, rel_paths: List[str]) -> Iterator[Tuple[str, List[Document], str]]:
+    """进程池解析文件（PDF 解析是 CPU 密集型），完成一个补提交一个"""
+    path_iter = iter(rel_paths)
+    # spawn：避免 fork 继承父进程中已加载的模型/线程状态
+    mp_context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=config.LOADER_WORKERS, mp_context=mp_context) as pool:
+        in_flight = {pool.submit(load_file, docs_dir, p) for p in islice(path_iter, config.MAX_INFLIGHT_FILES)}
+        while in_flight:
+            done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                next_path = next(path_iter, None)
+                if next_path is not None:
+                    in_flight.add(pool.submit(load_file, docs_dir, next_path))
+                yield future.result()
+
+
+def build_text_splitter() -> RecursiveCharacterTextSplitter:
+    """文本分割器（中文优先分割符）"""
+    return RecursiveCharacterTextSplitter(
         chunk_size=config.CHUNK_SIZE,
         chunk_overlap=config.CHUNK_OVERLAP,
         length_function=len,  # 按字符数计算长度
         separators=["\n\n", "\n", "。", "！", "？", "；", "，", " ", ""]  # 中文优先分割符
     )
-    chunks = text_splitter.split_documents(documents)
-    print(f"✅ 文档分割完成，共得到 {len(chunks)} 个文本片段")
-    return chunks
+
+
+def chunk_id(chunk: Document) -> str:
+    """片段 ID = 来源文件 + 片段内容的哈希（内容不变则 ID 不变，可跳过重复向量化）"""
+    key = f"{chunk.metadata.get('source', '')}\n{chunk.page_content}"
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()
 
 
 # -------------------------- 4. 初始化向量数据库与检索器--------------------------
-def init_vector_db(chunks: List[Document]) -> Chroma:
+def load_manifest() -> dict:
+    """读取索引清单（记录每个文件的内容哈希及其片段 ID）"""
+    if not os.path.exists(config.MANIFEST_PATH):
+        return {}
+    with open(config.MANIFEST_PATH, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(manifest: dict):
+    """先写临时文件再替换，避免中途退出导致清单损坏"""
+    tmp_path = config.MANIFEST_PATH + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, config.MANIFEST_PATH)
+
+
+def init_vector_db() -> Chroma:
     """
-    初始化向量数据库，将文本片段向量化后存入
+    打开（或新建）向量数据库，文档内容由 sync_vector_db 增量同步
     """
-    # 初始化嵌入模型（开源、轻量、无需 API Key）
-    embedding = SentenceTransformerEmbeddings(model_name=config.EMBEDDING_MODEL)
+    # 初始化嵌入模型（开源、轻量、无需 API Key），外包一层持久化缓存：相同文本跨运行只向量化一次
+    # 底层使用批量向量化引擎：长度排序分批 + 按内存自动选 batch size + 分词与推理并行
+    embedding = CachedEmbeddings(BatchedSentenceTransformerEmbeddings(
+        config.EMBEDDING_MODEL, batch_size=config.EMBED_BATCH_SIZE
+    ))
+
+    db = Chroma(
+        persist_directory=config.VECTOR_DB_DIR,
+        embedding_function=embedding
+    )
+    print(f"✅ 成功打开向量数据库（{config.VECTOR_DB_DIR}）")
+    return db
 
-    # 检查向量数据库是否已存在
-    if os.path.exists(config.VECTOR_DB_DIR):
-        # 加载已有数据库
-        db = Chroma(
-            persist_directory=config.VECTOR_DB_DIR,
-            embedding_function=embedding
-        )
-        print(f"✅ 成功加载已存在的向量数据库（{config.VECTOR_DB_DIR}）")
-    else:
-        # 新建数据库并插入文本片段
-        db = Chroma.from_documents(
-            documents=chunks,
-            embedding=embedding,
-            persist_directory=config.VECTOR_DB_DIR
-        )
-        print(f"✅ 新建向量数据库完成，数据已保存至 {config.VECTOR_DB_DIR}")
 
-    return db
+def sync_vector_db(db: Chroma, docs_dir: str,
+                   on_update: Callable[..., None] = None) -> Set[str]:
+    """
+    按索引清单增量同步向量库：只加载、分割、向量化新增/修改的文件，删除已移除文件的向量
+    :param on_update: 片段变化回调 on_update(新增的 (chunk_id, 文本) 列表, 删除的 chunk_id 列表, reset=是否清空重建)，
+                      与向量库写入同批调用，用于同步更新 BM25 等其他索引
+    :return: 本次发生变化（新增/修改/删除）的文件集合
+    """
+    index_settings = {
+        "embedding_model": config.EMBEDDING_MODEL,
+        "chunk_size": config.CHUNK_SIZE,
+        "chunk_overlap": config.CHUNK_OVERLAP,
+    }
+    manifest = load_manifest()
+    if manifest.get("settings") != index_settings:
+        # 无清单（旧版本建的库）或嵌入模型/分割参数变化：旧向量不可复用，清空后全量重建
+        if manifest or db.get(limit=1)["ids"]:
+            print("⚠️  索引清单缺失或索引配置已变化，将清空向量库并全量重建")
+        db.reset_collection()
+        manifest = {"settings": index_settings, "files": {}}
+        if on_update is not None:
+            on_update([], [], reset=True)
+
+    indexed_files = manifest["files"]
+    current_files = scan_doc_files(docs_dir)
+    changed = [p for p, h in current_files.items() if indexed_files.get(p, {}).get("file_hash") != h]
+    removed = [p for p in indexed_files if p not in current_files]
+    print(f"🔍 文档变化：新增/修改 {len(changed)} 个，删除 {len(removed)} 个，"
+          f"未变化 {len(current_files) - len(changed)} 个")
+
+    # 1. 删除已移除文件的向量
+    to_delete_ids = []  # 已从向量库删除、尚未通知 on_update 的片段
+    for rel_path in removed:
+        ids = indexed_files.pop(rel_path)["chunk_ids"]
+        if ids:
+            db.delete(ids=ids)
+            to_delete_ids.extend(ids)
+
+    # 2. 新增/修改的文件：流式 加载 → 分割 → 向量化，只向量化内容有变化的片段
+    text_splitter = build_text_splitter()
+    to_add, to_add_ids = [], []
+    pending_files = {}  # 片段仍在缓冲区中、尚未写入向量库的文件 → 新的清单条目
+    added_count = stale_count = 0
+
+    def flush():
+        """写入缓冲区中的片段，并把对应文件登记到清单（中途退出时下次会重新处理未登记的文件）"""
+        if to_add:
+            db.add_documents(documents=to_add, ids=to_add_ids)
+        if on_update is not None and (to_add or to_delete_ids):
+            on_update([(cid, chunk.page_content) for cid, chunk in zip(to_add_ids, to_add)], list(to_delete_ids))
+        indexed_files.update(pending_files)
+        save_manifest(manifest)
+        to_add.clear()
+        to_add_ids.clear()
+        to_delete_ids.clear()
+        pending_files.clear()
+
+    for rel_path, docs in load_documents(docs_dir, changed):
+        old_ids = set(indexed_files.get(rel_path, {}).get("chunk_ids", []))
+        new_ids, seen = [], set()
+        for chunk in text_splitter.split_documents(docs):
+            cid = chunk_id(chunk)
+            if cid in seen:
+                continue  # 同一文件内的重复片段只保留一份
+            seen.add(cid)
+            new_ids.append(cid)
+            chunk.metadata["chunk_id"] = cid
+            if cid not in old_ids:
+                to_add.append(chunk)
+                to_add_ids.append(cid)
+
+        stale_ids = list(old_ids - seen)
+        if stale_ids:
+            db.delete(ids=stale_ids)
+            to_delete_ids.extend(stale_ids)
+        added_count += len(seen - old_ids)
+        stale_count += len(stale_ids)
+        pending_files[rel_path] = {"file_hash": current_files[rel_path], "chunk_ids": new_ids}
+
+        if len(to_add) >= config.INDEX_BATCH_SIZE:
+            flush()
+    flush()
+    if changed:
+        print(f"✅ 向量化 {added_count} 个新片段，删除 {stale_count} 个过期片段")
+
+    print(f"✅ 向量库已与 {docs_dir} 同步，索引清单：{config.MANIFEST_PATH}")
+    return set(changed) | set(removed)
+
+
+def update_bm25_index(added: List[Tuple[str, str]], deleted: List[str], reset: bool = False):
+    """
+    sync_vector_db 的回调：把变化的片段增量写入 BM25 倒排索引（仅 hybrid 模式），不重新读取整个向量库
+    索引尚不存在时跳过，由 build_retriever 从向量库全量构建
+    """
+    if config.RETRIEVE_MODE != "hybrid":
+        return
+    if reset:
+        BM25Index.build(config.BM25_INDEX_DIR, [])  # 向量库已清空重建，之后的片段全部以增量写入
+    elif not BM25Index.exists(config.BM25_INDEX_DIR):
+        return
+    BM25Index.update(config.BM25_INDEX_DIR, added, deleted)
 
 
-def build_retriever(db: Chroma) -> RunnablePassthrough:
+def build_retriever(db: Chroma, rebuild_index: bool = False) -> RunnablePassthrough:
     """
     构建检索器（从向量数据库中召回相关片段）
+    :param rebuild_index: 强制从向量库全量重建 BM25 倒排索引（仅 hybrid 模式；索引不存在时自动全量构建）
     """
+    if config.RETRIEVE_MODE == "hybrid":
+        if rebuild_index or not BM25Index.exists(config.BM25_INDEX_DIR):
+            build_bm25_index(db, config.BM25_INDEX_DIR)
+        return HybridRetriever(
+            vector_store=db,
+            index=BM25Index(config.BM25_INDEX_DIR),
+            k=config.RETRIEVE_TOP_K,
+            candidate_k=config.HYBRID_CANDIDATE_K
+        )
+
     retriever = db.as_retriever(
         search_kwargs={"k": config.RETRIEVE_TOP_K},
         search_type="similarity"  # 基础相似性检索（适合入门）
@@ -143,19 +346,52 @@ def build_retriever(db: Chroma) -> RunnablePassthrough:
     return retriever
 
 
+def refresh_knowledge_base(db: Chroma, retriever, cache: ResponseCache = None) -> Set[str]:
+    """
+    重新同步文档目录：增量更新向量库和 BM25 索引（只处理变化的片段）→ 失效相关缓存答案
+    """
+    changed = sync_vector_db(db, config.DOCS_DIR, on_update=update_bm25_index)
+    if changed and isinstance(retriever, HybridRetriever):
+        retriever.index = BM25Index(config.BM25_INDEX_DIR)  # 重新打开：基础段 mmap 不变，只加载新的增量段
+    if changed and cache is not None:
+        print(f"🧹 已失效 {cache.invalidate_sources(changed)} 条相关缓存答案")
+    return changed
+
+
 # -------------------------- 5. 构建 RAG 流水线（检索+生成）--------------------------
-def build_rag_chain(retriever: RunnablePassthrough) -> RunnablePassthrough:
+def format_docs(docs: List[Document]) -> str:
+    """将检索到的片段打包为上下文（去重 + token 预算）"""
+    return context_packer.pack(docs)
+
+
+def build_response_cache(embeddings) -> ResponseCache:
+    """按 Config 创建问答缓存；CACHE_ENABLED 关闭时返回 None（交互问答、异步服务、压测共用同一配置）"""
+    if not config.CACHE_ENABLED:
+        return None
+    return ResponseCache(
+        embeddings=embeddings,
+        similarity_threshold=config.CACHE_SIMILARITY_THRESHOLD,
+        ttl_seconds=config.CACHE_TTL_SECONDS,
+        max_entries=config.CACHE_MAX_ENTRIES
+    )
+
+
+def build_rag_chain(retriever: RunnablePassthrough, cache: ResponseCache = None,
+                    llm: BaseChatModel = None) -> RunnablePassthrough:
     """
-    构建完整 RAG 流水线：用户问题→检索相关文档→生成答案
+    构建完整 RAG 流水线：用户问题→检索相关文档→（查缓存）→生成答案
+    :param cache: 问答缓存；传入时先检索、再查缓存，未命中才调用大模型（未命中时仍按 token 流式输出）
+    :param llm: 大模型；不传时按 Config 通过 get_chat_model 创建（压测时可传入模拟模型）
     """
     # 初始化大模型
-    llm = ChatOpenAI(
-        api_key=config.OPENAI_API_KEY,
-        base_url=config.OPENAI_BASE_URL,
-        model=config.LLM_MODEL,
-        temperature=config.TEMPERATURE,
-        timeout=30
-    )
+    if llm is None:
+        llm = get_chat_model(
+            api_key=config.OPENAI_API_KEY,
+            base_url=config.OPENAI_BASE_URL,
+            model=config.LLM_MODEL,
+            temperature=config.TEMPERATURE,
+            timeout=30
+        )
 
     # 构建 Prompt（核心：引导模型基于检索文档生成答案）
     prompt = ChatPromptTemplate.from_messages([
@@ -169,27 +405,66 @@ def build_rag_chain(retriever: RunnablePassthrough) -> RunnablePassthrough:
         ("user", "参考文档：\n{context}\n\n用户问题：{question}")
     ])
 
-    # 构建流水线：检索→拼接上下文→Prompt→大模型→输出解析
-    rag_chain = (
-            {
-                "context": retriever | (lambda docs: "\n\n".join([d.page_content for d in docs])),
-                "question": RunnablePassthrough()  # 传递用户原始问题
-            }
-            | prompt
-            | llm
-            | StrOutputParser()  # 解析大模型输出为字符串
-    )
+    # 生成部分：Prompt→大模型→输出解析
+    answer_chain = prompt | llm | StrOutputParser()  # 解析大模型输出为字符串
+
+    if cache is None:
+        # 构建流水线：检索→拼接上下文→Prompt→大模型→输出解析
+        return (
+                {
+                    "context": retriever | format_docs,
+                    "question": RunnablePassthrough()  # 传递用户原始问题
+                }
+                | answer_chain
+        )
 
-    return rag_chain
+    # 带缓存的流水线：检索→拼接上下文→查两级缓存→命中直接返回；未命中走流式生成，生成完毕后写缓存
+    def lookup(inputs: dict):
+        return cache.lookup(inputs["question"], inputs["context"])
+
+    async def alookup(inputs: dict):
+        # 语义缓存需要本地向量化，放到线程池中执行，避免阻塞事件循环
+        return await asyncio.to_thread(lookup, inputs)
+
+    def sources(inputs: dict) -> List[str]:
+        return [d.metadata.get("source") for d in inputs["docs"]]
+
+    def generate(inputs: dict, config: RunnableConfig) -> Iterator[str]:
+        """逐段产出答案，完整生成后再写入缓存（中途取消的不完整答案不会被缓存）"""
+        chunks = []
+        for chunk in answer_chain.stream(inputs, config):
+            chunks.append(chunk)
+            yield chunk
+        cache.store(inputs["question"], inputs["context"], "".join(chunks), sources(inputs))
+
+    async def agenerate(inputs: dict, config: RunnableConfig) -> AsyncIterator[str]:
+        chunks = []
+        async for chunk in answer_chain.astream(inputs, config):
+            chunks.append(chunk)
+            yield chunk
+        await asyncio.to_thread(cache.store, inputs["question"], inputs["context"], "".join(chunks),
+                                sources(inputs))
+
+    return (
+            {"docs": retriever, "question": RunnablePassthrough()}
+            | RunnablePassthrough.assign(context=lambda x: format_docs(x["docs"]))
+            | RunnablePassthrough.assign(cached=RunnableLambda(lookup, afunc=alookup))
+            | RunnableBranch(
+                (lambda x: x["cached"] is not None, RunnableLambda(lambda x: x["cached"])),
+                RunnableLambda(generate, afunc=agenerate)
+            )
+    )
 
 
 # -------------------------- 6. 测试函数：交互式问答--------------------------
-def interactive_qa(rag_chain: RunnablePassthrough):
+def interactive_qa(rag_chain: RunnablePassthrough, refresh: Callable[[], Set[str]] = None,
+                   cache: ResponseCache = None):
     """
     交互式问答：持续接收用户问题，返回 RAG 生成的答案
+    输入「刷新」时重新同步文档目录，并让引用了变化文档的缓存答案失效
     """
     print("\n" + "=" * 60)
-    print("🎯 RAG 智能问答系统已启动（输入 '退出' 结束对话）")
+    print("🎯 RAG 智能问答系统已启动（输入 '退出' 结束对话，输入 '刷新' 重新索引文档）")
     print("💡 提示：可询问文档中的相关问题（如产品功能、政策条款等）")
     print("=" * 60 + "\n")
 
@@ -201,11 +476,16 @@ def interactive_qa(rag_chain: RunnablePassthrough):
         if not user_input.strip():
             print("助手：请输入具体问题~")
             continue
+        if user_input.strip() in ["刷新", "reload"] and refresh is not None:
+            refresh()
+            continue
 
         try:
             # 执行 RAG 流水线，生成答案
             answer = rag_chain.invoke(user_input)
             print(f"助手：{answer}\n")
+            if cache is not None:
+                print(f"📊 缓存命中率：{cache.hit_rate():.0%}（{cache.stats}）\n")
         except Exception as e:
             print(f"⚠️  生成答案时出错：{str(e)}\n")
 
@@ -213,23 +493,22 @@ def interactive_qa(rag_chain: RunnablePassthrough):
 # -------------------------- 7. 主函数：串联全流程--------------------------
 def main():
     try:
-        # 步骤1：加载文档
-        documents = load_documents(config.DOCS_DIR)
-
-        # 步骤2：分割文档为短片段
-        chunks = split_documents(documents)
+        # 步骤1：打开向量数据库
+        db = init_vector_db()
 
-        # 步骤3：初始化向量数据库
-        db = init_vector_db(chunks)
+        # 步骤2：增量同步文档（只加载、分割、向量化新增/修改的文件，BM25 索引同步增量更新）
+        sync_vector_db(db, config.DOCS_DIR, on_update=update_bm25_index)
 
-        # 步骤4：构建检索器
+        # 步骤3：构建检索器（BM25 索引不存在时从向量库全量构建）
         retriever = build_retriever(db)
 
-        # 步骤5：构建 RAG 流水线
-        rag_chain = build_rag_chain(retriever)
+        # 步骤4：构建 RAG 流水线（可选：带两级问答缓存）
+        cache = build_response_cache(db.embeddings)
+        rag_chain = build_rag_chain(retriever, cache)
 
-        # 步骤6：启动交互式问答
-        interactive_qa(rag_chain)
+        # 步骤5：预热 LLM 连接（文档同步可能耗时较长，放在提问前），启动交互式问答
+        warm_up(config.OPENAI_BASE_URL)
+        interactive_qa(rag_chain, lambda: refresh_knowledge_base(db, retriever, cache), cache)
 
     except Exception as e:
         print(f"❌ 系统运行出错：{str(e)}")
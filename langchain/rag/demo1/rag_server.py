@@ -0,0 +1,194 @@
+"""
+RAG 异步服务入口（asyncio 单进程高并发）
+
+复用 rag_demo.py 的 build_rag_chain 流水线，通过 ainvoke/astream 处理请求：
+- 请求先进入有界队列，由固定数量的 worker 协程执行（并发上限 = 同时在途的 LLM 调用数）；
+- 队列满时立即拒绝（背压），避免请求无限堆积拖垮进程；
+- 每个请求在独立的 asyncio.Task 中执行；客户端断开或超时后立即取消该 Task，
+  正在进行的检索/LLM 调用随之中断（HTTP 连接关闭，上游停止生成），worker 马上处理下一个请求。
+
+协议（TCP，每个连接一个会话）：客户端每行发送一个问题，服务端流式返回答案，答案结束后单独发送一行 <<END>>
+    python rag_server.py
+    nc 127.0.0.1 8765
+"""
+import asyncio
+from contextlib import aclosing
+from typing import AsyncIterator, Optional
+
+from rag_demo import config, init_vector_db, sync_vector_db, update_bm25_index, build_retriever, \
+    build_rag_chain, build_response_cache
+from common.llm_factory import awarm_up  # rag_demo 已把 langchain/ 加入 sys.path
+
+END_MARKER = "<<END>>"
+_END = object()  # worker → 调用方：答案结束
+
+
+class ServerBusyError(Exception):
+    """请求队列已满（背压），调用方应稍后重试"""
+
+
+class _Job:
+    __slots__ = ("question", "output", "cancelled", "task")
+
+    def __init__(self, question: str):
+        self.question = question
+        self.output: asyncio.Queue = asyncio.Queue()  # 答案片段 / 异常 / _END
+        self.cancelled = False
+        self.task: Optional[asyncio.Task] = None  # 正在执行的生成任务（排队中为 None）
+
+    def cancel(self):
+        """调用方放弃：排队中的请求不再执行，执行中的请求立即取消"""
+        self.cancelled = True
+        if self.task is not None:
+            self.task.cancel()
+
+
+class RAGScheduler:
+    """
+    有界并发调度器
+    :param rag_chain: build_rag_chain 构建的流水线（需支持 ainvoke/astream）
+    :param max_concurrency: 同时执行的请求数
+    :param max_queue_size: 排队请求上限，超过后抛出 ServerBusyError
+    :param request_timeout: 单个请求的超时时间（秒，含排队时间）
+    """
+
+    def __init__(self, rag_chain, max_concurrency: int = 64, max_queue_size: int = 1024,
+                 request_timeout: float = 60):
+        self.rag_chain = rag_chain
+        self.max_concurrency = max_concurrency
+        self.request_timeout = request_timeout
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue_size)
+        self.workers = []
+        self.stats = {"accepted": 0, "rejected": 0, "completed": 0, "failed": 0, "cancelled": 0}
+
+    async def start(self):
+        self.workers = [asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)]
+
+    async def stop(self):
+        for worker in self.workers:
+            worker.cancel()
+        await asyncio.gather(*self.workers, return_exceptions=True)
+
+    async def _worker(self):
+        while True:
+            job = await self.queue.get()
+            try:
+                if job.cancelled:  # 排队期间客户端已放弃
+                    self.stats["cancelled"] += 1
+                    continue
+                job.task = asyncio.create_task(self._generate(job))
+                await asyncio.wait({job.task})  # 生成任务被取消时 worker 本身不受影响
+                if job.task.cancelled():
+                    self.stats["cancelled"] += 1
+            except asyncio.CancelledError:  # 服务停止
+                if job.task is not None:
+                    job.task.cancel()
+                raise
+            finally:
+                job.output.put_nowait(_END)
+                self.queue.task_done()
+
+    async def _generate(self, job: _Job):
+        try:
+            async for chunk in self.rag_chain.astream(job.question):
+                job.output.put_nowait(chunk)
+            self.stats["completed"] += 1
+        except Exception as e:
+            self.stats["failed"] += 1
+            job.output.put_nowait(e)
+
+    async def stream(self, question: str) -> AsyncIterator[str]:
+        """提交问题并逐段产出答案；队列已满时抛出 ServerBusyError，超时抛出 asyncio.TimeoutError"""
+        job = _Job(question)
+        try:
+            self.queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.stats["rejected"] += 1
+            raise ServerBusyError(f"排队请求已达上限（{self.queue.maxsize}）")
+        self.stats["accepted"] += 1
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.request_timeout
+        try:
+            while True:
+                item = await asyncio.wait_for(job.output.get(), timeout=max(deadline - loop.time(), 0))
+                if item is _END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            job.cancel()  # 正常结束时无影响；超时/断开时取消正在进行的 LLM 调用
+
+    async def ask(self, question: str) -> str:
+        return "".join([chunk async for chunk in self.stream(question)])
+
+    def queue_depth(self) -> int:
+        return self.queue.qsize()
+
+
+async def handle_session(scheduler: RAGScheduler, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+    """一个 TCP 连接 = 一个会话，会话内的问题按顺序处理，不同会话之间并发"""
+    peer = writer.get_extra_info("peername")
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            question = line.decode("utf-8", errors="ignore").strip()
+            if not question:
+                continue
+            try:
+                # aclosing：写入时发现连接断开，异常抛出前先关闭 stream，立即取消生成任务
+                async with aclosing(scheduler.stream(question)) as chunks:
+                    async for chunk in chunks:
+                        writer.write(chunk.encode("utf-8"))
+                        await writer.drain()  # 客户端读得慢时在这里等待，不会无限缓冲
+            except ServerBusyError:
+                writer.write("⚠️  系统繁忙，请稍后重试".encode("utf-8"))
+            except asyncio.TimeoutError:
+                writer.write("⚠️  生成答案超时，请稍后重试".encode("utf-8"))
+            except Exception as e:
+                writer.write(f"⚠️  生成答案时出错：{str(e)}".encode("utf-8"))
+            writer.write(f"\n{END_MARKER}\n".encode("utf-8"))
+            await writer.drain()
+    except (ConnectionResetError, BrokenPipeError):
+        print(f"⚠️  客户端 {peer} 异常断开")
+    finally:
+        writer.close()
+
+
+async def serve():
+    # 与 rag_demo.main 相同的构建步骤
+    db = init_vector_db()
+    sync_vector_db(db, config.DOCS_DIR, on_update=update_bm25_index)
+    retriever = build_retriever(db)
+    rag_chain = build_rag_chain(retriever, build_response_cache(db.embeddings))
+
+    await awarm_up(config.OPENAI_BASE_URL)  # 预热本事件循环的异步连接池，第一个请求不再承担握手耗时
+
+    scheduler = RAGScheduler(
+        rag_chain,
+        max_concurrency=config.SERVER_MAX_CONCURRENCY,
+        max_queue_size=config.SERVER_MAX_QUEUE,
+        request_timeout=config.SERVER_REQUEST_TIMEOUT
+    )
+    await scheduler.start()
+    server = await asyncio.start_server(
+        lambda r, w: handle_session(scheduler, r, w), config.SERVER_HOST, config.SERVER_PORT
+    )
+    print(f"🚀 RAG 异步服务已启动：{config.SERVER_HOST}:{config.SERVER_PORT}"
+          f"（并发上限 {config.SERVER_MAX_CONCURRENCY}，队列上限 {config.SERVER_MAX_QUEUE}）")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        await scheduler.stop()
+        print(f"📊 服务统计：{scheduler.stats}")
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
@@ -1,12 +1,17 @@
 from langchain_community.agent_toolkits import SQLDatabaseToolkit
-from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.prompts import MessagesPlaceholder
 from langchain_core.tools import Tool
 from langchain_classic.agents import create_openai_tools_agent, AgentExecutor
 from langchain_community.utilities import SQLDatabase
-from langchain_openai import ChatOpenAI
 import os
+import sys
 from dotenv import load_dotenv
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))  # 引入 langchain/common 公共模块
+from common.llm_factory import get_chat_model
+from common.prompt_cache import get_prompt_cache_usage
+from common.compiled_prompt import CompiledChatPromptTemplate
+
 # --------------------------
 # 1. 加载环境变量（OpenAI API 密钥）
 # --------------------------
@@ -28,7 +33,7 @@ print("📊 数据库连接成功！已识别的表：", db.get_usable_table_nam
 # 初始化 LLM（兼容 ReAct 框架，需支持函数调用）
 api_key = os.getenv("GPTSAPI_API_KEY")
 base_url = os.getenv("GPTSAPI_BASE_URL")
-llm = ChatOpenAI(
+llm = get_chat_model(
     api_key=api_key,
     base_url=base_url,
     model="gpt-3.5-turbo",  # 推荐 gpt-3.5-turbo/gpt-4（支持工具调用）
@@ -44,7 +49,8 @@ print("🔧 加载的 SQL 工具：", [tool.name for tool in tools])
 # --------------------------
 # 4. 配置智能体提示词（优化 SQL 查询逻辑）
 # --------------------------
-prompt = ChatPromptTemplate.from_messages([
+# 消息顺序：静态 system → 用户问题 → 工具调用记录，每轮推理的请求都是上一轮的前缀延伸，服务端 prompt 缓存可以命中
+prompt = CompiledChatPromptTemplate.from_messages([
     ("system", """
     你是专业的 SQL 数据库查询助手，负责回答 FlowerShop 鲜花店的业务问题，规则如下：
     1. 先调用 `sql_db_list_tables` 确认可用表名，再调用 `sql_db_describe_table` 查看表结构（字段名、类型）；
@@ -53,8 +59,8 @@ prompt = ChatPromptTemplate.from_messages([
     4. 查询结果仅基于数据库数据，不编造信息；若结果为空，直接回复“未查询到相关数据”；
     5. 回答用自然语言整理，分点清晰，无需展示原始 SQL。
     """),
-    MessagesPlaceholder(variable_name="agent_scratchpad"),  # 存储工具调用记录
-    ("human", "{input}")
+    ("human", "{input}"),
+    MessagesPlaceholder(variable_name="agent_scratchpad")  # 存储工具调用记录
 ])
 
 # --------------------------
@@ -91,6 +97,7 @@ def run_sql_queries():
         # 执行智能体查询
         result = agent_executor.invoke({"input": query})
         print(f"✅ 回答：{result['output']}")
+    print(f"\n💾 prompt 缓存：{get_prompt_cache_usage().summary()}")
 
 if __name__ == "__main__":
     run_sql_queries()
\ No newline at end of file